@@ -0,0 +1,109 @@
+"""Compare lang_map.classify() with its former per-path implementation.
+
+Run from the top of the repository:
+
+    python -m benchmarks.bench_lang_map [--paths 10000 100000 1000000]
+"""
+
+import argparse
+import gc
+import os
+import random
+import time
+from fnmatch import fnmatch
+
+from models.lang_map import classify, ext_to_lang_map, file_to_lang_map
+
+NAMES = [
+    "main.py",
+    "util.c",
+    "util.h",
+    "index.js",
+    "README",
+    "Makefile",
+    "CMakeLists.txt",
+    "Dockerfile.dev",
+    "requirements-dev.txt",
+    "notes.unknown",
+    "LICENSE",
+    "lib.rs",
+]
+
+
+def generate_paths(count: int):
+    rng = random.Random(count)
+    directories = [f"src/module_{n}/sub_{n % 7}" for n in range(100)]
+    return [
+        os.path.join(rng.choice(directories), f"{n}_{rng.choice(NAMES)}")
+        for n in range(count)
+    ]
+
+
+def get_language_before(file_path, file=None):
+    """The former get_language(), with its loop over the glob patterns."""
+    file_name = os.path.basename(file_path)
+    lang = None
+    if "." in file_name:
+        ext = file_name.split(".")[-1]
+        if ext and ext in ext_to_lang_map:
+            lang = ext_to_lang_map.get(ext)
+    if not lang:
+        key = file_name.lower()
+        if dict.__contains__(file_to_lang_map, key):
+            lang = dict.get(file_to_lang_map, key)
+        else:
+            for pattern, value in file_to_lang_map.globs:
+                if fnmatch(key, pattern):
+                    lang = value
+                    break
+    print(f"lang: {lang}", file=file)
+    return lang
+
+
+def classify_before(paths):
+    groups = {}
+    with open(os.devnull, "w") as devnull:
+        for path in paths:
+            language = get_language_before(path, devnull)
+            if language:
+                groups.setdefault(language, []).append(path)
+    return groups
+
+
+def best_of(repeat: int, func, *args) -> float:
+    # Like timeit, keep the garbage collector out of the measurement
+    timings = []
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func(*args)
+            timings.append(time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--paths", type=int, nargs="+", default=[10000, 100000, 1000000]
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'paths':>8} {'before':>10} {'after':>10} {'speedup':>8} {'paths/s':>10}")
+    for count in args.paths:
+        paths = generate_paths(count)
+        # Both implementations must classify the paths alike
+        assert classify_before(paths) == classify(paths)
+        old = best_of(args.repeat, classify_before, paths)
+        new = best_of(args.repeat, classify, paths)
+        print(
+            f"{count:>8} {old:>9.3f}s {new:>9.3f}s {old / new:>7.2f}x"
+            f" {count / new:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Compare AST.get_plain_text() with its former children-list implementation.
+
+Run from the top of the repository:
+
+    python -m benchmarks.bench_plain_text [--lines 1000 10000 100000]
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+
+from models.ast import AST
+from models.interval_index import IntervalIndex
+
+SNIPPET = '''\
+def function_{n}(alpha, beta=None, *args, **kwargs):
+    """Docstring of function {n}."""
+    values = [alpha * i for i in range(10) if i % 2]
+    if beta is not None:
+        return {{"alpha": alpha, "beta": beta, "values": values}}
+    return sum(values) + len(args) - len(kwargs)
+
+'''
+
+
+def generate_source(lines: int) -> str:
+    count = max(1, lines // SNIPPET.count("\n"))
+    return "".join(SNIPPET.format(n=n) for n in range(count))
+
+
+def get_plain_text_by_children(ast: AST):
+    """The former get_plain_text(), with a dict of lists as node table.
+
+    Return the dump and the state kept for cursor lookups.
+    """
+    lines = []
+    line_range = {}
+    node_lines = {}
+    stack = [(ast.tree.root_node, 0, 0)]
+    while stack:
+        node, depth, index = stack.pop()
+        start_point = node.start_point
+        end_point = node.end_point
+        field_name = (
+            node.parent.field_name_for_child(index)
+            if node.parent and node.parent.child_count > index
+            else None
+        )
+        line_number = len(lines)
+        line_range[line_number] = [
+            start_point[0],
+            start_point[1],
+            end_point[0],
+            end_point[1],
+        ]
+        node_lines[node.id] = line_number
+        lines.append(
+            "{}{}{}{} [{}, {}] - [{}, {}]".format(
+                "  " * depth,
+                f"{field_name}: " if field_name else "",
+                "" if node.is_named else "[anonymous] ",
+                node.type,
+                start_point[0] + 1,
+                start_point[1],
+                end_point[0] + 1,
+                end_point[1],
+            ).replace("\n", "\\n")
+        )
+        for id, child in enumerate(reversed(node.children)):
+            original_id = len(node.children) - 1 - id
+            stack.append((child, depth + 1, original_id))
+    index = IntervalIndex(line_range.values())
+    return "\n".join(lines), (line_range, node_lines, index)
+
+
+def get_plain_text_by_cursor(ast: AST):
+    fresh = AST()
+    fresh.tree = ast.tree
+    return fresh.get_plain_text(), fresh
+
+
+def retained_size(func, *args) -> int:
+    """Return the memory still held by the result of func(*args)."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = func(*args)  # noqa: F841
+        return tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def best_of(repeat: int, func, *args) -> float:
+    # Like timeit, keep the garbage collector out of the measurement
+    timings = []
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func(*args)
+            timings.append(time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'':>18} {'time':^30} {'retained memory':^21}")
+    print(
+        f"{'lines':>8} {'nodes':>9} {'before':>10} {'after':>10} {'speedup':>8}"
+        f" {'before':>10} {'after':>10}"
+    )
+    for lines in args.lines:
+        ast = AST()
+        ast.load("python", generate_source(lines))
+        text = ast.get_plain_text()
+        # Both implementations must produce the same dump
+        assert get_plain_text_by_children(ast)[0] == text
+        old = best_of(args.repeat, get_plain_text_by_children, ast)
+        new = best_of(args.repeat, get_plain_text_by_cursor, ast)
+        old_size = retained_size(get_plain_text_by_children, ast)
+        new_size = retained_size(get_plain_text_by_cursor, ast)
+        print(
+            f"{lines:>8} {len(ast.nodes):>9} {old:>9.3f}s {new:>9.3f}s"
+            f" {old / new:>7.2f}x {old_size / 2**20:>8.1f}MB"
+            f" {new_size / 2**20:>8.1f}MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
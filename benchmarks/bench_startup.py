@@ -0,0 +1,134 @@
+"""Measure the time from launch to a ready main window.
+
+Each run starts a fresh interpreter, so that nothing is imported already,
+builds the window and its controller without showing them, and reports the
+modules loaded meanwhile. Run from the top of the repository:
+
+    python -m benchmarks.bench_startup [--runs 5] [--baseline FILE]
+        [--save-baseline] [--tolerance 0.25] [--max-seconds SECONDS]
+
+With --baseline, the median startup time is compared with the one saved in
+FILE, which is saved instead when it does not exist yet, or with
+--save-baseline. The exit status is 1 when the median got slower than the
+baseline by more than the tolerance, when it exceeds --max-seconds, or when
+a module meant to be loaded on first use was loaded at startup.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Optional
+
+from benchmarks.bench_suite import environment
+
+# Smaller differences with the baseline are noise, whatever the tolerance
+MIN_SECONDS = 0.02
+
+# Modules which must not be imported until used
+LAZY_MODULES = ["pygments", "tree_sitter_language_pack", "tree_sitter_languages"]
+
+STARTUP = """
+import json, sys, time
+start = time.perf_counter()
+from PySide6.QtWidgets import QApplication
+from controllers.main_controller import MainController
+from views.main_window import MainWindow
+app = QApplication([])
+window = MainWindow()
+controller = MainController(window)
+app.processEvents()
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "seconds": elapsed,
+    "loaded": [m for m in %r if m in sys.modules],
+}))
+"""
+
+
+def measure() -> dict:
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    result = subprocess.run(
+        [sys.executable, "-c", STARTUP % (LAZY_MODULES,)],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def regression(median: float, baseline: float, tolerance: float) -> Optional[str]:
+    """Return how much slower than the baseline the median is, if too slow."""
+    if median > baseline * (1 + tolerance) and median - baseline > MIN_SECONDS:
+        return (
+            f"{baseline:.3f}s -> {median:.3f}s (+{(median / baseline - 1) * 100:.0f}%)"
+        )
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--baseline", help="JSON file of the result to compare with")
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="save the result as the new baseline instead of comparing",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="allowed growth of the median over the baseline (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        help="fail if the median startup time is above, whatever the baseline",
+    )
+    args = parser.parse_args()
+
+    # The first run warms up the file system cache
+    measure()
+    runs = [measure() for _ in range(args.runs)]
+    timings = [run["seconds"] for run in runs]
+    loaded = sorted({module for run in runs for module in run["loaded"]})
+    median = statistics.median(timings)
+    print(
+        f"startup: median {median:.3f}s, min {min(timings):.3f}s,"
+        f" max {max(timings):.3f}s over {args.runs} runs"
+    )
+
+    status = 0
+    if loaded:
+        print(f"loaded at startup: {', '.join(loaded)}")
+        status = 1
+    if args.max_seconds is not None and median > args.max_seconds:
+        print(f"slower than {args.max_seconds:.3f}s")
+        status = 1
+    if not args.baseline:
+        return status
+    if args.save_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, "w") as file:
+            json.dump({"environment": environment(), "median": median}, file, indent=1)
+        print(f"saved the baseline to {args.baseline}")
+        return status
+
+    with open(args.baseline) as file:
+        saved = json.load(file)
+    if saved.get("environment") != environment():
+        print(f"the baseline comes from another environment: {saved['environment']}")
+    slower = regression(median, saved["median"], args.tolerance)
+    if slower:
+        print(f"regression: startup {slower}")
+        return 1
+    print(f"no regression over {args.baseline}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,356 @@
+"""Measure each stage from source to views, over sources of growing size.
+
+The sources are generated by benchmarks.corpora for several grammars. For
+each stage, the best time over the runs is reported, with the peak of the
+memory traced by tracemalloc and the growth of the peak resident size of the
+process, which also counts the memory of Qt (Linux only). Each stage is
+measured in a fresh interpreter, which only did the work the stage depends
+on. The Qt stages run on an offscreen window, and are skipped above
+--qt-max-lines as they are much slower. Run from the top of the repository:
+
+    python -m benchmarks.bench_suite [--lines 1000 10000 100000 1000000]
+        [--languages python javascript cpp json] [--baseline FILE]
+        [--save-baseline] [--tolerance 0.25]
+
+With --baseline, the results are compared with those saved in FILE, and the
+exit status is 1 when a stage got slower or bigger by more than the
+tolerance. The results are saved in FILE instead when it does not exist
+yet, or with --save-baseline. A stage which fails, for instance for lack of
+memory, also sets the exit status to 1: the largest sources take a few GB.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import signal
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.corpora import LANGUAGES, edit_source, generate_source
+from models.ast import AST
+
+STAGES = [
+    "load",
+    "plain_text",
+    "match_ast_line",
+    "ast_edit_load",
+    "ast_edit_patch",
+    "highlight_code",
+]
+QT_STAGES = ["ast_edit_load", "ast_edit_patch", "highlight_code"]
+
+# Cursor positions looked up by the match_ast_line stage
+LOOKUPS = 1000
+
+# Stop repeating a stage once a run took that long
+LONG_RUN_SECONDS = 2.0
+
+# Smaller differences are noise, whatever the tolerance
+MIN_SECONDS = 0.005
+MIN_BYTES = 1 << 20
+
+_STATUS = "/proc/self/status"
+_CLEAR_REFS = "/proc/self/clear_refs"
+
+# The application of the Qt stages, kept alive while they run
+_app = None
+
+
+def read_peak_rss() -> Optional[int]:
+    try:
+        with open(_STATUS) as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss() -> Optional[int]:
+    """Reset the peak resident size to the current one, and return it."""
+    try:
+        with open(_CLEAR_REFS, "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        return None
+    return read_peak_rss()
+
+
+def measure(repeat: int, func: Callable, setup: Optional[Callable] = None) -> dict:
+    """Run func(*setup()) and return its best time and its peaks of memory.
+
+    Like timeit, the garbage collector is kept out of the timings. The peak
+    resident size is taken over the first run, and the peak of Python memory
+    over one more run, as tracing the allocations slows them down.
+    """
+    timings = []
+    rss_peak = None
+    for run in range(repeat):
+        args = setup() if setup else ()
+        gc.collect()
+        rss_before = reset_peak_rss() if run == 0 else None
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            func(*args)
+            timings.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+        if rss_before is not None:
+            rss_peak = read_peak_rss() - rss_before
+        del args
+        if timings[-1] > LONG_RUN_SECONDS:
+            break
+
+    args = setup() if setup else ()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func(*args)
+        python_peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"seconds": min(timings), "python_peak": python_peak, "rss_peak": rss_peak}
+
+
+def stage_functions(stage: str, language: str, source: str):
+    """Do the work a stage depends on, and return its func and setup."""
+    if stage == "load":
+        return (lambda ast: ast.load(language, source)), (lambda: (AST(),))
+    if stage in ("plain_text", "match_ast_line"):
+        ast = AST()
+        ast.load(language, source)
+        if stage == "plain_text":
+            return ast.get_plain_text, None
+        ast.build_nodes()
+        rng = random.Random(len(source))
+        rows = source.count("\n") + 1
+        positions = [(rng.randrange(rows), rng.randrange(40)) for _ in range(LOOKUPS)]
+
+        def look_up():
+            for line, column in positions:
+                ast.get_match_ast_line(line, column)
+
+        return look_up, None
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide6.QtWidgets import QApplication
+
+    from controllers.main_controller import MainController
+    from views.main_window import MainWindow
+
+    global _app
+    _app = QApplication.instance() or QApplication([])
+    window = MainWindow()
+    controller = MainController(window)
+    controller.document.language = language
+    controller.document.content = source
+    window.doc_edit.blockSignals(True)
+    window.doc_edit.setPlainText(source)
+    window.doc_edit.blockSignals(False)
+    if stage == "ast_edit_load":
+
+        def fresh_parse():
+            # Parse and render afresh instead of finding the content unchanged
+            controller.ast_edit_load(language, "")
+            controller._parse_base = AST()
+            return ()
+
+        return (lambda: controller.ast_edit_load(language, source)), fresh_parse
+    if stage == "ast_edit_patch":
+        edited = edit_source(source)
+
+        def undo_edit():
+            controller.ast_edit_load(language, source)
+            return ()
+
+        # Only the lines of the nodes around the edit are rendered again
+        return (lambda: controller.ast_edit_load(language, edited)), undo_edit
+    controller.ast_edit_load(language, source)
+    highlighter = window.doc_edit.highlighter
+
+    def fresh_blocks():
+        # Blocks without formats, as after opening the file
+        window.doc_edit.blockSignals(True)
+        window.doc_edit.setPlainText(source)
+        window.doc_edit.blockSignals(False)
+        return ()
+
+    def highlight():
+        controller.highlight_code()
+        # Including the blocks highlighted in idle time
+        while highlighter.pending:
+            _app.processEvents()
+
+    return highlight, fresh_blocks
+
+
+def run_stage(language: str, lines: int, stage: str, repeat: int) -> dict:
+    """Measure a stage in a fresh interpreter, which only did its setup."""
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.bench_suite",
+            "--stage-worker",
+            language,
+            str(lines),
+            stage,
+            "--repeat",
+            str(repeat),
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def failure_reason(error: subprocess.CalledProcessError) -> str:
+    if error.returncode < 0:
+        # Killed, often by the kernel for lack of memory
+        return f"killed by {signal.Signals(-error.returncode).name}"
+    lines = error.stderr.strip().splitlines()
+    return lines[-1] if lines else f"exit status {error.returncode}"
+
+
+def format_size(size: Optional[int]) -> str:
+    return "-" if size is None else f"{size / 2**20:.1f}MB"
+
+
+def compare(
+    results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float
+) -> List[str]:
+    """Return the stages which got slower or bigger than in the baseline."""
+    regressions = []
+    for key, result in results.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        for field, floor, formatter in [
+            ("seconds", MIN_SECONDS, lambda value: f"{value:.4f}s"),
+            ("python_peak", MIN_BYTES, format_size),
+            ("rss_peak", MIN_BYTES, format_size),
+        ]:
+            old = before.get(field)
+            new = result.get(field)
+            if old is None or new is None:
+                continue
+            if new > old * (1 + tolerance) and new - old > floor:
+                regressions.append(
+                    f"{key} {field}: {formatter(old)} -> {formatter(new)}"
+                    f" (+{(new / old - 1) * 100 if old else float('inf'):.0f}%)"
+                )
+    return regressions
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--lines", type=int, nargs="+", default=[1000, 10000, 100000, 1000000]
+    )
+    parser.add_argument("--languages", nargs="+", choices=LANGUAGES, default=LANGUAGES)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--qt-max-lines",
+        type=int,
+        default=10000,
+        help="skip the Qt stages for larger sources (default: %(default)s)",
+    )
+    parser.add_argument("--baseline", help="JSON file of the results to compare with")
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="save the results as the new baseline instead of comparing",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="allowed growth of times and memory peaks (default: %(default)s)",
+    )
+    # Measure a single stage and print its result, in the interpreter
+    # started by run_stage()
+    parser.add_argument("--stage-worker", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stage_worker:
+        language, lines, stage = args.stage_worker
+        source = generate_source(language, int(lines))
+        func, setup = stage_functions(stage, language, source)
+        print(json.dumps(measure(args.repeat, func, setup)))
+        return 0
+
+    print(
+        f"{'language':<10} {'lines':>8} {'stage':<15} {'time':>10}"
+        f" {'python peak':>12} {'rss peak':>10}"
+    )
+    results: Dict[str, dict] = {}
+    failures: List[str] = []
+    for language in args.languages:
+        for lines in args.lines:
+            for stage in args.stages:
+                if stage in QT_STAGES and lines > args.qt_max_lines:
+                    continue
+                key = f"{language}/{lines}/{stage}"
+                try:
+                    result = run_stage(language, lines, stage, args.repeat)
+                except subprocess.CalledProcessError as error:
+                    failures.append(f"{key}: {failure_reason(error)}")
+                    print(f"{language:<10} {lines:>8} {stage:<15} failed", flush=True)
+                    continue
+                results[key] = result
+                print(
+                    f"{language:<10} {lines:>8} {stage:<15}"
+                    f" {result['seconds']:>9.4f}s"
+                    f" {format_size(result['python_peak']):>12}"
+                    f" {format_size(result['rss_peak']):>10}",
+                    flush=True,
+                )
+
+    for failure in failures:
+        print(f"failed: {failure}")
+    status = 1 if failures else 0
+    if not args.baseline:
+        return status
+    if args.save_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, "w") as file:
+            json.dump(
+                {"environment": environment(), "results": results}, file, indent=1
+            )
+        print(f"saved the baseline to {args.baseline}")
+        return status
+
+    with open(args.baseline) as file:
+        saved = json.load(file)
+    if saved.get("environment") != environment():
+        print(f"the baseline comes from another environment: {saved['environment']}")
+    regressions = compare(results, saved["results"], args.tolerance)
+    for regression in regressions:
+        print(f"regression: {regression}")
+    compared = len(results.keys() & saved["results"].keys())
+    print(
+        f"{len(regressions)} regressions over {compared} stages compared"
+        f" with {args.baseline}"
+    )
+    return 1 if regressions else status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""Synthetic sources of any size, for the benchmarks.
+
+The sources are generated offline and are the same from one run to the
+next: a snippet per language, repeated with its numbers varied until the
+requested count of lines is reached. Each snippet parses without errors.
+"""
+
+from typing import Dict, List
+
+SNIPPETS: Dict[str, str] = {
+    "python": '''\
+class Shape{n}(Base):
+    """Docstring of shape {n}."""
+
+    def area(self, alpha, beta=None, *args, **kwargs):
+        values = [alpha * i for i in range({m}) if i % 2]
+        if beta is not None:
+            return {{"alpha": alpha, "beta": beta, "values": values}}
+        return sum(values) + len(args) - len(kwargs)
+
+''',
+    "javascript": """\
+export class Shape{n} extends Base {{
+  // Comment of shape {n}
+  area(alpha, beta = null, ...rest) {{
+    const values = [...Array({m}).keys()].filter((i) => i % 2);
+    if (beta !== null) {{
+      return {{ alpha, beta, values, label: `shape ${{alpha}}` }};
+    }}
+    return values.reduce((a, b) => a + b, 0) + rest.length;
+  }}
+}}
+
+""",
+    "cpp": """\
+namespace shapes_{n} {{
+// Comment of shape {n}
+template <typename T>
+T area(const std::vector<T>& values, T alpha, int beta = {m}) {{
+  T total = 0;
+  for (std::size_t i = 0; i < values.size(); ++i) {{
+    if (i % 2) total += values[i] * alpha;
+  }}
+  return beta > 0 ? total / beta : total;
+}}
+}}  // namespace shapes_{n}
+
+""",
+    "json": """\
+  {{
+    "id": {n},
+    "name": "shape {n}",
+    "area": {m}.5,
+    "visible": true,
+    "tags": ["alpha", "beta", null],
+    "origin": {{"x": {m}, "y": -{m}}}
+  }},
+""",
+}
+
+# Text around the repeated snippets, for languages needing it
+FRAMES: Dict[str, List[str]] = {
+    "json": ["[\n", '  {"id": -1}\n]\n'],
+}
+
+LANGUAGES = list(SNIPPETS)
+
+
+def generate_source(language: str, lines: int) -> str:
+    """Return a source in language of about the given count of lines."""
+    snippet = SNIPPETS[language]
+    head, tail = FRAMES.get(language, ["", ""])
+    count = max(1, lines // snippet.count("\n"))
+    body = "".join(snippet.format(n=n, m=n % 97 + 3) for n in range(count))
+    return head + body + tail
+
+
+def edit_source(source: str) -> str:
+    """Return source with a digit added to a number halfway through it.
+
+    The edit changes a node in the middle of the source, and no line count.
+    """
+    middle = len(source) // 2
+    index = next(i for i in range(middle, len(source)) if source[i].isdigit())
+    return source[: index + 1] + "1" + source[index + 1 :]
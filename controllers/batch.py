@@ -0,0 +1,205 @@
+"""Parse whole directory trees with a pool of worker processes.
+
+Like controllers.cli, it must not import PySide6 or Pygments.
+"""
+
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from controllers.cli import has_syntax_error, load_ast, write_dump
+from models.document import read_file_bytes
+from models.dump_cache import DumpCache
+from models.lang_detect import detect_language, needs_detection
+from models.lang_map import classify
+
+# Files sent to a worker at once. Chunks only hold files of one language,
+# and each worker process keeps one parser per language in models.ast.
+CHUNK_SIZE = 32
+
+# File name suffix of the dump files in each format
+DUMP_SUFFIXES = {"text": ".txt", "json": ".json", "sexp": ".sexp"}
+
+
+@dataclass
+class FileResult:
+    path: str
+    language: str
+    size: int = 0
+    dump: Optional[str] = None
+    error: Optional[str] = None
+    has_syntax_error: bool = False
+
+
+def collect_files(roots: List[str]) -> Dict[Optional[str], List[Tuple[str, str]]]:
+    """Group the files under roots by language, as (root, path) pairs.
+
+    Hidden files and directories, and files of unknown language by name,
+    are left out. Files without extension or with an ambiguous one are
+    grouped under None instead: the workers detect their language from
+    their head, which may take a trial parse.
+    """
+    groups: Dict[Optional[str], List[Tuple[str, str]]] = {}
+    for root in roots:
+        if os.path.isfile(root):
+            paths = [root]
+            root = os.path.dirname(root)
+        else:
+            paths = []
+            for directory, dirs, files in os.walk(root):
+                dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+                for name in sorted(files):
+                    if not name.startswith("."):
+                        paths.append(os.path.join(directory, name))
+        undetected = []
+        named = []
+        for path in paths:
+            (undetected if needs_detection(path) else named).append(path)
+        found: Dict[Optional[str], List[str]] = dict(classify(named))
+        if undetected:
+            found[None] = undetected
+        for language, group in found.items():
+            groups.setdefault(language, []).extend((root, path) for path in group)
+    return groups
+
+
+def parse_files(
+    language: Optional[str],
+    paths: List[str],
+    output_format: Optional[str],
+    cache_dir: Optional[str] = None,
+) -> List[FileResult]:
+    """Parse files of one language, in a worker process.
+
+    With language None, the language of each file is detected first, and
+    the files of no language found are left out.
+    """
+    cache = DumpCache(cache_dir) if cache_dir else None
+    results = []
+    for path in paths:
+        result = FileResult(path, language or "")
+        try:
+            content = read_file_bytes(path)
+        except Exception as e:
+            content = b""
+            result.error = str(e)
+        if language is None:
+            result.language = detect_language(path, content) or ""
+            if not result.language:
+                continue
+        results.append(result)
+        if result.error:
+            continue
+        result.size = len(content)
+        try:
+            # A fresh AST for each file, else load() would diff unrelated
+            # files. The parser itself is cached per language.
+            ast = load_ast(result.language, content, output_format, cache)
+        except Exception as e:
+            result.error = str(e)
+            continue
+        result.has_syntax_error = has_syntax_error(ast)
+        if output_format:
+            out = io.StringIO()
+            write_dump(ast, path, output_format, out)
+            result.dump = out.getvalue()
+    return results
+
+
+def run_batch(
+    roots: List[str],
+    output_format: Optional[str] = "text",
+    output_dir: Optional[str] = None,
+    jobs: Optional[int] = None,
+    out=None,
+    log=None,
+    cache_dir: Optional[str] = None,
+) -> int:
+    """Parse all files under roots, streaming dumps as workers finish.
+
+    Dumps are written to out, or to files under output_dir mirroring the
+    tree. A summary goes to log. Returns 1 if any file failed, else 0.
+    Workers share the node table cache in cache_dir, if given.
+    """
+    out = out or sys.stdout
+    log = log or sys.stderr
+    groups = collect_files(roots)
+    dump_paths = {}
+    chunks = []
+    # The files of languages yet to detect come last
+    for language, files in sorted(
+        groups.items(), key=lambda group: (group[0] is None, group[0] or "")
+    ):
+        for i in range(0, len(files), CHUNK_SIZE):
+            chunk = files[i : i + CHUNK_SIZE]
+            for root, path in chunk:
+                dump_paths[path] = os.path.relpath(path, root)
+            chunks.append((language, [path for _, path in chunk]))
+
+    start = time.perf_counter()
+    results: List[FileResult] = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(parse_files, language, paths, output_format, cache_dir)
+            for language, paths in chunks
+        ]
+        for future in as_completed(futures):
+            for result in future.result():
+                results.append(result)
+                if result.dump is None:
+                    continue
+                if output_dir:
+                    target = os.path.join(
+                        output_dir,
+                        dump_paths[result.path] + DUMP_SUFFIXES[output_format],
+                    )
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    with open(target, "w", encoding="utf-8") as file:
+                        file.write(result.dump)
+                else:
+                    if output_format == "text":
+                        out.write(f"==> {result.path} <==\n")
+                    out.write(result.dump)
+                    out.flush()
+    elapsed = time.perf_counter() - start
+
+    write_summary(results, elapsed, jobs or os.cpu_count(), log)
+    return 1 if any(result.error for result in results) else 0
+
+
+def write_summary(results: List[FileResult], elapsed: float, jobs: int, log):
+    total_size = sum(result.size for result in results)
+    elapsed = max(elapsed, 1e-9)
+    print(
+        "parsed {} files ({:.1f} MB) in {:.2f}s with {} jobs: "
+        "{:.1f} files/s, {:.2f} MB/s".format(
+            len(results),
+            total_size / 1e6,
+            elapsed,
+            jobs,
+            len(results) / elapsed,
+            total_size / 1e6 / elapsed,
+        ),
+        file=log,
+    )
+
+    by_language: Dict[str, List[FileResult]] = {}
+    for result in results:
+        by_language.setdefault(result.language, []).append(result)
+    for language, language_results in sorted(by_language.items()):
+        print(
+            "  {}: {} files, {} with syntax errors, {} failed".format(
+                language,
+                len(language_results),
+                sum(result.has_syntax_error for result in language_results),
+                sum(result.error is not None for result in language_results),
+            ),
+            file=log,
+        )
+    for result in results:
+        if result.error:
+            print(f"{result.path}: {result.error}", file=log)
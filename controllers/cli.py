@@ -0,0 +1,193 @@
+"""Headless command line interface.
+
+It must not import PySide6 or Pygments, directly or not, so that it starts
+quickly and runs on servers without a display.
+"""
+
+import argparse
+import json
+import sys
+from typing import List, Optional
+
+from models.ast import AST
+from models.ast_render import format_text_line, record_to_dict
+from models.document import read_file_bytes
+from models.dump_cache import DumpCache
+from models.lang_detect import SNIFF_SIZE, detect_language
+
+FORMATS = ["text", "json", "sexp"]
+
+
+def read_input(path: str):
+    if path == "-":
+        return sys.stdin.buffer.read()
+    return read_file_bytes(path)
+
+
+def load_ast(
+    language: str,
+    content,
+    output_format: Optional[str],
+    cache: Optional[DumpCache] = None,
+) -> AST:
+    """Load content for write_dump(), from the cache when possible.
+
+    Only S-expressions need the tree, the other formats use the node table.
+    Without any output format, the content is only parsed.
+    """
+    ast = AST()
+    ast.cache = cache
+    ast.prepare(language, content)
+    if output_format == "sexp" or (output_format is None and cache is None):
+        ast.parse()
+    else:
+        ast.build_nodes()
+    return ast
+
+
+def has_syntax_error(ast: AST) -> bool:
+    if ast.tree is None:
+        return ast.nodes.has_error
+    return ast.tree.root_node.has_error
+
+
+def write_dump(ast: AST, path: str, output_format: str, out):
+    if output_format == "sexp":
+        out.write(str(ast.tree.root_node))
+        out.write("\n")
+    elif output_format == "json":
+        json.dump(
+            {
+                "path": path,
+                "language": ast.language_name,
+                "nodes": [record_to_dict(r) for r in ast.nodes.records()],
+            },
+            out,
+        )
+        out.write("\n")
+    else:
+        for record in ast.nodes.records():
+            out.write(format_text_line(record))
+            out.write("\n")
+
+
+def dump(args) -> int:
+    paths = args.paths or ["-"]
+    status = 0
+    cache = make_cache(args)
+    for index, path in enumerate(paths):
+        try:
+            content = read_input(path)
+            # Standard input has no name, but its content may tell
+            language = args.language or detect_language(
+                "" if path == "-" else path, content[:SNIFF_SIZE]
+            )
+            if not language:
+                raise Exception("unknown language, use --language")
+            ast = load_ast(language, content, args.format, cache)
+        except Exception as e:
+            print(f"{path}: {e}", file=sys.stderr)
+            status = 1
+            continue
+        if args.format == "text" and len(paths) > 1:
+            if index:
+                sys.stdout.write("\n")
+            sys.stdout.write(f"==> {path} <==\n")
+        write_dump(ast, path, args.format, sys.stdout)
+    return status
+
+
+def batch(args) -> int:
+    # Imported here to keep multiprocessing off the startup of other commands
+    from controllers.batch import run_batch
+
+    output_format = None if args.format == "none" else args.format
+    cache = make_cache(args)
+    return run_batch(
+        args.roots,
+        output_format,
+        args.output_dir,
+        args.jobs,
+        cache_dir=cache.directory if cache else None,
+    )
+
+
+def make_cache(args) -> Optional[DumpCache]:
+    if not args.cache and not args.cache_dir:
+        return None
+    return DumpCache(args.cache_dir)
+
+
+def add_cache_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="read and fill a cache of node tables on disk, for files parsed again",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="directory of the cache, implies --cache"
+        " (default: ~/.cache/tree-sitter-playground)",
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="tree-sitter-playground.py",
+        description="Run without arguments to start the playground window.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    dump_parser = commands.add_parser(
+        "dump", help="print the AST of files, or of stdin, without a GUI"
+    )
+    dump_parser.add_argument(
+        "paths", nargs="*", metavar="PATH", help="files to parse, - for stdin"
+    )
+    dump_parser.add_argument(
+        "-l",
+        "--language",
+        help="tree-sitter language, guessed from the file name by default",
+    )
+    dump_parser.add_argument(
+        "-f",
+        "--format",
+        choices=FORMATS,
+        default="text",
+        help="text as in the AST pane (default), JSON or S-expression",
+    )
+    add_cache_arguments(dump_parser)
+    dump_parser.set_defaults(func=dump)
+
+    batch_parser = commands.add_parser(
+        "batch", help="parse directory trees in parallel, grouped by language"
+    )
+    batch_parser.add_argument(
+        "roots", nargs="+", metavar="PATH", help="directories or files to parse"
+    )
+    batch_parser.add_argument(
+        "-f",
+        "--format",
+        choices=FORMATS + ["none"],
+        default="text",
+        help="format of the dumps, none to only parse",
+    )
+    batch_parser.add_argument(
+        "-o",
+        "--output-dir",
+        help="write one dump file per source file there instead of stdout",
+    )
+    batch_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="number of worker processes, one per CPU by default",
+    )
+    add_cache_arguments(batch_parser)
+    batch_parser.set_defaults(func=batch)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
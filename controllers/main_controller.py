@@ -1,20 +1,25 @@
-import re
+import time
 
-from pygments import highlight
-from pygments.formatters import HtmlFormatter
-from pygments.lexers import get_lexer_by_name
-from PySide6.QtCore import QObject, Qt, QTimer
-from PySide6.QtGui import QColor, QPalette, QTextCursor
-from PySide6.QtWidgets import QFileDialog, QMessageBox
+from PySide6.QtCore import QObject, Qt, QThreadPool, QTimer
+from PySide6.QtGui import QColor, QPalette, QTextCursor, QTextFormat
+from PySide6.QtWidgets import QFileDialog, QMessageBox, QTextEdit
 
-from models.ast import AST  # 添加导入语句
+from controllers.parse_worker import (
+    HighlightJob,
+    HighlightSignals,
+    ParseJob,
+    ParseSignals,
+)
+from models.ast import AST, MATCH_INDEX, MATCH_NATIVE  # 添加导入语句
+from models.ast_render import render_html, render_html_lines
 from models.document import Document
+from models.dump_cache import DumpCache
+from models.node_table import NodeTable
+from models.perf import RefreshCosts, format_status, monitor
 from views.main_window import MainWindow
+from views.query_view import capture_colors
 
 DEFAULT_LANGUAGE = "python"
-ast_pattern = re.compile(
-    r"^(?P<indent>\s*)(?P<anonymous>\[anonymous\] )?((?P<name>.+): )?(?P<type>.+) (?P<range>\[[0-9]+, [0-9]+\] - \[[0-9]+, [0-9]+\])(?P<suffix>.*)$"
-)
 
 
 class MainController(QObject):
@@ -23,27 +28,85 @@ class MainController(QObject):
         self.window = window
         self.document = Document()
         self.ast = AST()
-
-        # Create timer for debouncing
+        # Show the AST in the virtualized list view instead of the text view
+        self.virtual_ast = False
+        # The node table shown in the AST pane, which refreshes only patch
+        # the changed rows of. None when the pane shows no table.
+        self._shown_nodes = None
+        # Node tables of the files opened before
+        self.dump_cache = DumpCache()
+        # The document holds HTML rendered by Pygments instead of plain text
+        self._pygments_highlighted = False
+
+        # Create timer for debouncing. Its interval follows the cost of the
+        # last refreshes.
+        self._refresh_costs = RefreshCosts()
         self._timer = QTimer(self)
         # Set single shot
         self._timer.setSingleShot(True)
-        self._timer.setInterval(500)
+        self._timer.setInterval(self._debounce_interval())
         self._timer.timeout.connect(self.emit_text_changed)
 
+        # Parse, dump and render in a worker thread, one job at a time. Each
+        # edit bumps the generation, which cancels older jobs.
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(1)
+        self._parse_signals = ParseSignals()
+        self._parse_signals.finished.connect(self._on_parse_finished)
+        self._parse_signals.failed.connect(self._on_parse_failed)
+        self._highlight_signals = HighlightSignals()
+        self._highlight_signals.finished.connect(self._on_highlight_finished)
+        self._highlight_signals.failed.connect(self._on_highlight_failed)
+        self._generation = 0
+        self._running_generation = None
+        self._refresh_pending = False
+        # When the running job started, to measure the cost of the refresh
+        self._job_started = None
+        # The AST the next parse starts from, ahead of self.ast while a
+        # refresh is running
+        self._parse_base = self.ast
+
         # Add blink animation timer
         self._blink_timer = QTimer(self)
         self._blink_timer.setInterval(200)  # 200ms per blink state
         self._blink_timer.timeout.connect(self._blink_selection)
         self._blink_count = 0
         self._blinking_editor = None
+        # The range being blinked, and its extra selection
+        self._blink_cursor = None
+        self._blink_extra_selection = None
+
+        # Cursor moves are synced at most once per frame, for the latest
+        # position only
+        self._cursor_sync_timer = QTimer(self)
+        self._cursor_sync_timer.setSingleShot(True)
+        self._cursor_sync_timer.setInterval(16)
+        self._cursor_sync_timer.timeout.connect(self._sync_cursor)
+        self._cursor_sync = None
+
+        # Captures of the query console in the visible rows, updated after
+        # each parse, and their highlights in each editor
+        self._query_result = None
+        self._capture_selections = {}
+        self._query_timer = QTimer(self)
+        self._query_timer.setSingleShot(True)
+        self._query_timer.setInterval(100)
+        self._query_timer.timeout.connect(self.run_query)
+
+        # When the refresh being timed started, while the performance panel
+        # is open
+        self._refresh_started = None
 
         # Connect signals
         self.window.open_file_event.connect(self.open_file)
         self.window.language_changed_event.connect(self.set_language)
         self.window.text_changed_event.connect(self.on_text_changed)
-        self.window.doc_edit_cursor_event.connect(self.highlight_ast_region)
-        self.window.ast_edit_cursor_event.connect(self.on_ast_edit_cursor_changed)
+        self.window.doc_edit_cursor_event.connect(
+            lambda: self._schedule_cursor_sync(self.highlight_ast_region)
+        )
+        self.window.ast_edit_cursor_event.connect(
+            lambda: self._schedule_cursor_sync(self.on_ast_edit_cursor_changed)
+        )
         self.window.doc_edit.textChanged.connect(self.handle_text_changed)
         self.window.text_changed_with_delay.connect(
             lambda text: self.window.text_changed_event.emit(text)
@@ -54,11 +117,27 @@ class MainController(QObject):
         self.window.ast_edit.cursorPositionChanged.connect(
             self.window.ast_edit_cursor_event.emit
         )
+        self.window.ast_list.current_row_event.connect(
+            lambda row: self.window.ast_edit_cursor_event.emit()
+        )
         self.window.font_size_changed_event.connect(self.update_font_size)
         self.window.theme_changed_event.connect(self.handle_theme_changed)
+        self.window.native_lookup_event.connect(self.set_native_lookup)
+        self.window.virtual_ast_event.connect(self.set_virtual_ast)
+        self.window.query_changed_event.connect(lambda text: self._query_timer.start())
+        self.window.query_dock.visibilityChanged.connect(
+            lambda visible: self._query_timer.start()
+        )
+        self.window.doc_edit.verticalScrollBar().valueChanged.connect(
+            self._on_doc_scrolled
+        )
+        self.window.performance_event.connect(self.set_performance)
+        self.window.perf_view.reset_requested.connect(self.reset_performance)
+        self.window.perf_view.profile_requested.connect(self.profile_refreshes)
 
-        # Reset Language menu
-        self.window.language_changed_event.emit(DEFAULT_LANGUAGE)
+        # The document is empty: the grammar is only loaded on first use
+        self.document.language = DEFAULT_LANGUAGE
+        self.window.update_language_menu(DEFAULT_LANGUAGE)
 
         # Initialize theme
         self.handle_theme_changed(self.window.isDarkMode())
@@ -74,208 +153,463 @@ class MainController(QObject):
         )
         if not file_path:
             return
-        self.document.file_path = file_path
         try:
-            with open(file_path, "r", encoding="utf-8") as file:
-                self.document.content = file.read()
+            self.document.load_file(file_path)
         except Exception as e:
             QMessageBox.critical(self.window, "ERROR", f"Fail to open file: {e}")
             return
+        # Detecting the language may trial parse the file with the parsers
+        # a running refresh uses in the worker thread
+        self._cancel_refresh()
         try:
             self.window.doc_edit.blockSignals(True)
             self.document.set_language_from_extension()
             self.window.doc_edit.setPlainText(self.document.content)
             self.window.doc_edit.blockSignals(False)
-            self.set_language(self.document.language)
-            self.ast_edit_load(self.document.language, self.document.content)
+            self.window.update_language_menu(self.document.language)
+            # Parse the mapped bytes of the file rather than a copy
+            self.ast_edit_load(
+                self.document.language,
+                (
+                    self.document.data
+                    if self.document.data is not None
+                    else self.document.content
+                ),
+                use_cache=True,
+            )
+            self.highlight_code()
         except Exception as e:
             QMessageBox.critical(self.window, "ERROR", f"Error highlighting code: {e}")
 
     def set_language(self, language):
         self.document.language = language
         self.window.update_language_menu(language)
-        self.highlight_code()
         self.ast_edit_load(self.document.language, self.document.content)
+        self.highlight_code()
 
     def highlight_code(self):
-        if not self.document.language:
+        """Colour the document from the current tree.
+
+        Languages without a tree-sitter grammar fall back to Pygments,
+        which re-renders the whole document as HTML in the worker thread.
+        """
+        language = self.document.language
+        if not language:
             return
 
+        doc_edit = self.window.doc_edit
         try:
-            self.window.doc_edit.blockSignals(True)
-            language = self.document.language
-            if language == "c_sharp":
-                language = "csharp"
-            lexer = get_lexer_by_name(language, stripall=True)
-            palette = self.window.doc_edit.palette()
-            # 获取系统背景色
-            bg_color = palette.color(QPalette.Base).name()
-            # 获取系统文本色
-            text_color = palette.color(QPalette.Text).name()
-
-            # 创建自定义样式
-            style = {
-                "bgcolor": bg_color,
-                "color": text_color,
-            }
-            formatter = HtmlFormatter(
-                style="default",
-                full=True,
-                noclasses=True,
-                linenos=False,
-                nobackground=True,
-                style_defs=style,
+            doc_edit.blockSignals(True)
+            if self.ast.get_language(language):
+                if self._pygments_highlighted:
+                    # Drop the character formats of the Pygments HTML
+                    doc_edit.setPlainText(self.document.content)
+                    self._pygments_highlighted = False
+                with monitor.timed("highlight"):
+                    if self.ast.language_name == language:
+                        doc_edit.highlighter.set_tree(
+                            self.ast.tree,
+                            self.ast.changed_rows(),
+                            doc_edit.visible_rows(),
+                        )
+                    else:
+                        doc_edit.highlighter.set_tree(None)
+                return
+            doc_edit.highlighter.set_tree(None)
+            self._pool.start(
+                HighlightJob(
+                    self._highlight_signals,
+                    language,
+                    doc_edit.toPlainText(),
+                    *self._highlight_colors(),
+                )
             )
-            highlighted_code = highlight(self.document.content, lexer, formatter)
-            self.window.doc_edit.setHtml(highlighted_code)
         finally:
-            self.window.doc_edit.blockSignals(False)
+            doc_edit.blockSignals(False)
+
+    def _on_highlight_finished(self, result):
+        doc_edit = self.window.doc_edit
+        # Typing or another language made the HTML outdated
+        if (
+            result.language != self.document.language
+            or result.content != doc_edit.toPlainText()
+        ):
+            return
+        try:
+            doc_edit.blockSignals(True)
+            doc_edit.setHtml(result.html)
+            self._pygments_highlighted = True
+        finally:
+            doc_edit.blockSignals(False)
+
+    def _on_highlight_failed(self, message):
+        QMessageBox.critical(
+            self.window, "ERROR", f"Error highlighting code: {message}"
+        )
+
+    def _highlight_colors(self):
+        palette = self.window.doc_edit.palette()
+        # 获取系统背景色和文本色
+        return (
+            palette.color(QPalette.Base).name(),
+            palette.color(QPalette.Text).name(),
+        )
 
     def on_text_changed(self, text):
         self.document.content = text
-        self.highlight_code()
-        self.ast_edit_load(self.document.language, self.document.content)
+        self.document.data = None
+        self.refresh_async()
+
+    def refresh_async(self):
+        """Highlight, parse and render the document in the worker thread."""
+        if monitor.enabled and self._refresh_started is None:
+            self._refresh_started = time.perf_counter()
+        if self._running_generation is not None:
+            # Only the latest text matters: refresh once the running job ends
+            self._refresh_pending = True
+            return
+        self._refresh_pending = False
 
-    def ast_edit_load(self, language, content):
+        language = self.document.language
+        content = self.document.content
+        if not language:
+            return
         if not content:
-            self.window.ast_edit.clear()
+            self.ast_edit_load(language, content)
+            self.highlight_code()
             return
+
+        ast = self._parse_base.fork()
         try:
-            self.ast.load(language, content)
+            with monitor.profiled(), monitor.timed("prepare"):
+                ast.prepare(language, content)
         except Exception as e:
+            self.highlight_code()
             QMessageBox.critical(self.window, "ERROR", f"Error loading AST: {e}")
             return
+        self._parse_base = ast
+
+        self._generation += 1
+        self._running_generation = self._generation
+        self._job_started = time.perf_counter()
+        self._pool.start(
+            ParseJob(
+                self._parse_signals,
+                self._generation,
+                self._is_current_generation,
+                ast,
+                self.virtual_ast,
+                self._shown_nodes,
+            )
+        )
 
-        ast_text = self.ast.get_plain_text()
+    def _is_current_generation(self, generation):
+        # Called from the worker thread
+        return generation == self._generation
+
+    def _cancel_refresh(self):
+        self._generation += 1
+        self._refresh_pending = False
+        self._pool.waitForDone()
+        self._running_generation = None
+
+    def _on_parse_finished(self, result):
+        if result.generation == self._running_generation:
+            self._running_generation = None
+        if not result.cancelled and result.generation == self._generation:
+            self._apply_parse_result(result)
+        if self._refresh_pending:
+            self.refresh_async()
+
+    def _on_parse_failed(self, generation, message):
+        if generation == self._generation:
+            QMessageBox.critical(self.window, "ERROR", f"Error loading AST: {message}")
+
+    def _apply_parse_result(self, result):
+        with monitor.profiled():
+            self.ast = result.ast
+            self.highlight_code()
+            self._show_nodes(
+                self.ast.nodes,
+                result.base_nodes,
+                result.row_diffs,
+                result.lines_html,
+                result.ast_html,
+            )
+            self.run_query()
+        self._refresh_costs.add(time.perf_counter() - self._job_started)
+        self._end_refresh()
+
+    def ast_edit_load(self, language, content, use_cache=False):
+        started = time.perf_counter()
+        if monitor.enabled:
+            self._refresh_started = started
+        with monitor.profiled():
+            self._load_ast(language, content, use_cache)
+        if content:
+            self._refresh_costs.add(time.perf_counter() - started)
+        self._end_refresh()
+
+    def _load_ast(self, language, content, use_cache):
+        # A synchronous load supersedes any refresh running in the worker
+        self._cancel_refresh()
+        if not content:
+            self.window.ast_edit.clear()
+            self.window.ast_list.set_nodes(NodeTable())
+            self._shown_nodes = None
+            self.run_query()
+            return
+        ast = self._parse_base.fork()
+        try:
+            ast.load(language, content)
+        except Exception as e:
+            QMessageBox.critical(self.window, "ERROR", f"Error loading AST: {e}")
+            return
+        self.ast = self._parse_base = ast
 
-        # 将普通文本转换为HTML格式
-        html_lines = []
-        for line in ast_text.split("\n"):
-            match = ast_pattern.match(line)
-            if not match:
-                html_lines.append(f"<div style='normal'>{line}</div>")
-                continue
-            anonymous = match.group("anonymous")
-            indent = match.group("indent")
-            name = match.group("name")
-            type = match.group("type")
-            range = match.group("range")
-            suffix = match.group("suffix")
-            style = "anonymous" if anonymous else "normal"
-            html_line = "".join(
-                [
-                    f"<div style='{style}'>",
-                    f"<span style='indent'>{indent}</span>" if indent else "",
-                    f"<span style='name'>{name}</span>: " if name else "",
-                    f"<span style='type'>{type}</span>",
-                    " ",
-                    f"<span style='range'>{range}</span>",
-                    suffix,
-                    "</div>",
+        # Only files are worth caching, not each state of the editor
+        ast.cache = self.dump_cache if use_cache else None
+        try:
+            nodes = ast.build_nodes()
+        finally:
+            ast.cache = None
+
+        base = self._shown_nodes
+        row_diffs = None if base is None else nodes.diff(base)
+        lines_html = []
+        if row_diffs is not None and not self.virtual_ast:
+            with monitor.timed("render_html"):
+                lines_html = [
+                    render_html_lines(nodes.records(span.first, span.new_stop))
+                    for span in row_diffs
                 ]
-            )
-            html_lines.append(html_line)
-
-        html_head = """
-        <html>
-        <head>
-            <style>
-                /* 基础样式 */
-                body {
-                    font-family: Arial, sans-serif;
-                }
-                
-                /* div 样式 */
-                div {
-                    line-height: 1.5;
-                }
-
-                /* 普通节点样式 */
-                div[style='normal'] {
-                    display: block;
-                }
-
-                /* 匿名节点样式 */
-                div[style='anonymous'] {
-                    display: block;
-                    font-style: italic;
-                    opacity: 0.6;
-                }
-
-                /* 匿名节点中的类型字段样式 */
-                div[style='anonymous'] span[style='type'] {
-                    color: #808080;
-                }
-
-                /* 缩进空格样式 */
-                span[style='indent'] {
-                    font-family: 'Courier New', monospace;
-                    white-space: pre;
-                    display: inline-block;
-                }
-                
-                /* 名称字段样式 */
-                span[style='name'] {
-                    color: #569cd6;
-                    font-weight: bold;
-                }
-                
-                /* 范围字段样式 */
-                span[style='range'] {
-                    color: #808080;
-                }
-            </style>
-        </head>
-        <body>
+        self._show_nodes(nodes, base, row_diffs, lines_html)
+        self.run_query()
+
+    def _show_nodes(self, nodes, base, row_diffs, lines_html, html=None):
+        """Show a node table in the AST pane.
+
+        If the pane still shows base, only the spans of rows changed from it,
+        row_diffs, are replaced, by lines_html in the text view. Otherwise,
+        the whole dump is shown, from html if given.
         """
-        html_tail = """
-        </body>
-        </html>
+        if base is None or base is not self._shown_nodes:
+            row_diffs = None
+        if self.virtual_ast:
+            # Rows are formatted by the model when they become visible
+            with monitor.timed("set_nodes"):
+                if row_diffs is None:
+                    self.window.ast_list.set_nodes(nodes)
+                else:
+                    self.window.ast_list.patch_nodes(nodes, row_diffs)
+        else:
+            ast_edit = self.window.ast_edit
+            ast_edit.blockSignals(True)
+            patched = False
+            if row_diffs is not None:
+                with monitor.timed("set_html"):
+                    patched = ast_edit.patch_lines(row_diffs, lines_html)
+            if not patched:
+                if html is None:
+                    # Render the HTML straight from the node records
+                    with monitor.timed("render_html"):
+                        html = render_html(nodes.records())
+                with monitor.timed("set_html"):
+                    ast_edit.setHtml(html)
+            ast_edit.blockSignals(False)
+        self._shown_nodes = nodes
+
+    def _end_refresh(self):
+        """Record the time of the refresh just shown, and its profile."""
+        if self._refresh_started is not None:
+            monitor.record("refresh", time.perf_counter() - self._refresh_started)
+            self._refresh_started = None
+        report = monitor.end_refresh()
+        if report is not None:
+            self.window.perf_view.set_profile_report(
+                report or "No function was profiled."
+            )
+        self.update_performance()
+
+    def set_performance(self, enabled):
+        """Time the stages of the refreshes while the panel is open."""
+        monitor.enabled = enabled
+        self._refresh_started = None
+        self.window.statusBar().setVisible(enabled)
+        self.update_performance()
+
+    def update_performance(self):
+        if not monitor.enabled:
+            return
+        summaries = monitor.summaries()
+        self.window.perf_view.set_summaries(summaries)
+        self.window.perf_label.setText(format_status(summaries))
+
+    def reset_performance(self):
+        monitor.reset()
+        self.window.perf_view.set_summaries([])
+        self.window.perf_label.clear()
+
+    def profile_refreshes(self, count):
+        monitor.profile_next(count)
+        self.window.perf_view.set_profile_report(
+            f"Profiling the next {count} refreshes..."
+        )
+
+    def _on_doc_scrolled(self):
+        if self._query_result is not None:
+            self._query_timer.start()
+
+    def run_query(self):
+        """Run the query of the query console over the visible rows.
+
+        After an edit, the captures of the previous run are reused outside
+        the ranges which changed.
         """
-        html_body = "\n".join(html_lines)
-        html_content = f"{html_head}{html_body}{html_tail}"
+        self._query_timer.stop()
+        query_view = self.window.query_view
+        query_text = query_view.query_text()
+        if (
+            self.window.query_dock.isHidden()
+            or not query_text.strip()
+            or self.ast.language_name is None
+            or self.ast.language_name != self.document.language
+        ):
+            self._query_result = None
+            self._show_captures([])
+            query_view.set_status("")
+            return
 
-        self.window.ast_edit.blockSignals(True)
-        self.window.ast_edit.setHtml(html_content)
-        self.window.ast_edit.blockSignals(False)
+        first_row, last_row = self.window.doc_edit.visible_rows()
+        offset_index = self.ast.offset_index()
+        byte_range = (
+            offset_index.byte_of_point(first_row, 0),
+            offset_index.byte_of_point(last_row + 1, 0),
+        )
+        try:
+            with monitor.timed("query"):
+                result = self.ast.query_captures(
+                    query_text, byte_range, self._query_result
+                )
+        except Exception as e:
+            self._query_result = None
+            self._show_captures([])
+            query_view.set_status(f"Error: {e}", error=True)
+            return
+        self._query_result = result
+        self._show_captures(result.captures, capture_colors(query_text))
+
+        counts = {}
+        for capture in result.captures:
+            counts[capture.name] = counts.get(capture.name, 0) + 1
+        query_view.set_status(
+            f"{len(result.captures)} captures in lines {first_row + 1}-{last_row + 1}"
+            + "".join(f", @{name}: {count}" for name, count in counts.items())
+        )
+
+    def _show_captures(self, captures, colors=None):
+        """Highlight the captures in the document and their lines in the AST."""
+        doc_edit = self.window.doc_edit
+        ast_edit = self.window.ast_edit
+        doc_selections = []
+        ast_selections = []
+        row_colors = {}
+        offset_index = self.ast.offset_index() if captures else None
+        for capture in captures:
+            color = colors.get(capture.name) if colors else None
+            if color is None:
+                color = QColor(Qt.yellow)
+            selection = QTextEdit.ExtraSelection()
+            selection.cursor = QTextCursor(doc_edit.document())
+            selection.cursor.setPosition(
+                offset_index.position_of_byte(capture.start_byte)
+            )
+            selection.cursor.setPosition(
+                offset_index.position_of_byte(capture.end_byte),
+                QTextCursor.KeepAnchor,
+            )
+            selection.format.setBackground(color)
+            selection.format.setForeground(QColor(Qt.black))
+            doc_selections.append(selection)
+
+            line = self.ast.get_capture_line(capture)
+            if line is None:
+                continue
+            row_colors[line] = color
+            block = ast_edit.document().findBlockByNumber(line)
+            if not self.virtual_ast and block.isValid():
+                selection = QTextEdit.ExtraSelection()
+                selection.cursor = QTextCursor(block)
+                selection.format.setBackground(color)
+                selection.format.setProperty(QTextFormat.FullWidthSelection, True)
+                ast_selections.append(selection)
+
+        self._capture_selections = {doc_edit: doc_selections, ast_edit: ast_selections}
+        for editor in [doc_edit, ast_edit]:
+            self._set_extra_selections(editor)
+        self.window.ast_list.set_row_colors(row_colors)
+
+    def _set_extra_selections(self, editor):
+        selections = list(self._capture_selections.get(editor, []))
+        if editor is self._blinking_editor:
+            # Over the captures
+            selections.append(self._blink_extra_selection)
+        editor.setExtraSelections(selections)
+
+    def _schedule_cursor_sync(self, sync):
+        # The user moved a cursor: the animation would restore a selection
+        self._stop_blink_animation()
+        self._cursor_sync = sync
+        if not self._cursor_sync_timer.isActive():
+            self._cursor_sync_timer.start()
+
+    def _sync_cursor(self):
+        sync, self._cursor_sync = self._cursor_sync, None
+        if sync is not None:
+            sync()
 
     def highlight_ast_region(self):
-        self.window.ast_edit.blockSignals(True)
         cursor = self.window.doc_edit.textCursor()
-        if cursor.hasSelection():
-            cursor.setPosition(cursor.selectionEnd())
-            line_number = cursor.blockNumber()
-            column_number = cursor.columnNumber()
-        else:
-            line_number = cursor.blockNumber()
-            column_number = cursor.columnNumber()
+        position = cursor.selectionEnd() if cursor.hasSelection() else cursor.position()
+        # tree-sitter columns count bytes, editor columns count UTF-16 units
+        line_number, column_number = self.ast.offset_index().point_of_position(position)
         match_index = self.ast.get_match_ast_line(line_number, column_number)
 
+        if match_index is not None and self.virtual_ast:
+            self.window.ast_list.blockSignals(True)
+            self.window.ast_list.select_row(match_index)
+            self.window.ast_list.blockSignals(False)
+            return
+
+        self.window.ast_edit.blockSignals(True)
         # 新增代码：在 ast_edit 中选中对应的行
-        if match_index is not None:
+        # The node table has one row per line of the AST pane
+        if match_index is not None and 0 <= match_index < len(self.ast.nodes):
             ast_edit = self.window.ast_edit
-            ast_edit_lines = ast_edit.toPlainText().split("\n")
-            if 0 <= match_index < len(ast_edit_lines):
-                ast_edit_cursor = ast_edit.textCursor()
-                ast_edit_cursor.movePosition(QTextCursor.Start)
-                for _ in range(match_index):
-                    ast_edit_cursor.movePosition(QTextCursor.NextBlock)
-                ast_edit_cursor.movePosition(QTextCursor.StartOfLine)
-                ast_edit_cursor.movePosition(
-                    QTextCursor.EndOfLine, QTextCursor.KeepAnchor
-                )
-                ast_edit.setTextCursor(ast_edit_cursor)
-                ast_edit.ensureCursorVisible()
+            if ast_edit.select_line(match_index):
                 # Start blink animation
                 self._start_blink_animation(ast_edit)
         self.window.ast_edit.blockSignals(False)
 
+    def set_native_lookup(self, enabled):
+        self.ast.match_mode = MATCH_NATIVE if enabled else MATCH_INDEX
+        self._parse_base.match_mode = self.ast.match_mode
+
+    def set_virtual_ast(self, enabled):
+        self.virtual_ast = enabled
+        self.window.set_virtual_ast(enabled)
+        # The other pane shows an older table, if any
+        self._shown_nodes = None
+        self.ast_edit_load(self.document.language, self.document.content)
+
     def update_font_size(self, size):
         self.window.set_font_size(size)
 
     def on_ast_edit_cursor_changed(self):
-        cursor = self.window.ast_edit.textCursor()
-        line_number = cursor.blockNumber()
+        if self.virtual_ast:
+            line_number = self.window.ast_list.current_row()
+        else:
+            line_number = self.window.ast_edit.textCursor().blockNumber()
         start_line, start_column, end_line, end_column = self.ast.get_code_range(
             line_number
         )
@@ -286,33 +620,18 @@ class MainController(QObject):
         doc_edit = self.window.doc_edit
         doc_edit_cursor = doc_edit.textCursor()
 
-        # 获取文本块并转换为 bytes 以计算正确的长度
-        block = doc_edit.document().findBlockByLineNumber(start_line)
-        if not block.isValid():
-            QMessageBox.critical(
-                self.window, "ERROR", f"The start_line '{start_line}' is not valid"
-            )
-            return
-        block_bytes = bytes(block.text(), "utf-8", errors="replace")
-        start_position = block.position() + len(
-            block_bytes[:start_column].decode("utf-8", errors="replace")
+        # Convert the tree-sitter byte columns to editor positions. Positions
+        # past the end of the text are clamped, in case it changed since.
+        offset_index = self.ast.offset_index()
+        last_position = doc_edit.document().characterCount() - 1
+        start_position = min(
+            offset_index.position_of_point(start_line, start_column), last_position
+        )
+        end_position = min(
+            offset_index.position_of_point(end_line, end_column), last_position
         )
-
-        # 修改: 从 end_line 获取文本块以计算 end_position
-        end_block = doc_edit.document().findBlockByLineNumber(end_line)
-        if not end_block.isValid() and end_line > 0:
-            # The "end_line" is at the end of file with an empty line,
-            # calculate end_position by visiting previous line.
-            while not end_block.isValid() and end_line > 0:
-                end_line -= 1
-                end_block = doc_edit.document().findBlockByLineNumber(end_line)
-            end_position = end_block.position() + len(end_block.text())
-        else:
-            end_block_bytes = bytes(end_block.text(), "utf-8", errors="replace")
-            end_position = end_block.position() + len(
-                end_block_bytes[:end_column].decode("utf-8", errors="replace")
-            )
         if end_position < start_position:
+            self.window.doc_edit.blockSignals(False)
             QMessageBox.critical(
                 self.window,
                 "ERROR",
@@ -328,9 +647,16 @@ class MainController(QObject):
         self.window.doc_edit.blockSignals(False)
 
     def handle_text_changed(self):
+        # Results of a refresh still running are outdated now, and the
+        # worker stops parsing or rendering them
+        self._generation += 1
         # 重置定时器
         self._timer.stop()
-        self._timer.start()
+        self._timer.start(self._debounce_interval())
+
+    def _debounce_interval(self):
+        """Return the delay before refreshing after an edit, in ms."""
+        return round(self._refresh_costs.debounce() * 1000)
 
     def emit_text_changed(self):
         # 发送带延迟的文本变化信号
@@ -351,43 +677,66 @@ class MainController(QObject):
 
         self.window.doc_edit.setPalette(palette)
         self.window.ast_edit.setPalette(palette)
+        self.window.ast_list.setPalette(palette)
 
     def _set_selection_colors(self, bg_color, text_color):
         if self._blinking_editor:
-            # Set colors using stylesheet to override system behavior
-            style = f"""
-                QTextEdit {{
-                    selection-background-color: {bg_color.name()};
-                    selection-color: {text_color.name()};
-                }}
-            """
-            self._blinking_editor.setStyleSheet(style)
+            # An extra selection only repaints the range, where a stylesheet
+            # would re-polish the whole widget
+            selection = QTextEdit.ExtraSelection()
+            selection.cursor = self._blink_cursor
+            selection.format.setBackground(bg_color)
+            selection.format.setForeground(text_color)
+            self._blink_extra_selection = selection
+            self._set_extra_selections(self._blinking_editor)
+
+    def _set_normal_selection_colors(self):
+        palette = self._blinking_editor.palette()
+        self._set_selection_colors(
+            palette.color(QPalette.Highlight), palette.color(QPalette.HighlightedText)
+        )
 
     def _start_blink_animation(self, editor):
-        self._blink_timer.stop()  # Stop any ongoing animation
+        self._stop_blink_animation()  # Stop any ongoing animation
         self._blink_count = 0
         self._blinking_editor = editor
-        # Clear any existing stylesheet before starting animation
-        editor.setStyleSheet("")
+        # The selection is painted over extra selections, so it is replaced
+        # by an extra selection during the animation, and restored after.
+        self._blink_cursor = editor.textCursor()
+        cursor = QTextCursor(self._blink_cursor)
+        cursor.setPosition(self._blink_cursor.selectionStart())
+        editor.blockSignals(True)
+        editor.setTextCursor(cursor)
+        editor.blockSignals(False)
+        self._set_normal_selection_colors()
         self._blink_timer.start()
 
+    def _stop_blink_animation(self):
+        editor = self._blinking_editor
+        self._blink_timer.stop()
+        self._blink_count = 0
+        self._blinking_editor = None
+        if editor is None:
+            return
+        self._set_extra_selections(editor)
+        # Select the range again, unless the cursor was moved meanwhile
+        if editor.textCursor().position() == self._blink_cursor.selectionStart():
+            editor.blockSignals(True)
+            editor.setTextCursor(self._blink_cursor)
+            editor.blockSignals(False)
+
     def _blink_selection(self):
         if (
             not self._blinking_editor or self._blink_count >= 4
         ):  # 2 blinks (on/off) = 4 states
-            if self._blinking_editor:
-                # Clear stylesheet to restore system colors
-                self._blinking_editor.setStyleSheet("")
-            self._blink_timer.stop()
-            self._blink_count = 0
-            self._blinking_editor = None
+            self._stop_blink_animation()
             return
 
         if self._blink_count % 2 == 0:
             # Highlight state - yellow background with black text
             self._set_selection_colors(QColor(Qt.yellow), QColor(Qt.black))
         else:
-            # Normal state - clear stylesheet to use system colors
-            self._blinking_editor.setStyleSheet("")
+            # Normal state - the colors of the selection
+            self._set_normal_selection_colors()
 
         self._blink_count += 1
@@ -0,0 +1,159 @@
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+from PySide6.QtCore import QObject, QRunnable, Signal
+
+from models.ast import AST
+from models.ast_render import render_html, render_html_lines
+from models.node_table import NodeTable, RowDiff
+from models.perf import monitor
+from views.doc_view import highlight_html
+
+# Rows of the AST rendered between checks for a newer edit
+CANCEL_CHECK_ROWS = 4096
+
+
+@dataclass
+class ParseResult:
+    generation: int
+    ast: AST
+    # HTML of the AST pane, None in virtualized mode, if cancelled or if
+    # only the changed lines are rendered
+    ast_html: Optional[str] = None
+    cancelled: bool = False
+    # The table shown in the AST pane when the job started, the spans of
+    # rows changed since, None if all, and unless virtualized, the HTML of
+    # the new lines of each span
+    base_nodes: Optional[NodeTable] = None
+    row_diffs: Optional[List[RowDiff]] = None
+    lines_html: List[str] = field(default_factory=list)
+
+
+@dataclass
+class HighlightResult:
+    language: str
+    # The text highlighted, and its HTML
+    content: str
+    html: str
+
+
+class ParseSignals(QObject):
+    # Emitted from the worker thread, delivered in the GUI thread
+    finished: Signal = Signal(object)
+    failed: Signal = Signal(int, str)
+
+
+class ParseJob(QRunnable):
+    """Parse and render a snapshot of the document off the GUI thread.
+
+    The AST must have been prepared with AST.prepare() in the GUI thread;
+    the job only calls AST.parse() and reads the result. It gives up as soon
+    as is_current(generation) turns false, because a newer edit made its
+    result useless: the parse and the rendering check it as they go.
+
+    Given the table shown in the AST pane, only the lines which changed
+    from it are rendered.
+    """
+
+    def __init__(
+        self,
+        signals: ParseSignals,
+        generation: int,
+        is_current: Callable[[int], bool],
+        ast: AST,
+        virtual_ast: bool = False,
+        shown_nodes: Optional[NodeTable] = None,
+    ):
+        super().__init__()
+        self.signals = signals
+        self.generation = generation
+        self.is_current = is_current
+        self.ast = ast
+        self.virtual_ast = virtual_ast
+        self.shown_nodes = shown_nodes
+
+    def run(self):
+        with monitor.profiled():
+            self._run()
+
+    def _run(self):
+        result = ParseResult(self.generation, self.ast)
+        try:
+            if self.is_current(self.generation):
+                self.ast.parse(self._is_cancelled)
+            if not self.is_current(self.generation):
+                result.cancelled = True
+            else:
+                # Cursor sync needs it as soon as the result is shown
+                self.ast.offset_index()
+                nodes = self.ast.build_nodes()
+                if self.shown_nodes is not None:
+                    result.base_nodes = self.shown_nodes
+                    result.row_diffs = nodes.diff(self.shown_nodes)
+                if not self.virtual_ast:
+                    with monitor.timed("render_html"):
+                        if result.row_diffs is None:
+                            result.ast_html = render_html(self._records(nodes))
+                        else:
+                            result.lines_html = [
+                                render_html_lines(
+                                    self._records(nodes, span.first, span.new_stop)
+                                )
+                                for span in result.row_diffs
+                            ]
+                if not self.is_current(self.generation):
+                    result.cancelled = True
+                    result.ast_html = None
+                    result.lines_html = []
+        except Exception as e:
+            self.signals.failed.emit(self.generation, str(e))
+            result.cancelled = True
+        self.signals.finished.emit(result)
+
+    def _is_cancelled(self) -> bool:
+        return not self.is_current(self.generation)
+
+    def _records(self, nodes: NodeTable, start: int = 0, stop: Optional[int] = None):
+        """Iterate over the records of nodes, stopping once outdated."""
+        for index, record in enumerate(nodes.records(start, stop)):
+            if not index % CANCEL_CHECK_ROWS and self._is_cancelled():
+                return
+            yield record
+
+
+class HighlightSignals(QObject):
+    # Emitted from the worker thread, delivered in the GUI thread
+    finished: Signal = Signal(object)
+    failed: Signal = Signal(str)
+
+
+class HighlightJob(QRunnable):
+    """Highlight a snapshot of the document with Pygments off the GUI thread.
+
+    Only for languages without a tree-sitter grammar, whose whole document
+    is rendered as HTML again after each edit. Pygments cannot be stopped
+    midway, so the GUI thread drops the HTML of text which changed since.
+    """
+
+    def __init__(
+        self,
+        signals: HighlightSignals,
+        language: str,
+        content: str,
+        bg_color: str,
+        text_color: str,
+    ):
+        super().__init__()
+        self.signals = signals
+        self.language = language
+        self.content = content
+        self.colors = (bg_color, text_color)
+
+    def run(self):
+        try:
+            with monitor.profiled(), monitor.timed("pygments"):
+                html = highlight_html(self.language, self.content, *self.colors)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+            return
+        self.signals.finished.emit(HighlightResult(self.language, self.content, html))
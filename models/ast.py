@@ -1,151 +1,587 @@
+import copy
 import importlib
-from typing import List, Optional
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
-from tree_sitter import Language, Parser, Tree
+from tree_sitter import Language, Parser, Query, Tree
+
+try:
+    from tree_sitter import QueryCursor
+except ImportError:  # tree-sitter < 0.25 runs queries on Query itself
+    QueryCursor = None
+
+from .ast_render import AstRecord, render_text
+from .dump_cache import DumpCache
+from .interval_index import IntervalIndex
+from .node_table import NodeTable
+from .offset_index import OffsetIndex
+from .perf import monitor
+from .query import (
+    FULL_POINT_RANGE,
+    FULL_RANGE,
+    QueryCapture,
+    QueryResult,
+    capture_key,
+    pending_ranges,
+)
+
+
+def _common_prefix_length(old: bytes, new: bytes) -> int:
+    # Binary search over shrinking windows, so each byte is copied and
+    # compared (by memcmp) about twice instead of once per probe.
+    lo, hi = 0, min(len(old), len(new))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if old.startswith(new[lo:mid], lo):
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix_length(old: bytes, new: bytes, limit: int) -> int:
+    old_len, new_len = len(old), len(new)
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if old.endswith(new[new_len - mid : new_len - lo], 0, old_len - lo):
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _point_at(data: bytes, offset: int) -> Tuple[int, int]:
+    """Return the tree-sitter (row, byte column) point of a byte offset."""
+    row = data.count(b"\n", 0, offset)
+    column = offset - (data.rfind(b"\n", 0, offset) + 1)
+    return (row, column)
+
+
+def compute_edit(old, new) -> Optional[dict]:
+    """Compute the single edit turning old into new, as Tree.edit() arguments.
+
+    Returns None if the two buffers are identical.
+    """
+    # Other buffers, such as memory-mapped files, lack the bytes methods
+    if not isinstance(old, bytes):
+        old = bytes(old)
+    if not isinstance(new, bytes):
+        new = bytes(new)
+    if old == new:
+        return None
+    start_byte = _common_prefix_length(old, new)
+    suffix = _common_suffix_length(old, new, min(len(old), len(new)) - start_byte)
+    old_end_byte = len(old) - suffix
+    new_end_byte = len(new) - suffix
+    return {
+        "start_byte": start_byte,
+        "old_end_byte": old_end_byte,
+        "new_end_byte": new_end_byte,
+        "start_point": _point_at(new, start_byte),
+        "old_end_point": _point_at(old, old_end_byte),
+        "new_end_point": _point_at(new, new_end_byte),
+    }
+
+
+def _resolve_language(language_name: str) -> Optional[Language]:
+    if language_name == "c_sharp":
+        language_name = "csharp"
+    for module_name in [
+        "tree_sitter_language_pack",
+        "tree_sitter_languages",
+        f"tree_sitter_{language_name}",
+    ]:
+        try:
+            module = importlib.import_module(module_name)
+        except Exception:
+            continue
+        if not module:
+            continue
+        if hasattr(module, "get_language"):
+            return module.get_language(language_name)
+        elif hasattr(module, "language"):
+            language = module.language()
+            if isinstance(language, Language):
+                return language
+            else:
+                return Language(language)
+        return None
+
+
+def _new_parser(language: Language) -> Parser:
+    parser = Parser()
+    # For backward compatibility, use deprecated "set_language" for old version of tree-sitter
+    if hasattr(parser, "set_language"):
+        parser.set_language(language)
+    else:
+        # New version of tree-sitter use language attribute.
+        parser.language = language
+    return parser
+
+
+# Bytes handed to the parser at a time when reading from a buffer
+READ_CHUNK_SIZE = 64 * 1024
+
+# tree-sitter 0.25, which brought QueryCursor, also cancels parses from a
+# progress callback, and deprecates the timeout older versions stop them with
+PARSE_PROGRESS = QueryCursor is not None
+
+# Time a cancellable parse runs between checks for its cancellation, with
+# tree-sitter < 0.25
+PARSE_SLICE_MICROS = 20000
+
+
+# Modes of AST.get_match_ast_line()
+MATCH_INDEX = "index"
+MATCH_NATIVE = "native"
+
+# Process-wide caches keyed by language name, shared by all AST instances.
+# A None in _languages records a language whose grammar failed to load, so
+# that it is not looked up again.
+_languages: Dict[str, Optional[Language]] = {}
+# Parsers are cached per thread instead: they are not thread-safe, and a
+# parse stopped by a timeout is resumed by the next parse of its parser.
+_parsers = threading.local()
+
+# Compiled queries by language name and query text. Each version of a query
+# being typed is compiled, so only the most recently used ones are kept.
+QUERY_CACHE_SIZE = 32
+_queries: Dict[Tuple[str, str], Query] = {}
 
 
 class AST:
     def __init__(self):
-        self.content: Optional[bytes] = None
+        # bytes, or any buffer such as an mmap of the source file
+        self.content = None
         self.language: Optional[Language] = None
         self.parser: Optional[Parser] = Parser()
         self.tree: Optional[Tree] = None
-        self.line_range = {}  # Add line_range field
+        # The tree before the last incremental parse, already edited so that
+        # it can be compared with the new tree by Tree.changed_ranges(). It
+        # is also the tree waiting for parse() after prepare().
+        self.old_tree: Optional[Tree] = None
+        # The edits applied to old_tree since it was parsed, in order
+        self.edits: List[dict] = []
+        self.language_name: Optional[str] = None
+        # Nodes of the AST dump, one row per line
+        self.nodes = NodeTable()
+        # Interval index over nodes, rebuilt when nodes is replaced
+        self._line_index: Optional[IntervalIndex] = None
+        self._line_index_source = None
+        self.match_mode = MATCH_INDEX
+        # If set, build_nodes() looks the nodes up there before parsing
+        self.cache: Optional[DumpCache] = None
+        # Byte to editor position index, built on demand for content
+        self._offset_index: Optional[OffsetIndex] = None
 
     def get_language(self, language_name: str) -> Optional[Language]:
-        if language_name == "c_sharp":
-            language_name = "csharp"
-        for module_name in [
-            "tree_sitter_language_pack",
-            "tree_sitter_languages",
-            f"tree_sitter_{language_name}",
-        ]:
+        if language_name not in _languages:
             try:
-                module = importlib.import_module(module_name)
+                _languages[language_name] = _resolve_language(language_name)
             except Exception:
-                continue
-            if not module:
-                continue
-            if hasattr(module, "get_language"):
-                return module.get_language(language_name)
-            elif hasattr(module, "language"):
-                language = module.language()
-                if isinstance(language, Language):
-                    return language
-                else:
-                    return Language(language)
-            return None
+                _languages[language_name] = None
+        return _languages[language_name]
+
+    def get_parser(self, language_name: str) -> Optional[Parser]:
+        """Return the parser of a language for the current thread."""
+        parsers = getattr(_parsers, "by_language", None)
+        if parsers is None:
+            parsers = _parsers.by_language = {}
+        parser = parsers.get(language_name)
+        if parser is None:
+            language = self.get_language(language_name)
+            if not language:
+                return None
+            parser = parsers[language_name] = _new_parser(language)
+        return parser
 
     def load(self, language_name: str, content):
-        self.content = (
+        with monitor.timed("prepare"):
+            self.prepare(language_name, content)
+        self.parse()
+
+    def prepare(self, language_name: str, content):
+        """Take new content, the cheap first half of load().
+
+        Content may be text, bytes or another buffer such as an mmap, which
+        is then used as is, without a copy. When only the text changed, the
+        edit is applied to the current tree, which parse() then reuses so
+        that the parser only revisits the edited region.
+        """
+        data = (
             content.encode("utf8", errors="replace")
             if isinstance(content, str)
             else content
         )
-        self.language = self.get_language(language_name)
-        if not self.language:
+        language = self.get_language(language_name)
+        if not language:
             raise Exception(
                 f"cannot find tree-sitter driver for language '{language_name}'"
             )
-        self.parser = Parser()
-        # For backward compatibility, use deprecated "set_language" for old version of tree-sitter
-        if hasattr(self.parser, "set_language"):
-            self.parser.set_language(self.language)
-        else:
-            # New version of tree-sitter use language attribute.
-            self.parser.language = self.language
-        data = (
-            content.encode("utf8", errors="replace")
-            if isinstance(content, str)
-            else content
-        )
-        self.tree = self.parser.parse(data)
+
+        old_tree = None
+        edits: List[dict] = []
+        # Buffers other than bytes come from files, which are parsed afresh:
+        # comparing them with the old content would copy them
+        if (
+            self.content is not None
+            and self.language_name == language_name
+            and isinstance(data, bytes)
+        ):
+            # An edited but not yet re-parsed tree is as good a base
+            if self.tree is not None:
+                old_tree = self.tree
+            else:
+                old_tree = self.old_tree
+                edits = list(self.edits)
+        if old_tree is not None:
+            edit = compute_edit(self.content, data)
+            if edit is None and self.tree is not None:
+                # Nothing to parse again: compare the tree with itself, with
+                # no edits pending
+                self.old_tree = self.tree
+                self.edits = []
+                return
+            if edit is not None:
+                old_tree.edit(**edit)
+                edits.append(edit)
+
+        self.content = data
+        self.language = language
+        self.language_name = language_name
+        self.parser = self.get_parser(language_name)
+        self.tree = None
+        self.old_tree = old_tree
+        self.edits = edits
+
+    def parse(self, is_cancelled: Optional[Callable[[], bool]] = None) -> bool:
+        """Parse the content taken by prepare(), the second half of load().
+
+        It only touches this AST, so it may run in another thread. If given,
+        is_cancelled() is called along the parse, which stops as soon as it
+        returns true. The AST is then left as prepare() left it, and may be
+        parsed again or prepared with newer content.
+
+        Return whether the content is parsed.
+        """
+        if self.tree is not None or self.content is None:
+            return self.tree is not None
+        # Let the parser read other buffers a chunk at a time, instead of
+        # copying them whole into bytes
+        source = self.content if isinstance(self.content, bytes) else self._read
+        # Parse incrementally from the edited old tree, if any
+        old_tree = [] if self.old_tree is None else [self.old_tree]
+        # The parser of this thread, which prepare() may not have run in
+        parser = self.get_parser(self.language_name)
+        with monitor.timed("parse"):
+            if is_cancelled is None:
+                self.tree = parser.parse(source, *old_tree)
+            else:
+                self.tree = self._parse_cancellable(
+                    parser, source, old_tree, is_cancelled
+                )
+        return self.tree is not None
+
+    def _parse_cancellable(
+        self, parser, source, old_tree, is_cancelled
+    ) -> Optional[Tree]:
+        if PARSE_PROGRESS:
+            try:
+                tree = parser.parse(
+                    source, *old_tree, progress_callback=lambda state: is_cancelled()
+                )
+            except ValueError:
+                tree = None
+            if tree is None:
+                # Else the next parse would resume this one
+                parser.reset()
+            return tree
+
+        # Parse a slice at a time: a parse which timed out resumes where it
+        # stopped when called again
+        parser.timeout_micros = PARSE_SLICE_MICROS
+        try:
+            while not is_cancelled():
+                try:
+                    return parser.parse(source, *old_tree)
+                except ValueError:
+                    continue
+            parser.reset()
+            return None
+        finally:
+            parser.timeout_micros = 0
+
+    def _read(self, byte: int, point) -> bytes:
+        return bytes(self.content[byte : byte + READ_CHUNK_SIZE])
+
+    def changed_rows(self) -> Optional[List[Tuple[int, int]]]:
+        """Return the (first, last) rows of the ranges changed by the last parse.
+
+        These are the rows whose syntax changed in the last parse, not
+        counting edits which left the syntax alone. None means everything
+        may have changed.
+        """
+        if self.tree is None or self.old_tree is None:
+            return None
+        return [
+            (changed.start_point[0], changed.end_point[0])
+            for changed in self.old_tree.changed_ranges(self.tree)
+        ]
+
+    def fork(self) -> "AST":
+        """Return a shallow copy, to be re-loaded while this one stays in use.
+
+        The copy shares the current tree, which its prepare() edits in place:
+        the two must not be re-loaded concurrently.
+        """
+        return copy.copy(self)
 
     def get_plain_text(self) -> str:
-        if not self.tree:
-            return ""
-
-        lines: List[str] = []
-        stack = [(self.tree.root_node, 0, 0)]  # (node, depth, id)
-        self.line_range = {}  # 初始化 line_range 字典
-
-        while stack:
-            node, depth, index = stack.pop()
-            start_point = node.start_point
-            end_point = node.end_point
-            node_type = node.type
-            field_name = (
-                node.parent.field_name_for_child(index)
-                if node.parent and node.parent.child_count > index
-                else None
-            )
+        records = self.iter_records()
+        with monitor.timed("render_text"):
+            return render_text(records)
 
-            # 存储 start_point 和 end_point 到 line_range
-            line_number = len(lines)
-            self.line_range[line_number] = [
-                start_point[0],
-                start_point[1],
-                end_point[0],
-                end_point[1],
-            ]
+    def iter_records(self) -> Iterator[AstRecord]:
+        """Build the node table and iterate over its nodes in dump order."""
+        return self.build_nodes().records()
 
-            lines.append(
-                "{}{}{}{} [{}, {}] - [{}, {}]".format(
-                    "  " * depth,
-                    f"{field_name}: " if field_name else "",
-                    "" if node.is_named else "[anonymous] ",
-                    node_type,
-                    start_point[0] + 1,
-                    start_point[1],
-                    end_point[0] + 1,
-                    end_point[1],
-                ).replace("\n", "\\n")
-            )
+    def build_nodes(self) -> NodeTable:
+        """Fill the node table from the tree, without formatting the dump.
+
+        The content is parsed first if only prepare() was called. With a
+        cache, a cached table is used instead, without even parsing.
+        """
+        if self.cache is not None and self.content is not None:
+            cached = self.cache.get(self.content, self.language_name)
+            if cached is not None:
+                self.nodes = cached
+                return self.nodes
+        self.parse()
+
+        with monitor.timed("build_nodes"):
+            nodes = NodeTable()
+            if self.old_tree is not None:
+                # Number the names as the table of the previous tree did, so
+                # that NodeTable.diff() can compare the two
+                nodes.share_names(self.nodes)
+            self.nodes = nodes
+            if not self.tree:
+                return self.nodes
+            self.nodes.has_error = self.tree.root_node.has_error
 
-            # Add children to the stack with incremented depth and original index
-            for id, child in enumerate(reversed(node.children)):
-                original_id = len(node.children) - 1 - id
-                stack.append((child, depth + 1, original_id))
+            # Walk the tree in pre-order with a TreeCursor: one native step per
+            # node, and the field name comes from the cursor instead of a lookup
+            # through the parent node.
+            cursor = self.tree.walk()
+            # Rows of the nodes on the path from the root to the current node
+            path: List[int] = []
+            visiting = True
+            while visiting:
+                node = cursor.node
+                row = self.nodes.append(
+                    node.start_point,
+                    node.end_point,
+                    len(path),
+                    path[-1] if path else -1,
+                    node.type,
+                    node.is_named,
+                    cursor.field_name,
+                    node.id,
+                )
 
-        return "\n".join(lines)
+                if cursor.goto_first_child():
+                    path.append(row)
+                    continue
+                while not cursor.goto_next_sibling():
+                    if not cursor.goto_parent():
+                        visiting = False
+                        break
+                    path.pop()
+
+            self._line_index = IntervalIndex(self.nodes.ranges())
+            self._line_index_source = self.nodes
+        if self.cache is not None:
+            self.cache.put(self.content, self.language_name, self.nodes)
+        return self.nodes
 
     def get_match_ast_line(self, line: int, column: int) -> Optional[int]:
-        """Find the closest line_range index for the given line and column."""
-        min_row_distance = -1
-        min_col_distance = -1
-        closest_index = None
+        """Find the closest AST dump line for the given line and column.
 
-        for index, (
-            start_line,
-            start_col,
-            end_line,
-            end_col,
-        ) in self.line_range.items():
-            if line < start_line or line > end_line:
-                continue
-            if line == start_line and column < start_col:
-                continue
-            if line == end_line and column > end_col:
-                continue
+        Among the ranges containing the position, the one spanning the fewest
+        rows wins, then the one spanning the fewest columns, then the one
+        which comes first in the AST dump.
 
-            row_distance = abs(end_line - start_line)
-            if min_row_distance < 0 or row_distance < min_row_distance:
-                min_row_distance = row_distance
-                closest_index = index
-                continue
-            elif row_distance > min_row_distance:
-                continue
+        With match_mode set to MATCH_NATIVE, tree-sitter resolves the node
+        itself, which is mapped back to its line by node id instead. Nodes
+        from the cache have no node ids, so the index is used for them.
+        """
+        if (
+            self.match_mode == MATCH_NATIVE
+            and self.tree is not None
+            and self.nodes.has_node_ids
+        ):
+            return self._get_native_match_ast_line(line, column)
 
-            col_distance = abs(end_col - start_col)
-            if min_col_distance < 0 or col_distance < min_col_distance:
-                min_col_distance = col_distance
+        closest = None
+        closest_index = None
+        for index in self._get_line_index().enclosing(line, column):
+            start_line, start_col, end_line, end_col = self.nodes.get_range(index)
+            key = (abs(end_line - start_line), abs(end_col - start_col), index)
+            if closest is None or key < closest:
+                closest = key
                 closest_index = index
+        return closest_index
+
+    def _get_line_index(self) -> IntervalIndex:
+        if self._line_index is None or self._line_index_source is not self.nodes:
+            self._line_index = IntervalIndex(self.nodes.ranges())
+            self._line_index_source = self.nodes
+        return self._line_index
+
+    def get_capture_line(self, capture: QueryCapture) -> Optional[int]:
+        """Return the AST dump line of a captured node.
+
+        Among the lines with the same range, such as a node and its only
+        child, the one with the type of the node wins.
+        """
+        found = None
+        code_range = [*capture.start_point, *capture.end_point]
+        for index in self._get_line_index().enclosing(*capture.start_point):
+            if self.nodes.get_range(index) != code_range:
                 continue
-            elif col_distance > min_col_distance:
-                continue
+            node_type, _ = self.nodes.types[self.nodes.type_id[index]]
+            if node_type == capture.type:
+                return index
+            if found is None:
+                found = index
+        return found
 
-        return closest_index
+    def get_query(self, query_text: str) -> Query:
+        """Return the compiled query, from the cache if compiled before.
+
+        Raises an exception, such as tree_sitter.QueryError, for queries
+        which do not compile.
+        """
+        if self.language is None:
+            raise Exception("no language to run the query with")
+        key = (self.language_name, query_text)
+        # Re-inserted on each use, so the first entry is the least recent
+        query = _queries.pop(key, None)
+        if query is None:
+            query = Query(self.language, query_text)
+            if len(_queries) >= QUERY_CACHE_SIZE:
+                del _queries[next(iter(_queries))]
+        _queries[key] = query
+        return query
+
+    def query(
+        self,
+        query_text: str,
+        byte_range: Optional[Tuple[int, int]] = None,
+        point_range=None,
+    ) -> List[QueryCapture]:
+        """Return the captures of a query, limited to byte and point ranges."""
+        self.parse()
+        if self.tree is None:
+            return []
+        query = self.get_query(query_text)
+        root = self.tree.root_node
+        if QueryCursor is not None:
+            cursor = QueryCursor(query)
+            if byte_range is not None:
+                cursor.set_byte_range(*byte_range)
+            if point_range is not None:
+                cursor.set_point_range(*point_range)
+            result = cursor.captures(root)
+        else:
+            # The query is shared and keeps its ranges: always set both
+            query.set_byte_range(byte_range or FULL_RANGE)
+            query.set_point_range(point_range or FULL_POINT_RANGE)
+            result = query.captures(root)
+        if isinstance(result, dict):
+            pairs = [(node, name) for name, nodes in result.items() for node in nodes]
+        else:
+            # A list of (node, name) before tree-sitter 0.23
+            pairs = result
+        captures = [
+            QueryCapture(
+                name,
+                node.type,
+                node.start_byte,
+                node.end_byte,
+                tuple(node.start_point),
+                tuple(node.end_point),
+            )
+            for node, name in pairs
+        ]
+        captures.sort(key=capture_key)
+        return captures
+
+    def query_captures(
+        self,
+        query_text: str,
+        byte_range: Tuple[int, int] = FULL_RANGE,
+        previous: Optional[QueryResult] = None,
+    ) -> QueryResult:
+        """Return the captures of a query in a byte range, as a QueryResult.
+
+        When previous holds the captures for the tree this one was parsed
+        from, those away from the edits are kept and the query only runs
+        over the ranges which changed since.
+        """
+        self.parse()
+        if self.tree is None:
+            return QueryResult(query_text, None, byte_range, [])
+        if previous is not None and previous.query_text == query_text:
+            if previous.tree is self.tree and previous.byte_range == byte_range:
+                return previous
+            if self.old_tree is None or previous.tree is not self.old_tree:
+                previous = None
+        else:
+            previous = None
+
+        changed = None
+        if previous is not None:
+            changed = [
+                (r.start_byte, r.end_byte)
+                for r in self.old_tree.changed_ranges(self.tree)
+            ]
+        kept, ranges = pending_ranges(
+            previous, self.edits, changed, self.tree.root_node, byte_range
+        )
+        captures = set(kept)
+        for start, end in ranges:
+            # Matches may capture nodes outside the range, kept already
+            captures.update(self.query(query_text, (start, end)))
+        return QueryResult(
+            query_text, self.tree, byte_range, sorted(captures, key=capture_key)
+        )
+
+    def _get_native_match_ast_line(self, line: int, column: int) -> Optional[int]:
+        root = self.tree.root_node
+        point = (line, column)
+        if point < tuple(root.start_point) or point > tuple(root.end_point):
+            return None
+        node = root.descendant_for_point_range(point, point)
+        # Nodes from a newer parse may not be in the dump yet, but some
+        # ancestor, at least the root, is.
+        while node is not None:
+            index = self.nodes.find_node(node.id)
+            if index is not None:
+                return index
+            node = node.parent
+        return None
+
+    def offset_index(self) -> OffsetIndex:
+        """Return the index between byte offsets and editor positions."""
+        content = self.content if self.content is not None else b""
+        if self._offset_index is None or self._offset_index.data is not content:
+            self._offset_index = OffsetIndex(content)
+        return self._offset_index
 
     def get_code_range(self, line_number: int) -> List[int]:
         """Return the start and end line and column numbers for the given line number."""
-        return self.line_range.get(line_number, [-1, -1, -1, -1])
+        if 0 <= line_number < len(self.nodes):
+            return self.nodes.get_range(line_number)
+        return [-1, -1, -1, -1]
@@ -0,0 +1,142 @@
+from html import escape
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Tuple
+
+
+class AstRecord(NamedTuple):
+    """A node of the AST dump, as rendered on one line."""
+
+    row: int
+    depth: int
+    field_name: Optional[str]
+    type: str
+    is_named: bool
+    start_point: Tuple[int, int]
+    end_point: Tuple[int, int]
+
+
+HTML_HEAD = """
+        <html>
+        <head>
+            <style>
+                /* 基础样式 */
+                body {
+                    font-family: Arial, sans-serif;
+                }
+
+                /* div 样式 */
+                div {
+                    line-height: 1.5;
+                }
+
+                /* 普通节点样式 */
+                div[style='normal'] {
+                    display: block;
+                }
+
+                /* 匿名节点样式 */
+                div[style='anonymous'] {
+                    display: block;
+                    font-style: italic;
+                    opacity: 0.6;
+                }
+
+                /* 匿名节点中的类型字段样式 */
+                div[style='anonymous'] span[style='type'] {
+                    color: #808080;
+                }
+
+                /* 缩进空格样式 */
+                span[style='indent'] {
+                    font-family: 'Courier New', monospace;
+                    white-space: pre;
+                    display: inline-block;
+                }
+
+                /* 名称字段样式 */
+                span[style='name'] {
+                    color: #569cd6;
+                    font-weight: bold;
+                }
+
+                /* 范围字段样式 */
+                span[style='range'] {
+                    color: #808080;
+                }
+            </style>
+        </head>
+        <body>
+        """
+HTML_TAIL = """
+        </body>
+        </html>
+        """
+
+
+def format_range(record: AstRecord) -> str:
+    return "[{}, {}] - [{}, {}]".format(
+        record.start_point[0] + 1,
+        record.start_point[1],
+        record.end_point[0] + 1,
+        record.end_point[1],
+    )
+
+
+def format_text_line(record: AstRecord) -> str:
+    """Format a record as a line of the plain text dump."""
+    return "{}{}{}{} {}".format(
+        "  " * record.depth,
+        f"{record.field_name}: " if record.field_name else "",
+        "" if record.is_named else "[anonymous] ",
+        record.type.replace("\n", "\\n"),
+        format_range(record),
+    )
+
+
+def format_html_line(record: AstRecord) -> str:
+    """Format a record as a line of the HTML dump shown in AstView."""
+    return "".join(
+        [
+            "<div style='normal'>" if record.is_named else "<div style='anonymous'>",
+            (
+                "<span style='indent'>{}</span>".format("  " * record.depth)
+                if record.depth
+                else ""
+            ),
+            (
+                "<span style='name'>{}</span>: ".format(escape(record.field_name))
+                if record.field_name
+                else ""
+            ),
+            "<span style='type'>{}</span>".format(
+                escape(record.type.replace("\n", "\\n"))
+            ),
+            " ",
+            "<span style='range'>{}</span>".format(format_range(record)),
+            "</div>",
+        ]
+    )
+
+
+def record_to_dict(record: AstRecord) -> Dict[str, Any]:
+    """Convert a record to a JSON-ready dict, with 0-based rows."""
+    return {
+        "depth": record.depth,
+        "field": record.field_name,
+        "type": record.type,
+        "named": record.is_named,
+        "start": list(record.start_point),
+        "end": list(record.end_point),
+    }
+
+
+def render_text(records: Iterable[AstRecord]) -> str:
+    return "\n".join(map(format_text_line, records))
+
+
+def render_html_lines(records: Iterable[AstRecord]) -> str:
+    """Render the lines of records, to go between HTML_HEAD and HTML_TAIL."""
+    return "\n".join(map(format_html_line, records))
+
+
+def render_html(records: Iterable[AstRecord]) -> str:
+    return "".join([HTML_HEAD, render_html_lines(records), HTML_TAIL])
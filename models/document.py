@@ -1,8 +1,24 @@
+import mmap
 import os
 from dataclasses import dataclass
-from typing import Optional
+from typing import Any, Optional
 
-from .lang_map import get_language
+from .lang_detect import SNIFF_SIZE, detect_language
+
+# Smaller files are read into bytes, which is cheaper than a mapping
+MMAP_MIN_SIZE = 1024 * 1024
+
+
+def read_file_bytes(file_path: str):
+    """Return the bytes of a file, mapped into memory read-only if large.
+
+    The result is bytes or an mmap, which both support the buffer protocol
+    and slicing.
+    """
+    with open(file_path, "rb") as file:
+        if os.fstat(file.fileno()).st_size < MMAP_MIN_SIZE:
+            return file.read()
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
 
 
 @dataclass
@@ -10,11 +26,39 @@ class Document:
     content: str = ""
     language: Optional[str] = None
     file_path: Optional[str] = None
+    # Bytes of the file as loaded, maybe memory-mapped, while content is
+    # unedited
+    data: Any = None
+
+    def load_file(self, file_path: str):
+        """Load a file: map its bytes and decode them for the editor.
+
+        data is left unset when the file has carriage returns, which the
+        editor does not keep, so that byte offsets in data would not match
+        content.
+        """
+        data = read_file_bytes(file_path)
+        content = str(data, "utf-8")
+        if data.find(b"\r") != -1:
+            data = None
+            content = content.replace("\r\n", "\n").replace("\r", "\n")
+        self.file_path = file_path
+        self.content = content
+        self.data = data
 
     def set_language_from_extension(self):
+        """Set the language from the file name, or else from the content.
+
+        Only the head of the loaded content is looked at, for files without
+        extension or with one shared by several languages.
+        """
         if not self.file_path:
             return
-        self.language = get_language(self.file_path)
+        if self.data is not None:
+            head = self.data[:SNIFF_SIZE]
+        else:
+            head = self.content[:SNIFF_SIZE].encode("utf8", errors="replace")
+        self.language = detect_language(self.file_path, head)
         if not self.language:
             raise Exception(
                 "unknown language for file: '{}'".format(
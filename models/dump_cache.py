@@ -0,0 +1,168 @@
+import hashlib
+import os
+from typing import Dict, Optional
+
+from .node_table import FORMAT_VERSION, NodeTable
+
+# Default bound of the total size of the cache files
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+CACHE_SUFFIX = ".nodes"
+
+_grammar_versions: Dict[str, str] = {}
+
+
+def default_cache_dir() -> str:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "tree-sitter-playground")
+
+
+def grammar_version(language_name: str) -> str:
+    """Return the versions of the packages which may provide the grammar.
+
+    Any upgrade of tree-sitter or of a grammar package changes it.
+    """
+    version = _grammar_versions.get(language_name)
+    if version is None:
+        # Imported here, as it is slow to import and only needed for keys
+        try:
+            from importlib import metadata
+        except ImportError:  # Python < 3.8
+            metadata = None
+        versions = []
+        for package in [
+            "tree-sitter",
+            "tree-sitter-language-pack",
+            "tree-sitter-languages",
+            "tree-sitter-" + language_name.replace("_", "-"),
+        ]:
+            if metadata is None:
+                break
+            try:
+                versions.append(f"{package}={metadata.version(package)}")
+            except metadata.PackageNotFoundError:
+                # Not installed, as most of them
+                continue
+        version = _grammar_versions[language_name] = ",".join(versions)
+    return version
+
+
+class DumpCache:
+    """On-disk cache of node tables, keyed by content, language and grammar.
+
+    Each entry is a file named by its key. Reading an entry touches it, and
+    once the files grow beyond max_size, the least recently used ones are
+    removed.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory or default_cache_dir()
+        self.max_size = max_size
+        # Total size of the entries, scanned on the first put()
+        self._size: Optional[int] = None
+
+    def key(self, content: bytes, language_name: str) -> str:
+        digest = hashlib.sha256()
+        for part in [
+            str(FORMAT_VERSION),
+            language_name,
+            grammar_version(language_name),
+        ]:
+            digest.update(part.encode("utf8"))
+            digest.update(b"\0")
+        digest.update(content)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + CACHE_SUFFIX)
+
+    def get(self, content: bytes, language_name: str) -> Optional[NodeTable]:
+        path = self._path(self.key(content, language_name))
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+        except OSError:
+            return None
+        try:
+            nodes = NodeTable.from_bytes(data)
+        except Exception:
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return nodes
+
+    def put(self, content: bytes, language_name: str, nodes: NodeTable):
+        data = nodes.to_bytes()
+        if len(data) > self.max_size:
+            return
+        path = self._path(self.key(content, language_name))
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if self._size is None:
+                self._size = self._scan_size()
+            try:
+                # Counted already, if the entry is replaced
+                old_size = os.stat(path).st_size
+            except OSError:
+                old_size = 0
+            # Write aside and rename, so that readers never see half an entry
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, "wb") as file:
+                file.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            return
+        self._size += len(data) - old_size
+        if self._size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until under max_size."""
+        entries = []
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._size <= self.max_size:
+                break
+            if self._remove(path):
+                self._size -= size
+
+    def clear(self):
+        for entry in self._entries():
+            self._remove(entry.path)
+        self._size = 0
+
+    def _entries(self):
+        try:
+            with os.scandir(self.directory) as entries:
+                return [e for e in entries if e.name.endswith(CACHE_SUFFIX)]
+        except OSError:
+            return []
+
+    def _scan_size(self) -> int:
+        size = 0
+        for entry in self._entries():
+            try:
+                size += entry.stat().st_size
+            except OSError:
+                continue
+        return size
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
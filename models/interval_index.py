@@ -0,0 +1,81 @@
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Iterator, List, Sequence
+
+
+def encode_point(row: int, column: int) -> int:
+    """Pack a (row, column) point into one int with the same ordering."""
+    return (row << 32) | column
+
+
+class IntervalIndex:
+    """Nested containment list over inclusive (row, column) ranges.
+
+    Ranges which are not contained in any other range form the top level,
+    sorted by start. Since none of them contains another, their ends are
+    sorted too, and the ranges enclosing a point are a contiguous run found
+    by binary search. Each range keeps the ranges it contains in a nested
+    level of the same shape, so a lookup costs O(log n) per nesting level,
+    which for a syntax tree is O(depth * log n).
+
+    All levels are stored back to back in a few flat arrays.
+    """
+
+    def __init__(self, ranges: Iterable[Sequence[int]]):
+        """Index ranges given as (start_row, start_col, end_row, end_col).
+
+        Lookups return the position of a range in this sequence.
+        """
+        starts = array("Q")
+        ends = array("Q")
+        for start_row, start_col, end_row, end_col in ranges:
+            # Same as encode_point(), inlined for speed
+            starts.append((start_row << 32) | start_col)
+            ends.append((end_row << 32) | end_col)
+        count = len(starts)
+
+        # Visit ranges by start, enclosing ranges first, and find the
+        # innermost range containing each of them: that is its level.
+        order = sorted(range(count), key=lambda i: (starts[i], -ends[i]))
+        level_of = array("I", bytes(4 * count))
+        stack: List[int] = []
+        for index in order:
+            end = ends[index]
+            while stack and ends[stack[-1]] < end:
+                stack.pop()
+            # Level 0 is the top level, level i + 1 holds the ranges in range i
+            level_of[index] = stack[-1] + 1 if stack else 0
+            stack.append(index)
+
+        # Lay the levels out one after another, each still sorted by start.
+        self._offsets = array("I", bytes(4 * (count + 3)))
+        for index in range(count):
+            self._offsets[level_of[index] + 2] += 1
+        for level in range(2, count + 3):
+            self._offsets[level] += self._offsets[level - 1]
+        self._starts = array("Q", bytes(8 * count))
+        self._ends = array("Q", bytes(8 * count))
+        self._ids = array("I", bytes(4 * count))
+        for index in order:
+            position = self._offsets[level_of[index] + 1]
+            self._offsets[level_of[index] + 1] += 1
+            self._starts[position] = starts[index]
+            self._ends[position] = ends[index]
+            self._ids[position] = index
+        # Now level i spans self._offsets[i] to self._offsets[i + 1]
+
+    def enclosing(self, row: int, column: int) -> Iterator[int]:
+        """Yield the position of every range containing the given point."""
+        point = encode_point(row, column)
+        starts, ends, ids, offsets = self._starts, self._ends, self._ids, self._offsets
+        pending = [0]
+        while pending:
+            level = pending.pop()
+            end = offsets[level + 1]
+            i = bisect_left(ends, point, offsets[level], end)
+            while i < end and starts[i] <= point:
+                index = ids[i]
+                yield index
+                if offsets[index + 1] < offsets[index + 2]:
+                    pending.append(index + 1)
+                i += 1
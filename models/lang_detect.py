@@ -0,0 +1,216 @@
+"""Detect the language of a file from its content, when its name is not enough.
+
+Only the head of the file is looked at: first for a shebang, an Emacs or Vim
+modeline or a magic marker, then, for extensions shared by several
+languages, by parsing it with each candidate grammar.
+"""
+
+import os
+import re
+import time
+from typing import List, Optional
+
+from .ast import AST
+from .lang_map import ext_to_lang_map, get_language, lang_extensions
+
+# Bytes of a file looked at to detect its language
+SNIFF_SIZE = 8 * 1024
+
+# Bound of the time spent parsing the head with candidate grammars, checked
+# between candidates, so at least one is always tried
+TRIAL_TIME_BUDGET = 0.05
+
+# Extensions used by several languages, with the candidates in order of
+# preference. The first one is lang_map's choice. PHP is left out, as its
+# grammar takes any text outside <?php tags: it is only told by its marker.
+AMBIGUOUS_EXTENSIONS = {
+    "h": ["cpp", "objc"],
+    "inc": ["bitbake", "pascal", "cpp"],
+    "s": ["asm"],
+}
+
+# Interpreters of shebang lines and names of modelines which are neither
+# language names nor extensions
+LANGUAGE_ALIASES = {
+    "sh": "bash",
+    "dash": "bash",
+    "ksh": "bash",
+    "zsh": "bash",
+    "shell-script": "bash",
+    "node": "javascript",
+    "nodejs": "javascript",
+    "deno": "javascript",
+    "bun": "javascript",
+    "ts-node": "typescript",
+    "rscript": "r",
+    "tclsh": "tcl",
+    "wish": "tcl",
+    "escript": "erlang",
+    "makefile": "make",
+    "c": "cpp",
+    "c++": "cpp",
+    "emacs-lisp": "elisp",
+}
+
+_SHEBANG = re.compile(rb"#![ \t]*(\S+)(?:[ \t]+(.*))?")
+# -*- python -*-, or -*- mode: python; coding: utf-8 -*-
+_EMACS_MODELINE = re.compile(rb"-\*-(.*?)-\*-")
+_EMACS_MODE = re.compile(rb"(?:^|;)[ \t]*mode:[ \t]*([\w+.-]+)")
+_VIM_MODELINE = re.compile(rb"\b(?:vi|vim|ex):.*?\b(?:ft|filetype|syntax)=([\w+.-]+)")
+_MARKERS = [
+    (re.compile(rb"<\?php\b"), "php"),
+    (re.compile(rb"\A\s*<\?xml\b"), "xml"),
+    (re.compile(rb"\A\s*<(?:!doctype[ \t]+html|html)\b", re.IGNORECASE), "html"),
+]
+
+# Lines at the top of the file where modelines are looked for
+MODELINE_LINES = 5
+
+
+def _language_of_name(name: str) -> Optional[str]:
+    """Return the language for an interpreter, mode or file type name."""
+    name = name.lower()
+    name = LANGUAGE_ALIASES.get(name, name)
+    if name in lang_extensions:
+        return name
+    return ext_to_lang_map.get(name)
+
+
+def _interpreter_language(interpreter: str) -> Optional[str]:
+    # python3.11 -> python, and so on
+    name = os.path.basename(interpreter)
+    return _language_of_name(name) or _language_of_name(name.rstrip("0123456789."))
+
+
+def sniff_language(head: bytes) -> Optional[str]:
+    """Return the language given by a shebang, modeline or marker in head."""
+    lines = head.split(b"\n", MODELINE_LINES)[:MODELINE_LINES]
+    match = _SHEBANG.match(lines[0]) if lines else None
+    if match:
+        interpreter = match.group(1).decode("utf8", errors="replace")
+        arguments = (match.group(2) or b"").decode("utf8", errors="replace").split()
+        if os.path.basename(interpreter) == "env":
+            # Skip the options of env, such as -S
+            arguments = [a for a in arguments if not a.startswith("-")]
+            interpreter = arguments[0] if arguments else ""
+        language = _interpreter_language(interpreter)
+        if language:
+            return language
+
+    for line in lines:
+        name = None
+        match = _EMACS_MODELINE.search(line)
+        if match:
+            variables = match.group(1)
+            mode = _EMACS_MODE.search(variables)
+            name = mode.group(1) if mode else variables.strip()
+        else:
+            match = _VIM_MODELINE.search(line)
+            if match:
+                name = match.group(1)
+        if name:
+            language = _language_of_name(name.decode("utf8", errors="replace"))
+            if language:
+                return language
+
+    for pattern, language in _MARKERS:
+        if pattern.search(head):
+            return language
+    return None
+
+
+def error_ratio(tree) -> float:
+    """Return the share of error and missing nodes in a tree."""
+    if not tree.root_node.has_error:
+        return 0.0
+    total = 0
+    errors = 0
+    cursor = tree.walk()
+    while True:
+        node = cursor.node
+        total += 1
+        if node.is_error or node.is_missing:
+            errors += 1
+        if node.has_error and cursor.goto_first_child():
+            continue
+        while not cursor.goto_next_sibling():
+            if not cursor.goto_parent():
+                return errors / total
+
+
+def trial_parse(
+    head: bytes, candidates: List[str], time_budget: float = TRIAL_TIME_BUDGET
+) -> Optional[str]:
+    """Return the candidate whose grammar parses head with the fewest errors.
+
+    Ties go to the earlier candidate. Candidates are skipped once the time
+    budget is spent, and those without a grammar are ignored.
+    """
+    # Do not count the error of a line cut at the end of head
+    if len(head) >= SNIFF_SIZE and b"\n" in head:
+        head = head[: head.rindex(b"\n") + 1]
+    ast = AST()
+    best = None
+    best_ratio = None
+    deadline = time.perf_counter() + time_budget
+    for language in candidates:
+        if best is not None and time.perf_counter() > deadline:
+            break
+        parser = ast.get_parser(language)
+        if parser is None:
+            continue
+        ratio = error_ratio(parser.parse(head))
+        if best_ratio is None or ratio < best_ratio:
+            best = language
+            best_ratio = ratio
+            if not ratio:
+                break
+    return best
+
+
+def _extension(file_path: str) -> str:
+    file_name = os.path.basename(file_path)
+    return file_name.rpartition(".")[2].lower() if "." in file_name else ""
+
+
+def needs_detection(file_path: str) -> bool:
+    """Whether the name of a file may not tell its language.
+
+    That is, the file has no extension, or one shared by several languages.
+    """
+    extension = _extension(file_path)
+    return not extension or extension in AMBIGUOUS_EXTENSIONS
+
+
+def read_head(file_path: str) -> bytes:
+    with open(file_path, "rb") as file:
+        return file.read(SNIFF_SIZE)
+
+
+def detect_language(
+    file_path: str, head: Optional[bytes] = None, trial: bool = True
+) -> Optional[str]:
+    """Return the language of a file, by its name and else by its head.
+
+    head is read from the file unless given. With trial set, a file with an
+    ambiguous extension is parsed with the candidate grammars when its head
+    has no hint.
+    """
+    candidates = AMBIGUOUS_EXTENSIONS.get(_extension(file_path))
+    if not candidates:
+        language = get_language(file_path)
+        if language:
+            return language
+    if head is None:
+        try:
+            head = read_head(file_path)
+        except OSError:
+            head = b""
+    head = bytes(head[:SNIFF_SIZE])
+
+    language = sniff_language(head)
+    if language or not candidates:
+        return language
+    if trial and len(candidates) > 1:
+        language = trial_parse(head, candidates)
+    return language or candidates[0]
@@ -1,6 +1,9 @@
 import os
+import re
 import sys
-from fnmatch import fnmatch
+from fnmatch import translate
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
 
 # Supported languages and their extensions for tree-sitter-language-pack.
 # See: https://github.com/Goldziher/tree-sitter-language-pack
@@ -232,6 +235,26 @@ class ExtToLangMap(dict):
         return super().get(key)
 
 
+# Prefix of the group of each pattern in compile_globs(). fnmatch.translate()
+# names groups of its own g0, g1... on Python < 3.11.
+_GLOB_GROUP = "_lm"
+
+
+def compile_globs(patterns: List[str]) -> "re.Pattern":
+    """Compile glob patterns into one regex, with a named group per pattern."""
+    return re.compile(
+        "|".join(
+            f"(?P<{_GLOB_GROUP}{i}>{translate(pattern)})"
+            for i, pattern in enumerate(patterns)
+        )
+    )
+
+
+def glob_index(match: "re.Match") -> int:
+    """Return the index of the pattern a regex of compile_globs() matched."""
+    return int(match.lastgroup[len(_GLOB_GROUP) :])
+
+
 class FileToLangMap(dict):
     def __init__(self):
         super().__init__(
@@ -245,70 +268,89 @@ class FileToLangMap(dict):
                 "kconfig": "kconfig",
                 "manifest.in": "pymanifest",
                 "requirements.txt": "requirements",
+                "requirements-*.txt": "requirements",
                 "makefile": "make",
                 "readme": "markdown",
                 "license": "markdown",
                 "copying": "markdown",
                 "changelog": "markdown",
                 "dockerfile": "dockerfile",
+                "dockerfile.*": "dockerfile",
+                "*.dockerfile": "dockerfile",
             }
         )
-        self.globs = {}
+        # All the glob patterns are compiled into one regex, so a miss costs
+        # a single match.
+        self.globs = []
         for file, lang in self.items():
-            if "*" in file:
-                self.globs[file] = lang
+            if any(c in file for c in "*?["):
+                self.globs.append((file, lang))
+        self._glob_regex = None
+        if self.globs:
+            self._glob_regex = compile_globs([pattern for pattern, _ in self.globs])
+
+    def _lookup(self, key: str) -> Optional[str]:
+        key = key.lower()
+        lang = super().get(key)
+        if lang is None and self._glob_regex:
+            match = self._glob_regex.match(key)
+            if match:
+                lang = self.globs[glob_index(match)][1]
+        return lang
 
     def __getitem__(self, key: str):
         """
         Implements [] operator.
         """
-        key = key.lower()
-        if super().__contains__(key):
-            return super().__getitem__(key)
-        if self.globs:
-            for k, v in self.globs.items():
-                if fnmatch.fnmatch(key, k):
-                    return v
+        return self._lookup(key)
 
     def __contains__(self, key: str):
         """
         Implements in operator, such as: "if 'key' in map"
         """
-        key = key.lower()
-        if super().__contains__(key):
-            return True
-        if self.globs:
-            for k, _v in self.globs.items():
-                if fnmatch.fnmatch(key, k):
-                    return True
-        return False
+        return self._lookup(key) is not None
 
     def get(self, key: str):
         """
         Implements get() method.
         """
-        key = key.lower()
-        if super().__contains__(key):
-            return super().get(key)
-        if self.globs:
-            for k, v in self.globs.items():
-                if fnmatch.fnmatch(key, k):
-                    return v
-        return None
+        return self._lookup(key)
 
 
 ext_to_lang_map = ExtToLangMap()
 file_to_lang_map = FileToLangMap()
 
 
-def get_language(file_path: str) -> str:
-    file_name = os.path.basename(file_path)
-    lang = None
-    if "." in file_name:
-        ext = file_name.split(".")[-1]
-        if ext and ext in ext_to_lang_map:
-            lang = ext_to_lang_map.get(ext)
-    if not lang and file_name in file_to_lang_map:
-        lang = file_to_lang_map.get(file_name)
-    print(f"lang: {lang}", file=sys.stderr)
-    return lang
+@lru_cache(maxsize=4096)
+def _language_of_name(file_name: str) -> Optional[str]:
+    ext = file_name.rpartition(".")[2] if "." in file_name else ""
+    return ext_to_lang_map.get(ext) or file_to_lang_map.get(file_name)
+
+
+def get_language(file_path: str) -> Optional[str]:
+    return _language_of_name(os.path.basename(file_path))
+
+
+def classify(paths: Iterable[str]) -> Dict[str, List[str]]:
+    """Group paths by language, leaving out those of unknown language.
+
+    Unlike get_language(), it keeps no cache between calls, and the lookup
+    of the extensions is inlined, as it decides for most paths.
+    """
+    groups: Dict[str, List[str]] = {}
+    basename = os.path.basename
+    # Extensions never start with a dot here, so skip ExtToLangMap.get()
+    ext_get = dict.get
+    for path in paths:
+        file_name = basename(path)
+        lang = None
+        if "." in file_name:
+            lang = ext_get(ext_to_lang_map, file_name.rpartition(".")[2])
+        if lang is None:
+            lang = file_to_lang_map.get(file_name)
+        if lang is not None:
+            group = groups.get(lang)
+            if group is None:
+                group = groups[lang] = []
+            group.append(path)
+    return groups
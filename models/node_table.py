@@ -0,0 +1,324 @@
+import json
+import sys
+from array import array
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from .ast_render import AstRecord, format_text_line
+
+# Version of the to_bytes() format, bumped on incompatible changes
+FORMAT_VERSION = 1
+
+# Columns saved by to_bytes(): node ids are only valid with their tree
+_SAVED_COLUMNS = [
+    "start_row",
+    "start_col",
+    "end_row",
+    "end_col",
+    "depth",
+    "parent",
+    "type_id",
+    "field_id",
+]
+
+# Columns making up the line of a node in the dump
+_LINE_COLUMNS = [
+    "start_row",
+    "start_col",
+    "end_row",
+    "end_col",
+    "depth",
+    "type_id",
+    "field_id",
+]
+# The same but the end of the node: an edit only moves the end of the nodes
+# enclosing it
+_START_COLUMNS = ["start_row", "start_col", "depth", "type_id", "field_id"]
+
+# Rows compared at a time by NodeTable.diff()
+DIFF_CHUNK = 4096
+
+# Changed rows closer than that are merged into one span by NodeTable.diff()
+MERGE_ROWS = 16
+
+
+class RowDiff(NamedTuple):
+    """Rows first to old_stop of a table, replaced by rows first to new_stop."""
+
+    first: int
+    old_stop: int
+    new_stop: int
+
+
+def _common_prefix(old: array, new: array, start: int, limit: int) -> int:
+    """Return the first row from start, up to limit, differing in old and new."""
+    while start < limit:
+        stop = min(start + DIFF_CHUNK, limit)
+        if old[start:stop] != new[start:stop]:
+            # The first difference is in this chunk
+            while old[start] == new[start]:
+                start += 1
+            return start
+        start = stop
+    return limit
+
+
+def _common_suffix(old: array, new: array, limit: int) -> int:
+    """Return how many trailing items, up to limit, are equal in old and new."""
+    count = 0
+    old_end, new_end = len(old), len(new)
+    while count < limit:
+        size = min(DIFF_CHUNK, limit - count)
+        if (
+            old[old_end - count - size : old_end - count]
+            != new[new_end - count - size : new_end - count]
+        ):
+            while old[old_end - count - 1] == new[new_end - count - 1]:
+                count += 1
+            return count
+        count += size
+    return limit
+
+
+class NodeTable:
+    """Columnar table of the nodes of an AST dump, one row per dump line.
+
+    Each attribute is an array with one entry per node, so a node costs a few
+    dozen bytes instead of a dict entry holding a list of Python ints. Node
+    types and field names are interned: rows refer to them by id.
+    """
+
+    def __init__(self):
+        self.start_row = array("I")
+        self.start_col = array("I")
+        self.end_row = array("I")
+        self.end_col = array("I")
+        self.depth = array("I")
+        # Row of the parent node, -1 for the root
+        self.parent = array("i")
+        self.type_id = array("I")
+        # 0 stands for "no field name"
+        self.field_id = array("I")
+        # tree-sitter node ids, and the rows sorted by them for find_node()
+        self.node_id = array("Q")
+        self._rows_by_id: Optional[array] = None
+        # False if node_id holds no real ids, as after from_bytes()
+        self.has_node_ids = True
+        # The tree had ERROR or MISSING nodes
+        self.has_error = False
+
+        # Interned (type name, is named) pairs and field names
+        self.types: List[Tuple[str, bool]] = []
+        self.fields: List[Optional[str]] = [None]
+        self._type_ids: Dict[Tuple[str, bool], int] = {}
+        self._field_ids: Dict[Optional[str], int] = {None: 0}
+
+    def __len__(self) -> int:
+        return len(self.start_row)
+
+    def share_names(self, other: "NodeTable"):
+        """Start with the interned names of another table, for diff()."""
+        self.types = list(other.types)
+        self.fields = list(other.fields)
+        self._type_ids = dict(other._type_ids)
+        self._field_ids = dict(other._field_ids)
+
+    def diff(self, old: "NodeTable") -> Optional[List[RowDiff]]:
+        """Return the spans of rows of the dump changed from an older table.
+
+        Rows are compared by their lines in the dump. Past the leading rows
+        which are the same, the rows of the nodes enclosing an edit only
+        differ by their end, and make spans of one row each. The rest of the
+        changes make the last span, up to the trailing rows which are the
+        same. Only the last span may change the count of rows, so the first
+        row of each span is the same in both tables, and each span holds one
+        row at least on both sides.
+
+        An empty list means the dumps are the same, and None that they have
+        nothing in common, as when the tables do not share their interned
+        names: see share_names().
+        """
+        old_size, size = len(old), len(self)
+        if (
+            not old_size
+            or not size
+            or self.types[: len(old.types)] != old.types
+            or self.fields[: len(old.fields)] != old.fields
+        ):
+            return None
+        columns = {
+            name: (getattr(old, name), getattr(self, name)) for name in _LINE_COLUMNS
+        }
+        common = min(old_size, size)
+        spans: List[RowDiff] = []
+        first = 0
+        while True:
+            start = first
+            first = common
+            for old_column, column in columns.values():
+                first = _common_prefix(old_column, column, start, first)
+            if first == common or any(
+                columns[name][0][first] != columns[name][1][first]
+                for name in _START_COLUMNS
+            ):
+                break
+            spans.append(RowDiff(first, first + 1, first + 1))
+            first += 1
+        if first < common or old_size != size:
+            suffix = common - first
+            for old_column, column in columns.values():
+                suffix = _common_suffix(old_column, column, suffix)
+            old_stop, new_stop = old_size - suffix, size - suffix
+            # Replace a row on either side, rather than only insert or remove
+            if first == old_stop or first == new_stop:
+                if first:
+                    first -= 1
+                else:
+                    old_stop += 1
+                    new_stop += 1
+            spans.append(RowDiff(first, old_stop, new_stop))
+
+        merged: List[RowDiff] = []
+        for span in spans:
+            if merged and span.first - merged[-1].old_stop <= MERGE_ROWS:
+                # The rows in between are the same, and at the same rows
+                span = RowDiff(merged.pop().first, span.old_stop, span.new_stop)
+            merged.append(span)
+        if merged == [RowDiff(0, old_size, size)]:
+            return None
+        return merged
+
+    def append(
+        self,
+        start_point,
+        end_point,
+        depth: int,
+        parent: int,
+        node_type: str,
+        is_named: bool,
+        field_name: Optional[str] = None,
+        node_id: int = 0,
+    ) -> int:
+        """Add a node and return its row."""
+        row = len(self.start_row)
+        self.start_row.append(start_point[0])
+        self.start_col.append(start_point[1])
+        self.end_row.append(end_point[0])
+        self.end_col.append(end_point[1])
+        self.depth.append(depth)
+        self.parent.append(parent)
+
+        key = (node_type, is_named)
+        type_id = self._type_ids.get(key)
+        if type_id is None:
+            type_id = self._type_ids[key] = len(self.types)
+            self.types.append(key)
+        self.type_id.append(type_id)
+
+        field_id = self._field_ids.get(field_name)
+        if field_id is None:
+            field_id = self._field_ids[field_name] = len(self.fields)
+            self.fields.append(field_name)
+        self.field_id.append(field_id)
+        self.node_id.append(node_id)
+        self._rows_by_id = None
+        return row
+
+    def find_node(self, node_id: int) -> Optional[int]:
+        """Return the row of the node with the given tree-sitter node id."""
+        if self._rows_by_id is None:
+            self._rows_by_id = array(
+                "I", sorted(range(len(self.node_id)), key=self.node_id.__getitem__)
+            )
+        rows = self._rows_by_id
+        lo, hi = 0, len(rows)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.node_id[rows[mid]] < node_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(rows) and self.node_id[rows[lo]] == node_id:
+            return rows[lo]
+        return None
+
+    def get_range(self, row: int) -> List[int]:
+        """Return [start_row, start_col, end_row, end_col] of a node."""
+        return [
+            self.start_row[row],
+            self.start_col[row],
+            self.end_row[row],
+            self.end_col[row],
+        ]
+
+    def ranges(self) -> Iterator[Tuple[int, int, int, int]]:
+        """Yield (start_row, start_col, end_row, end_col) of all nodes."""
+        return zip(self.start_row, self.start_col, self.end_row, self.end_col)
+
+    def record(self, row: int) -> AstRecord:
+        node_type, is_named = self.types[self.type_id[row]]
+        return AstRecord(
+            row,
+            self.depth[row],
+            self.fields[self.field_id[row]],
+            node_type,
+            is_named,
+            (self.start_row[row], self.start_col[row]),
+            (self.end_row[row], self.end_col[row]),
+        )
+
+    def records(
+        self, start: int = 0, stop: Optional[int] = None
+    ) -> Iterator[AstRecord]:
+        """Iterate over the nodes from row start up to, not including, stop."""
+        return map(self.record, range(start, len(self) if stop is None else stop))
+
+    def format_line(self, row: int) -> str:
+        """Format a node as a line of the AST dump."""
+        return format_text_line(self.record(row))
+
+    def to_bytes(self) -> bytes:
+        """Serialize the table, without node ids, for from_bytes()."""
+        header = json.dumps(
+            {
+                "version": FORMAT_VERSION,
+                "byteorder": sys.byteorder,
+                "count": len(self),
+                "types": self.types,
+                "fields": self.fields,
+                "has_error": self.has_error,
+            }
+        ).encode("utf8")
+        columns = [getattr(self, name).tobytes() for name in _SAVED_COLUMNS]
+        return b"".join([len(header).to_bytes(4, "little"), header] + columns)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "NodeTable":
+        """Load a table saved by to_bytes(). Raises ValueError if unreadable."""
+        header_size = int.from_bytes(data[:4], "little")
+        header = json.loads(data[4 : 4 + header_size].decode("utf8"))
+        if (
+            header.get("version") != FORMAT_VERSION
+            or header.get("byteorder") != sys.byteorder
+        ):
+            raise ValueError("incompatible node table format")
+
+        table = cls()
+        count = header["count"]
+        view = memoryview(data)
+        offset = 4 + header_size
+        for name in _SAVED_COLUMNS:
+            column = getattr(table, name)
+            size = column.itemsize * count
+            column.frombytes(view[offset : offset + size])
+            offset += size
+        if offset != len(data):
+            raise ValueError("truncated node table")
+
+        table.types = [(node_type, is_named) for node_type, is_named in header["types"]]
+        table.fields = header["fields"]
+        table._type_ids = {key: i for i, key in enumerate(table.types)}
+        table._field_ids = {name: i for i, name in enumerate(table.fields)}
+        table.node_id = array("Q", bytes(8 * count))
+        table.has_node_ids = False
+        table.has_error = header["has_error"]
+        return table
@@ -0,0 +1,108 @@
+from array import array
+from bisect import bisect_right
+from typing import Tuple
+
+# Bytes between two checkpoints of the index
+CHUNK_SIZE = 4096
+
+
+def _utf16_length(text: str) -> int:
+    if text.isascii():
+        return len(text)
+    # Characters beyond the BMP take two UTF-16 code units
+    return len(text.encode("utf-16-le")) // 2
+
+
+class OffsetIndex:
+    """Map UTF-8 byte offsets and tree-sitter points to editor positions.
+
+    Editor positions count UTF-16 code units, as QTextDocument and QString
+    do, with one unit per line break. The index keeps a checkpoint about
+    every CHUNK_SIZE bytes, on a character boundary, with the position and
+    the row there. A lookup is a binary search over checkpoints followed by
+    decoding at most one chunk, so it costs O(log n + CHUNK_SIZE) whatever
+    the line lengths, and the index takes a few bytes per chunk.
+    """
+
+    def __init__(self, data, chunk_size: int = CHUNK_SIZE):
+        self.data = data
+        self.size = len(data)
+        # Byte offset, editor position and row at each checkpoint
+        self._bytes = array("Q", [0])
+        self._positions = array("Q", [0])
+        self._rows = array("Q", [0])
+
+        start = 0
+        position = 0
+        row = 0
+        while start < self.size:
+            end = min(start + chunk_size, self.size)
+            # Do not split a character: skip UTF-8 continuation bytes
+            while end < self.size and data[end] & 0xC0 == 0x80:
+                end += 1
+            chunk = bytes(data[start:end])
+            position += _utf16_length(chunk.decode("utf-8", errors="replace"))
+            row += chunk.count(b"\n")
+            self._bytes.append(end)
+            self._positions.append(position)
+            self._rows.append(row)
+            start = end
+
+    def _chunk(self, index: int) -> bytes:
+        return bytes(self.data[self._bytes[index] : self._bytes[index + 1]])
+
+    def position_of_byte(self, byte: int) -> int:
+        byte = max(0, min(byte, self.size))
+        index = bisect_right(self._bytes, byte) - 1
+        start = self._bytes[index]
+        prefix = bytes(self.data[start:byte]).decode("utf-8", errors="replace")
+        return self._positions[index] + _utf16_length(prefix)
+
+    def byte_of_position(self, position: int) -> int:
+        position = max(0, min(position, self._positions[-1]))
+        index = bisect_right(self._positions, position) - 1
+        units = position - self._positions[index]
+        if not units:
+            return self._bytes[index]
+        text = self._chunk(index).decode("utf-8", errors="replace")
+        if _utf16_length(text) == len(text):
+            # One unit per character
+            prefix = text[:units]
+        else:
+            length = 0
+            count = 0
+            for char in text:
+                if count >= units:
+                    break
+                count += 2 if ord(char) > 0xFFFF else 1
+                length += 1
+            prefix = text[:length]
+        return self._bytes[index] + len(prefix.encode("utf-8", errors="replace"))
+
+    def byte_of_point(self, row: int, column: int) -> int:
+        """Return the byte offset of a tree-sitter (row, byte column) point."""
+        if row <= 0:
+            return min(max(column, 0), self.size)
+        # The first checkpoint after the line break which starts the row
+        index = bisect_right(self._rows, row - 1)
+        if index >= len(self._rows):
+            return self.size
+        start = self._bytes[index - 1]
+        chunk = self._chunk(index - 1)
+        line_start = -1
+        for _ in range(row - self._rows[index - 1]):
+            line_start = chunk.find(b"\n", line_start + 1)
+        return min(start + line_start + 1 + column, self.size)
+
+    def point_of_byte(self, byte: int) -> Tuple[int, int]:
+        byte = max(0, min(byte, self.size))
+        index = bisect_right(self._bytes, byte) - 1
+        start = self._bytes[index]
+        row = self._rows[index] + bytes(self.data[start:byte]).count(b"\n")
+        return (row, byte - self.byte_of_point(row, 0))
+
+    def position_of_point(self, row: int, column: int) -> int:
+        return self.position_of_byte(self.byte_of_point(row, column))
+
+    def point_of_position(self, position: int) -> Tuple[int, int]:
+        return self.point_of_byte(self.byte_of_position(position))
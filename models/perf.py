@@ -0,0 +1,264 @@
+"""Timings of the stages of a refresh, and profiles of whole refreshes.
+
+Stages are timed with `with monitor.timed("parse"):`. While the monitor is
+off, timed() returns a shared context manager which does nothing, so the
+timers may stay in the code at next to no cost. Timings are kept over a
+rolling window per stage, for their percentiles.
+
+Refreshes may also be profiled with cProfile: profile_next(count) profiles
+the code run under profiled(), in any thread, until end_refresh() has been
+called count times.
+
+Apart from the monitor, RefreshCosts always keeps the durations of the last
+refreshes, which set the delay before the next one.
+
+The profiler is only imported once a profile is asked for: this module is
+imported by models.ast, on the startup path of the command line too.
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, Deque, Dict, List, NamedTuple, Optional
+
+if TYPE_CHECKING:
+    import cProfile
+
+# Timings kept per stage for the percentiles
+WINDOW = 200
+
+# Stages in the order of a refresh, the order they are listed in
+STAGES = [
+    "refresh",
+    "prepare",
+    "parse",
+    "build_nodes",
+    "render_text",
+    "render_html",
+    "set_html",
+    "set_nodes",
+    "highlight",
+    "pygments",
+    "query",
+]
+
+# Functions listed in profile reports
+PROFILE_LINES = 40
+
+# Delay between an edit and the refresh, in seconds: a multiple of the
+# recent cost of refreshes, within bounds, and a default until it is known
+DEBOUNCE_FACTOR = 1.5
+MIN_DEBOUNCE = 0.03
+MAX_DEBOUNCE = 1.0
+DEFAULT_DEBOUNCE = 0.1
+
+# Refreshes the cost is estimated from
+COST_WINDOW = 8
+
+_NOT_TIMED = nullcontext()
+
+
+class StageSummary(NamedTuple):
+    """Timings of a stage, in seconds."""
+
+    stage: str
+    count: int
+    last: float
+    p50: float
+    p90: float
+    p99: float
+    max: float
+
+
+def percentile(ordered: List[float], percent: float) -> float:
+    """Return the nearest-rank percentile of sorted values."""
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+class StageStats:
+    def __init__(self, window: int = WINDOW):
+        self.timings: Deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.last = 0.0
+
+    def add(self, seconds: float):
+        self.timings.append(seconds)
+        self.count += 1
+        self.last = seconds
+
+    def summary(self, stage: str) -> StageSummary:
+        ordered = sorted(self.timings)
+        return StageSummary(
+            stage,
+            self.count,
+            self.last,
+            percentile(ordered, 50),
+            percentile(ordered, 90),
+            percentile(ordered, 99),
+            ordered[-1],
+        )
+
+
+class _StageTimer:
+    __slots__ = ("monitor", "stage", "start")
+
+    def __init__(self, monitor: "PerfMonitor", stage: str):
+        self.monitor = monitor
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.monitor.record(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class _Profiled:
+    """Profile a block in the current thread, unless it already is."""
+
+    __slots__ = ("monitor", "profile")
+
+    def __init__(self, monitor: "PerfMonitor"):
+        self.monitor = monitor
+        self.profile = None
+
+    def __enter__(self):
+        local = self.monitor._local
+        if not getattr(local, "profiling", False):
+            import cProfile
+
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Python 3.12 profiles a single thread at a time
+                return self
+            local.profiling = True
+            self.profile = profile
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.profile is not None:
+            self.profile.disable()
+            self.monitor._local.profiling = False
+            with self.monitor._lock:
+                self.monitor._profiles.append(self.profile)
+        return False
+
+
+class PerfMonitor:
+    """Stage timings, recorded from any thread while enabled."""
+
+    def __init__(self, window: int = WINDOW):
+        self.enabled = False
+        self.window = window
+        self.stages: Dict[str, StageStats] = {}
+        self._lock = threading.Lock()
+        # Refreshes still to profile, and the profiles of those done so far
+        self.profile_left = 0
+        self._profiles: List["cProfile.Profile"] = []
+        self._local = threading.local()
+
+    def timed(self, stage: str):
+        if not self.enabled:
+            return _NOT_TIMED
+        return _StageTimer(self, stage)
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = self.stages[stage] = StageStats(self.window)
+            stats.add(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.stages.clear()
+
+    def summaries(self) -> List[StageSummary]:
+        """Return the timings of the stages recorded so far, in STAGES order."""
+        with self._lock:
+            order = {stage: index for index, stage in enumerate(STAGES)}
+            names = sorted(self.stages, key=lambda s: (order.get(s, len(order)), s))
+            return [self.stages[name].summary(name) for name in names]
+
+    def profile_next(self, count: int):
+        """Profile the next count refreshes, dropping any profile under way."""
+        with self._lock:
+            self.profile_left = count
+            self._profiles = []
+
+    def profiled(self):
+        if not self.profile_left:
+            return _NOT_TIMED
+        return _Profiled(self)
+
+    def end_refresh(self) -> Optional[str]:
+        """Count a refresh as done.
+
+        Return the report of the profiles once the last refresh to profile
+        is done, else None.
+        """
+        if not self.profile_left:
+            return None
+        with self._lock:
+            self.profile_left -= 1
+            if self.profile_left:
+                return None
+            profiles, self._profiles = self._profiles, []
+        if not profiles:
+            return ""
+        import io
+        import pstats
+
+        output = io.StringIO()
+        stats = pstats.Stats(profiles[0], stream=output)
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_LINES)
+        return output.getvalue()
+
+
+class RefreshCosts:
+    """Durations of the last refreshes, which set the debounce of the next.
+
+    A refresh costing little comes right after the edits, while one costing
+    more waits for a longer pause in the edits, as it would be obsolete by
+    the next keystroke anyway.
+    """
+
+    def __init__(self, window: int = COST_WINDOW):
+        self.costs: Deque[float] = deque(maxlen=window)
+
+    def add(self, seconds: float):
+        self.costs.append(seconds)
+
+    def debounce(self) -> float:
+        """Return the delay before the next refresh, in seconds."""
+        if not self.costs:
+            return DEFAULT_DEBOUNCE
+        # The median is not thrown off by a refresh delayed by something else
+        cost = percentile(sorted(self.costs), 50)
+        return min(max(cost * DEBOUNCE_FACTOR, MIN_DEBOUNCE), MAX_DEBOUNCE)
+
+
+# The monitor of the application, off until the performance panel is opened
+monitor = PerfMonitor()
+
+
+def format_status(summaries: List[StageSummary]) -> str:
+    """Return the status bar readout: the last timing of each stage."""
+    parts = []
+    for summary in summaries:
+        part = f"{summary.stage} {summary.last * 1000:.1f} ms"
+        if summary.stage == "refresh":
+            part += (
+                f" (p50 {summary.p50 * 1000:.1f}, p90 {summary.p90 * 1000:.1f},"
+                f" n={summary.count})"
+            )
+        parts.append(part)
+    return " | ".join(parts)
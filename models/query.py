@@ -0,0 +1,181 @@
+"""Captures of tree-sitter queries, kept up to date across edits.
+
+The captures of a query over a range of a tree are kept with that tree.
+After an incremental parse, those away from the edits are shifted to their
+new positions, and the query only runs again over the changed ranges,
+widened to whole top-level nodes.
+"""
+
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+# Byte range covering any tree
+FULL_RANGE = (0, 0xFFFFFFFF)
+FULL_POINT_RANGE = ((0, 0), (0xFFFFFFFF, 0xFFFFFFFF))
+
+
+class QueryCapture(NamedTuple):
+    name: str
+    type: str
+    start_byte: int
+    end_byte: int
+    start_point: Tuple[int, int]
+    end_point: Tuple[int, int]
+
+
+class QueryResult(NamedTuple):
+    """The captures of a query in a byte range of a tree, sorted by position."""
+
+    query_text: str
+    tree: object
+    byte_range: Tuple[int, int]
+    captures: List[QueryCapture]
+
+
+def capture_key(capture: QueryCapture):
+    return (capture.start_byte, -capture.end_byte, capture.name, capture.type)
+
+
+def shift_point(point, edit) -> Tuple[int, int]:
+    """Move a point at or after the end of an edit, as Tree.edit() does."""
+    row, column = point
+    old_row, old_column = edit["old_end_point"]
+    new_row, new_column = edit["new_end_point"]
+    if row == old_row:
+        return (new_row, column - old_column + new_column)
+    return (row - old_row + new_row, column)
+
+
+def shift_byte(byte: int, edit) -> int:
+    """Move a byte offset through an edit, clamping those inside it."""
+    if byte <= edit["start_byte"] or byte == FULL_RANGE[1]:
+        return byte
+    if byte < edit["old_end_byte"]:
+        return edit["new_end_byte"]
+    return byte - edit["old_end_byte"] + edit["new_end_byte"]
+
+
+def shift_captures(captures: List[QueryCapture], edit) -> List[QueryCapture]:
+    """Move the captures through an edit, dropping those across it."""
+    start = edit["start_byte"]
+    old_end = edit["old_end_byte"]
+    delta = edit["new_end_byte"] - old_end
+    shifted = []
+    for capture in captures:
+        if capture.end_byte <= start:
+            shifted.append(capture)
+        elif capture.start_byte >= old_end:
+            shifted.append(
+                capture._replace(
+                    start_byte=capture.start_byte + delta,
+                    end_byte=capture.end_byte + delta,
+                    start_point=shift_point(capture.start_point, edit),
+                    end_point=shift_point(capture.end_point, edit),
+                )
+            )
+    return shifted
+
+
+def merge_ranges(ranges: Sequence[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Sort ranges and merge those overlapping or touching."""
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def clip_ranges(
+    ranges: Sequence[Tuple[int, int]], byte_range: Tuple[int, int]
+) -> List[Tuple[int, int]]:
+    low, high = byte_range
+    return [
+        (max(start, low), min(end, high))
+        for start, end in ranges
+        if start <= high and end >= low
+    ]
+
+
+def subtract_range(
+    byte_range: Tuple[int, int], covered: Tuple[int, int]
+) -> List[Tuple[int, int]]:
+    """Return the parts of byte_range out of covered."""
+    start, end = byte_range
+    parts = []
+    if start < covered[0]:
+        parts.append((start, min(end, covered[0])))
+    if end > covered[1]:
+        parts.append((max(start, covered[1]), end))
+    return parts
+
+
+def intersects(capture: QueryCapture, ranges: Sequence[Tuple[int, int]]) -> bool:
+    """Whether a capture is in any of the ranges, as a query sees it.
+
+    Ranges are half-open like node ranges, and an empty node at the start
+    of a range is in it.
+    """
+    end_byte = max(capture.end_byte, capture.start_byte + 1)
+    return any(capture.start_byte < end and end_byte > start for start, end in ranges)
+
+
+def top_level_range(root, start: int, end: int) -> Tuple[int, int]:
+    """Widen a byte range to the children of the root around it.
+
+    A pattern may match nodes on both sides of an edit, so the query runs
+    again over whole top-level nodes, including those just before and just
+    after the range. Only matches spanning more of them can be missed.
+    """
+    cursor = root.walk()
+    if cursor.goto_first_child_for_byte(max(start - 1, 0)) is not None:
+        start = min(start, cursor.node.start_byte)
+    cursor = root.walk()
+    if cursor.goto_first_child_for_byte(end) is not None:
+        node = cursor.node
+        if node.start_byte <= end:
+            end = max(end, node.end_byte)
+    return (start, end)
+
+
+def edited_ranges(edits: Sequence[dict]) -> List[Tuple[int, int]]:
+    """Return where the text changed, in the offsets after all the edits."""
+    ranges: List[Tuple[int, int]] = []
+    for edit in edits:
+        ranges = [(shift_byte(s, edit), shift_byte(e, edit)) for s, e in ranges]
+        ranges.append((edit["start_byte"], edit["new_end_byte"]))
+    return ranges
+
+
+def pending_ranges(
+    previous: Optional[QueryResult],
+    edits: Optional[Sequence[dict]],
+    changed: Optional[Sequence[Tuple[int, int]]],
+    root,
+    byte_range: Tuple[int, int],
+) -> Tuple[List[QueryCapture], List[Tuple[int, int]]]:
+    """Return the captures still valid in byte_range, and where to query.
+
+    Without a previous result for the tree edited into the current one,
+    nothing is kept and the query runs over the whole range.
+    """
+    if previous is None or edits is None or changed is None:
+        return [], [byte_range]
+    kept = previous.captures
+    covered = previous.byte_range
+    for edit in edits:
+        kept = shift_captures(kept, edit)
+        covered = (shift_byte(covered[0], edit), shift_byte(covered[1], edit))
+
+    dirty = [
+        top_level_range(root, start, end)
+        for start, end in list(changed) + edited_ranges(edits)
+    ]
+    dirty.extend(subtract_range(byte_range, covered))
+    dirty = merge_ranges(clip_ranges(dirty, byte_range))
+    kept = [
+        capture
+        for capture in kept
+        if not intersects(capture, dirty) and intersects(capture, [byte_range])
+    ]
+    return kept, dirty
@@ -0,0 +1,10 @@
+import pytest
+
+from models.ast import AST
+
+
+@pytest.fixture
+def python_grammar():
+    """Skip the test when the tree-sitter grammar for python is missing."""
+    if not AST().get_language("python"):
+        pytest.skip("tree-sitter grammar for python is not installed")
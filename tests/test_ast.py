@@ -1,4 +1,12 @@
-from models.ast import AST
+import random
+import threading
+
+import pytest
+
+from models import ast as ast_module
+from models.ast import AST, MATCH_INDEX, MATCH_NATIVE, _languages, compute_edit
+from models.ast_render import render_html, render_text
+from models.node_table import NodeTable
 
 
 class MockNode:
@@ -9,6 +17,8 @@ class MockNode:
         self.children = children or []
         self.is_named = is_named
         self.parent = None
+        self.id = id(self)
+        self.has_error = False
         for child in self.children:
             child.parent = self
 
@@ -20,10 +30,48 @@ class MockNode:
         return None
 
 
+class MockTreeCursor:
+    def __init__(self, node):
+        self.node = node
+        self.field_name = None
+
+    def goto_first_child(self):
+        if not self.node.children:
+            return False
+        self.node = self.node.children[0]
+        return True
+
+    def goto_next_sibling(self):
+        parent = self.node.parent
+        if parent is None:
+            return False
+        index = parent.children.index(self.node) + 1
+        if index >= len(parent.children):
+            return False
+        self.node = parent.children[index]
+        return True
+
+    def goto_parent(self):
+        if self.node.parent is None:
+            return False
+        self.node = self.node.parent
+        return True
+
+
 class MockTree:
     def __init__(self, root_node):
         self.root_node = root_node
 
+    def walk(self):
+        return MockTreeCursor(self.root_node)
+
+
+def make_nodes(ranges):
+    nodes = NodeTable()
+    for start_line, start_col, end_line, end_col in ranges:
+        nodes.append((start_line, start_col), (end_line, end_col), 0, -1, "node", True)
+    return nodes
+
 
 def test_ast_initialization():
     ast = AST()
@@ -31,7 +79,7 @@ def test_ast_initialization():
     assert ast.language is None
     assert ast.parser is not None
     assert ast.tree is None
-    assert ast.line_range == {}
+    assert len(ast.nodes) == 0
 
 
 def test_get_plain_text():
@@ -63,28 +111,36 @@ def test_get_plain_text():
     assert "module" in lines[0]
     assert "function" in lines[1]
     assert "variable" in lines[4]
+    assert lines[2] == "    identifier [1, 4] - [1, 7]"
+    assert lines[3] == "    [anonymous] parameters [1, 7] - [1, 9]"
+    assert lines[4] == "  variable [2, 0] - [2, 5]"
+
+    assert list(ast.nodes.depth) == [0, 1, 2, 2, 1]
+    assert list(ast.nodes.parent) == [-1, 0, 1, 1, 0]
 
 
 def test_get_match_ast_line():
     ast = AST()
-    ast.line_range = {
-        100: [12, 0, 28, 21],  # Function
-        101: [12, 0, 12, 3],  # def
-        102: [12, 4, 12, 8],  # name
-        105: [13, 4, 28, 21],  # body
-        106: [13, 4, 13, 32],  # expression
-        108: [15, 4, 15, 29],  # comment
-        120: [28, 4, 28, 21],  # return statement
-        121: [28, 4, 28, 10],  # return
-    }
+    ast.nodes = make_nodes(
+        [
+            [12, 0, 28, 21],  # 0: Function
+            [12, 0, 12, 3],  # 1: def
+            [12, 4, 12, 8],  # 2: name
+            [13, 4, 28, 21],  # 3: body
+            [13, 4, 13, 32],  # 4: expression
+            [15, 4, 15, 29],  # 5: comment
+            [28, 4, 28, 21],  # 6: return statement
+            [28, 4, 28, 10],  # 7: return
+        ]
+    )
 
     # Test exact match
-    assert ast.get_match_ast_line(12, 0) == 101
-    assert ast.get_match_ast_line(12, 3) == 101
-    assert ast.get_match_ast_line(12, 5) == 102
-    assert ast.get_match_ast_line(12, 7) == 102
-    assert ast.get_match_ast_line(12, 404) == 100
-    assert ast.get_match_ast_line(28, 7) == 121
+    assert ast.get_match_ast_line(12, 0) == 1
+    assert ast.get_match_ast_line(12, 3) == 1
+    assert ast.get_match_ast_line(12, 5) == 2
+    assert ast.get_match_ast_line(12, 7) == 2
+    assert ast.get_match_ast_line(12, 404) == 0
+    assert ast.get_match_ast_line(28, 7) == 7
 
     # Test no match
     assert ast.get_match_ast_line(300, 0) is None
@@ -92,22 +148,350 @@ def test_get_match_ast_line():
 
 def test_get_code_range():
     ast = AST()
-    ast.line_range = {
-        100: [12, 0, 28, 21],  # Function
-        101: [12, 0, 12, 3],  # def
-        102: [12, 4, 12, 8],  # name
-        105: [13, 4, 28, 21],  # body
-        106: [13, 4, 13, 32],  # expression
-        108: [15, 4, 15, 29],  # comment
-        120: [28, 4, 28, 21],  # return statement
-        121: [28, 4, 28, 10],  # return
-    }
+    ast.nodes = make_nodes(
+        [
+            [12, 0, 28, 21],  # 0: Function
+            [12, 0, 12, 3],  # 1: def
+            [12, 4, 12, 8],  # 2: name
+            [13, 4, 28, 21],  # 3: body
+            [13, 4, 13, 32],  # 4: expression
+            [15, 4, 15, 29],  # 5: comment
+            [28, 4, 28, 21],  # 6: return statement
+            [28, 4, 28, 10],  # 7: return
+        ]
+    )
 
     # Test existing line
-    assert ast.get_code_range(100) == [12, 0, 28, 21]
-    assert ast.get_code_range(101) == [12, 0, 12, 3]
-    assert ast.get_code_range(102) == [12, 4, 12, 8]
-    assert ast.get_code_range(105) == [13, 4, 28, 21]
+    assert ast.get_code_range(0) == [12, 0, 28, 21]
+    assert ast.get_code_range(1) == [12, 0, 12, 3]
+    assert ast.get_code_range(2) == [12, 4, 12, 8]
+    assert ast.get_code_range(3) == [13, 4, 28, 21]
 
     # Test non-existing line
     assert ast.get_code_range(999) == [-1, -1, -1, -1]
+    assert ast.get_code_range(-1) == [-1, -1, -1, -1]
+
+
+def test_compute_edit():
+    assert compute_edit(b"abc", b"abc") is None
+
+    # Insert a line in the middle
+    edit = compute_edit(b"a = 1\nb = 2\n", b"a = 1\nx\nb = 2\n")
+    assert edit["start_byte"] == 6
+    assert edit["old_end_byte"] == 6
+    assert edit["new_end_byte"] == 8
+    assert edit["start_point"] == (1, 0)
+    assert edit["old_end_point"] == (1, 0)
+    assert edit["new_end_point"] == (2, 0)
+
+    # Delete part of a line
+    edit = compute_edit(b"foo(bar)\n", b"foo()\n")
+    assert edit["start_byte"] == 4
+    assert edit["old_end_byte"] == 7
+    assert edit["new_end_byte"] == 4
+    assert edit["old_end_point"] == (0, 7)
+    assert edit["new_end_point"] == (0, 4)
+
+    # Repeated characters must not make prefix and suffix overlap
+    edit = compute_edit(b"aaaa", b"aaaaaa")
+    assert edit["start_byte"] == 4
+    assert edit["old_end_byte"] == 4
+    assert edit["new_end_byte"] == 6
+
+
+def test_load_incremental(python_grammar):
+    ast = AST()
+    ast.load("python", "def foo():\n    return 1\n")
+    assert ast.old_tree is None
+
+    content = "def foo():\n    x = 2\n    return x\n"
+    ast.load("python", content)
+    assert ast.old_tree is not None
+
+    fresh = AST()
+    fresh.load("python", content)
+    assert str(ast.tree.root_node) == str(fresh.tree.root_node)
+    assert ast.get_plain_text() == fresh.get_plain_text()
+    # The new statement on row 1 changed the syntax
+    assert any(first <= 1 <= last for first, last in ast.changed_rows())
+
+    # The same content again changes nothing, and leaves no edit pending
+    ast.prepare("python", content)
+    ast.prepare("python", content)
+    assert ast.old_tree is ast.tree
+    assert ast.edits == []
+    assert ast.changed_rows() == []
+    content = content.replace("x = 2", "x = [2]")
+    ast.load("python", content)
+    fresh.load("python", content)
+    assert str(ast.tree.root_node) == str(fresh.tree.root_node)
+    assert ast.get_plain_text() == fresh.get_plain_text()
+    assert len(ast.edits) == 1
+    assert any(first <= 1 <= last for first, last in ast.changed_rows())
+
+    # Switching language always does a full parse
+    ast.load("javascript", "let x = 1;\n")
+    assert ast.old_tree is None
+    assert ast.changed_rows() is None
+
+
+SHAPES = "".join(f"def f{n}(x):\n    return x + {n}\n" for n in range(100))
+
+
+@pytest.mark.parametrize(
+    "old, new",
+    [
+        ("x + 50", "x * 2 + 50"),
+        ("    return x + 50", "    y = 1\n    return x + 50"),
+        ("def f99(x):\n    return x + 99\n", ""),
+        ("def f0(x):", "def f0(x, y):"),
+    ],
+)
+def test_node_table_diff(python_grammar, old, new):
+    ast = AST()
+    ast.load("python", SHAPES)
+    old_nodes = ast.build_nodes()
+    assert old_nodes.diff(old_nodes) == []
+    ast.load("python", SHAPES.replace(old, new))
+    nodes = ast.build_nodes()
+    row_diffs = nodes.diff(old_nodes)
+
+    # Replacing the spans of old lines by the new ones gives the new dump
+    lines = render_text(old_nodes.records()).split("\n")
+    new_lines = render_text(nodes.records()).split("\n")
+    for span in reversed(row_diffs):
+        assert span.first < span.old_stop and span.first < span.new_stop
+        lines[span.first : span.old_stop] = new_lines[span.first : span.new_stop]
+    assert lines == new_lines
+    if "\n" not in new:
+        # The rows of the other functions are left alone
+        assert sum(span.new_stop - span.first for span in row_diffs) < 20
+
+    # Tables which do not number their names alike have nothing in common
+    other = AST()
+    other.load("python", "import os\n")
+    assert nodes.diff(other.build_nodes()) is None
+    assert nodes.diff(NodeTable()) is None
+
+
+def test_parse_cancelled(python_grammar, monkeypatch):
+    ast = AST()
+    # Slices short enough to check for the cancellation several times
+    monkeypatch.setattr(ast_module, "PARSE_SLICE_MICROS", 100)
+    content = "def foo(x):\n    return [x * i for i in range(10)]\n" * 2000
+    checks = []
+
+    def is_cancelled():
+        checks.append(True)
+        return len(checks) > 2
+
+    ast.prepare("python", content)
+    assert ast.parse(is_cancelled) is False
+    assert ast.tree is None
+    assert len(checks) == 3
+
+    # The parser starts afresh, and the AST may still be parsed
+    assert ast.parse(lambda: False) is True
+    expected = AST()
+    expected.load("python", content)
+    assert str(ast.tree.root_node) == str(expected.tree.root_node)
+
+    # A cancelled incremental parse leaves the edits for the next one
+    ast.prepare("python", content + "x = 1\n")
+    assert ast.parse(lambda: True) is False
+    ast.load("python", content + "x = 1\ny = 2\n")
+    assert len(ast.edits) == 2
+    expected.load("python", content + "x = 1\ny = 2\n")
+    assert ast.get_plain_text() == expected.get_plain_text()
+
+
+def test_load_buffer(python_grammar, monkeypatch):
+    ast = AST()
+    content = "def foo():\n    return 'ü'\n" * 50
+    expected = AST()
+    expected.load("python", content)
+
+    # Buffers are read by the parser in chunks, not copied
+    monkeypatch.setattr(ast_module, "READ_CHUNK_SIZE", 7)
+    ast.load("python", memoryview(content.encode("utf8")))
+    assert ast.get_plain_text() == expected.get_plain_text()
+
+    # The first edit diffs the buffer with the new text
+    ast.load("python", content + "x = 1\n")
+    assert ast.old_tree is not None
+    expected.load("python", content + "x = 1\n")
+    assert ast.get_plain_text() == expected.get_plain_text()
+
+
+def test_language_and_parser_cache(python_grammar):
+    ast = AST()
+    other = AST()
+    assert ast.get_language("python") is other.get_language("python")
+    assert ast.get_parser("python") is other.get_parser("python")
+    # Each thread has parsers of its own
+    parsers = []
+    thread = threading.Thread(target=lambda: parsers.append(other.get_parser("python")))
+    thread.start()
+    thread.join()
+    assert parsers[0] is not None
+    assert parsers[0] is not ast.get_parser("python")
+
+    # Failed lookups are cached as well
+    assert ast.get_language("no-such-language") is None
+    assert "no-such-language" in _languages
+    assert ast.get_parser("no-such-language") is None
+    with pytest.raises(Exception) as exc_info:
+        ast.load("no-such-language", "text")
+    assert "cannot find tree-sitter driver" in str(exc_info.value)
+
+
+def test_get_match_ast_line_random():
+    def linear_match(ranges, line, column):
+        candidates = [
+            (abs(end_line - start_line), abs(end_col - start_col), index)
+            for index, (start_line, start_col, end_line, end_col) in enumerate(ranges)
+            if (start_line, start_col) <= (line, column) <= (end_line, end_col)
+        ]
+        return min(candidates)[2] if candidates else None
+
+    rng = random.Random(1)
+    for _ in range(20):
+        ranges = []
+        for _ in range(rng.randint(1, 60)):
+            start = (rng.randint(0, 8), rng.randint(0, 8))
+            end = max(start, (rng.randint(0, 8), rng.randint(0, 8)))
+            ranges.append([start[0], start[1], end[0], end[1]])
+        ast = AST()
+        ast.nodes = make_nodes(ranges)
+        for line in range(10):
+            for column in range(10):
+                assert ast.get_match_ast_line(line, column) == linear_match(
+                    ranges, line, column
+                )
+
+
+def test_get_match_ast_line_native(python_grammar):
+    ast = AST()
+    ast.load("python", "def foo(a, b):\n    return a + b\n")
+    lines = ast.get_plain_text().split("\n")
+    assert "    name: identifier [1, 4] - [1, 7]" in lines
+
+    for line, column, node_type in [
+        (0, 5, "identifier"),
+        (1, 6, "return"),
+        (1, 11, "identifier"),
+        (1, 13, "+"),
+    ]:
+        ast.match_mode = MATCH_INDEX
+        index = ast.get_match_ast_line(line, column)
+        ast.match_mode = MATCH_NATIVE
+        assert ast.get_match_ast_line(line, column) == index
+        assert f"{node_type} [{line + 1}, " in lines[index]
+
+    assert ast.get_match_ast_line(300, 0) is None
+
+
+def test_render_html():
+    ast = AST()
+    root = MockNode(
+        "binary_expression",
+        (0, 0),
+        (0, 5),
+        [
+            MockNode("identifier", (0, 0), (0, 1)),
+            MockNode("<", (0, 2), (0, 3), [], False),
+            MockNode("identifier", (0, 4), (0, 5)),
+        ],
+    )
+    ast.tree = MockTree(root)
+
+    records = list(ast.iter_records())
+    assert [record.type for record in records] == [
+        "binary_expression",
+        "identifier",
+        "<",
+        "identifier",
+    ]
+    assert render_text(records) == ast.get_plain_text()
+
+    html = render_html(records)
+    assert (
+        "<div style='normal'><span style='type'>binary_expression</span>"
+        " <span style='range'>[1, 0] - [1, 5]</span></div>"
+    ) in html
+    assert (
+        "<div style='anonymous'><span style='indent'>  </span>"
+        "<span style='type'>&lt;</span>"
+        " <span style='range'>[1, 2] - [1, 3]</span></div>"
+    ) in html
+
+
+def test_query(python_grammar):
+    ast = AST()
+    content = "def f():\n    return 1\n\ndef g():\n    pass\n"
+    ast.load("python", content)
+    query_text = "(function_definition name: (identifier) @name) @fn"
+
+    captures = ast.query(query_text)
+    assert [(c.name, c.type, c.start_point) for c in captures] == [
+        ("fn", "function_definition", (0, 0)),
+        ("name", "identifier", (0, 4)),
+        ("fn", "function_definition", (3, 0)),
+        ("name", "identifier", (3, 4)),
+    ]
+    # Compiled queries are cached per language and text
+    other = AST()
+    other.load("python", "x = 1\n")
+    assert ast.get_query(query_text) is other.get_query(query_text)
+
+    # Ranges limit the matches, and do not stick to the cached query
+    start = content.index("def g")
+    assert [c.start_point for c in ast.query(query_text, (start, len(content)))] == [
+        (3, 0),
+        (3, 4),
+    ]
+    assert len(ast.query(query_text, point_range=((0, 0), (1, 0)))) == 2
+    assert len(ast.query(query_text)) == 4
+
+    # The AST dump line of each capture
+    lines = ast.get_plain_text().split("\n")
+    assert [lines[ast.get_capture_line(c)].strip() for c in captures[:2]] == [
+        "function_definition [1, 0] - [2, 12]",
+        "name: identifier [1, 4] - [1, 5]",
+    ]
+
+    with pytest.raises(Exception):
+        ast.get_query("(no_such_node) @x")
+
+
+def test_query_captures_incremental(python_grammar):
+    ast = AST()
+    query_text = (
+        "(function_definition name: (identifier) @name"
+        " body: (block (return_statement) @ret)) @fn\n"
+        "(identifier) @id"
+    )
+    rng = random.Random(0)
+    base = "".join(f"def f{i}(x):\n    return x + {i}\n\n" for i in range(20))
+    pieces = ["x", "\n", "return 1\n", "def ", "(", ")", " ", "    ", ":"]
+    for trial in range(40):
+        content = base
+        ast = AST()
+        ast.load("python", content)
+        byte_range = (0, 0xFFFFFFFF) if trial % 2 else (100, 400)
+        result = ast.query_captures(query_text, byte_range)
+        for _ in range(5):
+            position = rng.randrange(len(content) + 1)
+            end = position + rng.randrange(0, 4)
+            content = content[:position] + rng.choice(pieces) + content[end:]
+            new = ast.fork()
+            new.load("python", content)
+            ast = new
+            result = ast.query_captures(query_text, byte_range, result)
+            # Same as running the query afresh on the same tree
+            assert (
+                result.captures == ast.query_captures(query_text, byte_range).captures
+            )
+
+    # Nothing changed: the result is reused as is
+    assert ast.query_captures(query_text, byte_range, result) is result
@@ -0,0 +1,164 @@
+import io
+import json
+import subprocess
+import sys
+
+import pytest
+
+from controllers import batch
+from controllers.cli import main
+from models.ast import AST
+
+SOURCE = "def f():\n    return 1\n"
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path, monkeypatch):
+    # Keep the node table cache out of the home directory
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    return tmp_path / "cache"
+
+
+@pytest.fixture
+def source_file(python_grammar, tmp_path):
+    path = tmp_path / "a.py"
+    path.write_text(SOURCE)
+    return str(path)
+
+
+def test_dump_text(source_file, capsys):
+    assert main(["dump", source_file]) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "module [1, 0] - [3, 0]"
+    assert lines[3] == "    name: identifier [1, 4] - [1, 5]"
+
+    ast = AST()
+    ast.load("python", SOURCE)
+    assert "\n".join(lines) == ast.get_plain_text()
+
+
+def test_dump_json_and_sexp(source_file, capsys):
+    assert main(["dump", "--format", "json", source_file]) == 0
+    result = json.loads(capsys.readouterr().out)
+    assert result["language"] == "python"
+    assert result["nodes"][3] == {
+        "depth": 2,
+        "field": "name",
+        "type": "identifier",
+        "named": True,
+        "start": [0, 4],
+        "end": [0, 5],
+    }
+
+    assert main(["dump", "-f", "sexp", source_file]) == 0
+    assert capsys.readouterr().out.startswith("(module (function_definition")
+
+
+def test_dump_errors(source_file, tmp_path, capsys):
+    unknown = tmp_path / "a.unknown-extension"
+    unknown.write_text("x")
+    assert main(["dump", str(unknown), source_file]) == 1
+    captured = capsys.readouterr()
+    assert "unknown language" in captured.err
+    assert f"==> {source_file} <==" in captured.out
+
+
+def test_batch(source_file, tmp_path, capsys):
+    root = tmp_path / "tree"
+    (root / "sub").mkdir(parents=True)
+    (root / ".hidden").mkdir()
+    (root / "a.py").write_text(SOURCE)
+    (root / "sub" / "b.py").write_text("def (:\n")
+    (root / "sub" / "c.unknown-extension").write_text("x")
+    (root / ".hidden" / "d.py").write_text(SOURCE)
+    output_dir = tmp_path / "out"
+
+    for _ in range(2):
+        # The second run reads the node tables from the cache
+        assert (
+            main(["batch", "--cache", "-j", "2", "-o", str(output_dir), str(root)]) == 0
+        )
+        summary = capsys.readouterr().err
+        assert "parsed 2 files" in summary
+        assert "python: 2 files, 1 with syntax errors, 0 failed" in summary
+    assert sorted(
+        str(p.relative_to(output_dir)) for p in output_dir.rglob("*.txt")
+    ) == ["a.py.txt", "sub/b.py.txt"]
+    assert (output_dir / "a.py.txt").read_text().startswith("module [1, 0] - [3, 0]")
+
+    assert main(["batch", "-f", "sexp", source_file]) == 0
+    assert capsys.readouterr().out.startswith("(module (function_definition")
+
+
+def test_dump_cache(source_file, cache_home, capsys):
+    # Only used when asked for
+    assert main(["dump", source_file]) == 0
+    text = capsys.readouterr().out
+    assert not cache_home.exists()
+
+    assert main(["dump", "--cache", source_file]) == 0
+    assert capsys.readouterr().out == text
+    entries = list((cache_home / "tree-sitter-playground").iterdir())
+    assert len(entries) == 1
+
+    # The cached node table alone gives the same dump
+    assert main(["dump", "--cache", source_file]) == 0
+    assert capsys.readouterr().out == text
+
+    assert main(["dump", "-f", "json", source_file]) == 0
+    capsys.readouterr()
+    assert len(list((cache_home / "tree-sitter-playground").iterdir())) == 1
+
+    cache_dir = cache_home / "elsewhere"
+    assert main(["dump", "--cache-dir", str(cache_dir), source_file]) == 0
+    assert len(list(cache_dir.iterdir())) == 1
+
+
+def test_dump_without_qt(source_file):
+    code = (
+        "import sys\n"
+        "from controllers.cli import main\n"
+        "main(['dump', '-l', 'python', '-'])\n"
+        "assert 'PySide6' not in sys.modules, 'PySide6'\n"
+        "assert 'pygments' not in sys.modules, 'pygments'\n"
+        "assert 'cProfile' not in sys.modules, 'cProfile'\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        input=SOURCE,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.startswith("module [1, 0] - [3, 0]")
+
+
+def test_detect_language(source_file, tmp_path, monkeypatch, capsys):
+    script = tmp_path / "tree" / "run"
+    script.parent.mkdir()
+    script.write_text("#!/usr/bin/env python3\n" + SOURCE)
+    (tmp_path / "tree" / "notes").write_text("hello\n")
+    assert main(["batch", str(script.parent)]) == 0
+    assert "python: 1 files" in capsys.readouterr().err
+
+    # The workers detect the language, the parent only reads the names
+    with monkeypatch.context() as patch:
+        patch.setattr(batch, "detect_language", None)
+        groups = batch.collect_files([str(script.parent), source_file])
+    assert groups == {
+        None: [
+            (str(script.parent), str(script.parent / "notes")),
+            (str(script.parent), str(script)),
+        ],
+        "python": [(str(tmp_path), source_file)],
+    }
+    results = batch.parse_files(None, [path for _, path in groups[None]], None)
+    assert [(result.path, result.language) for result in results] == [
+        (str(script), "python")
+    ]
+
+    # Standard input is sniffed too
+    stdin = io.TextIOWrapper(io.BytesIO(script.read_bytes()))
+    monkeypatch.setattr(sys, "stdin", stdin)
+    assert main(["dump"]) == 0
+    assert capsys.readouterr().out.startswith("module [1, 0] - [4, 0]")
@@ -1,5 +1,8 @@
+import mmap
+
 import pytest
 
+from models import document
 from models.document import Document
 from models.lang_map import get_language, supported_languages
 
@@ -40,3 +43,41 @@ def test_supported_languages():
     assert get_language("test.js") == "javascript"
     assert get_language("test.cpp") == "cpp"
     assert get_language("Dockerfile") == "dockerfile"
+
+
+def test_load_file(tmp_path, monkeypatch):
+    path = tmp_path / "test.py"
+    path.write_bytes("s = 'ü'\n".encode("utf-8"))
+
+    doc = Document()
+    doc.load_file(str(path))
+    assert doc.file_path == str(path)
+    assert doc.content == "s = 'ü'\n"
+    assert doc.data == "s = 'ü'\n".encode("utf-8")
+
+    # Large files are memory-mapped
+    monkeypatch.setattr(document, "MMAP_MIN_SIZE", 0)
+    doc.load_file(str(path))
+    assert isinstance(doc.data, mmap.mmap)
+    assert doc.data[:] == "s = 'ü'\n".encode("utf-8")
+    doc.data.close()
+
+    # Line ends are normalized for the editor, so the bytes do not match
+    path.write_bytes(b"a = 1\r\nb = 2\r\n")
+    doc.load_file(str(path))
+    assert doc.content == "a = 1\nb = 2\n"
+    assert doc.data is None
+
+
+def test_set_language_from_content(tmp_path):
+    path = tmp_path / "run"
+    path.write_bytes(b"#!/usr/bin/env python3\nprint(1)\n")
+    document = Document()
+    document.load_file(str(path))
+    document.set_language_from_extension()
+    assert document.language == "python"
+
+    path.write_bytes(b"hello\r\n")
+    document.load_file(str(path))
+    with pytest.raises(Exception, match="unknown language"):
+        document.set_language_from_extension()
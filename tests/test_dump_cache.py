@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+from models import dump_cache
+from models.ast import AST
+from models.dump_cache import DumpCache
+from models.node_table import NodeTable
+
+
+def make_table(count=3):
+    nodes = NodeTable()
+    for i in range(count):
+        nodes.append((i, 0), (i, 5), i, i - 1, f"type{i}", i % 2 == 0, "name", 100 + i)
+    return nodes
+
+
+def test_node_table_bytes():
+    nodes = make_table()
+    nodes.has_error = True
+    loaded = NodeTable.from_bytes(nodes.to_bytes())
+    assert list(loaded.records()) == list(nodes.records())
+    assert loaded.parent.tolist() == [-1, 0, 1]
+    assert loaded.has_error
+    assert not loaded.has_node_ids
+
+    with pytest.raises(ValueError):
+        NodeTable.from_bytes(nodes.to_bytes()[:-1])
+
+
+def test_get_and_put(tmp_path):
+    cache = DumpCache(str(tmp_path))
+    assert cache.get(b"x", "python") is None
+
+    cache.put(b"x", "python", make_table())
+    assert len(cache.get(b"x", "python")) == 3
+    assert cache.get(b"y", "python") is None
+    assert cache.get(b"x", "javascript") is None
+
+    # A new grammar version invalidates the entry
+    dump_cache._grammar_versions["python"] = "tree-sitter-python=99"
+    try:
+        assert cache.get(b"x", "python") is None
+    finally:
+        del dump_cache._grammar_versions["python"]
+
+    # Unreadable entries are dropped
+    path = os.path.join(str(tmp_path), cache.key(b"x", "python") + ".nodes")
+    with open(path, "wb") as file:
+        file.write(b"garbage")
+    assert cache.get(b"x", "python") is None
+    assert not os.path.exists(path)
+
+
+def test_put_replaces(tmp_path):
+    cache = DumpCache(str(tmp_path))
+    cache.put(b"x", "python", make_table())
+    size = cache._size
+    # Replacing an entry does not count it twice
+    cache.put(b"x", "python", make_table())
+    assert cache._size == size == cache._scan_size()
+
+
+def test_lru_eviction(tmp_path):
+    entry_size = len(make_table().to_bytes())
+    cache = DumpCache(str(tmp_path), max_size=entry_size * 2)
+    cache.put(b"a", "python", make_table())
+    cache.put(b"b", "python", make_table())
+    path_a = os.path.join(str(tmp_path), cache.key(b"a", "python") + ".nodes")
+    path_b = os.path.join(str(tmp_path), cache.key(b"b", "python") + ".nodes")
+    os.utime(path_a, (1, 1))
+    os.utime(path_b, (2, 2))
+    # Reading "a" makes "b" the least recently used entry
+    assert cache.get(b"a", "python") is not None
+
+    cache.put(b"c", "python", make_table())
+    assert cache.get(b"b", "python") is None
+    assert cache.get(b"a", "python") is not None
+    assert cache.get(b"c", "python") is not None
+
+
+def test_ast_with_cache(python_grammar, tmp_path):
+    ast = AST()
+    ast.cache = DumpCache(str(tmp_path))
+    ast.load("python", "x = (\n")
+    text = ast.get_plain_text()
+    assert ast.nodes.has_error
+
+    # A hit needs no parse at all
+    cached = AST()
+    cached.cache = ast.cache
+    cached.prepare("python", "x = (\n")
+    assert cached.get_plain_text() == text
+    assert cached.tree is None
+    assert cached.nodes.has_error
@@ -0,0 +1,66 @@
+import pytest
+
+from models.ast import AST
+from models.lang_detect import (
+    detect_language,
+    needs_detection,
+    sniff_language,
+    trial_parse,
+)
+
+
+@pytest.mark.parametrize(
+    "head, language",
+    [
+        (b"#!/usr/bin/env python3\nprint(1)\n", "python"),
+        (b"#!/usr/bin/python3.11 -u\n", "python"),
+        (b"#! /bin/sh\necho\n", "bash"),
+        (b"#!/usr/bin/env -S node --no-warnings\n", "javascript"),
+        (b"# -*- mode: ruby; coding: utf-8 -*-\n", "ruby"),
+        (b"// -*- C++ -*-\n", "cpp"),
+        (b"#\n# vim: set ft=perl :\n", "perl"),
+        (b"<html>\n<?php echo 1; ?>\n", "php"),
+        (b"\n<!DOCTYPE html>\n", "html"),
+        (b"hello world\n", None),
+        (b"", None),
+    ],
+)
+def test_sniff_language(head, language):
+    assert sniff_language(head) == language
+
+
+def test_trial_parse():
+    languages = ["bitbake", "pascal", "cpp"]
+    if not all(AST().get_language(language) for language in languages):
+        pytest.skip("tree-sitter grammars are not installed")
+    assert trial_parse(b"#define X 1\nint f(void);\n", languages) == "cpp"
+    assert (
+        trial_parse(b"unit Foo;\ninterface\nconst X = 1;\nend.\n", languages)
+        == "pascal"
+    )
+    assert trial_parse(b'SRC_URI = "file://x"\n', languages) == "bitbake"
+    # Without a grammar, a candidate is left out
+    assert trial_parse(b"int x;\n", ["no-such-language", "cpp"]) == "cpp"
+
+
+def test_detect_language(tmp_path):
+    if not AST().get_language("objc"):
+        pytest.skip("tree-sitter grammar for objc is not installed")
+    assert detect_language("a.py", b"#!/bin/sh\n") == "python"
+    assert detect_language("a.h", b"@interface Foo : NSObject\n@end\n") == "objc"
+    assert detect_language("a.h", b"int f(int x);\n") == "cpp"
+    assert detect_language("a.h", b"@interface Foo\n", trial=False) == "cpp"
+    assert detect_language("a.unknown-extension", b"x") is None
+
+    script = tmp_path / "run"
+    script.write_bytes(b"#!/usr/bin/env python\n")
+    assert detect_language(str(script)) == "python"
+    assert detect_language(str(tmp_path / "missing")) is None
+
+
+def test_needs_detection():
+    assert needs_detection("dir.d/run")
+    assert needs_detection("a.H")
+    assert needs_detection("a.inc")
+    assert not needs_detection("a.py")
+    assert not needs_detection("a.unknown-extension")
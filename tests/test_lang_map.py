@@ -0,0 +1,55 @@
+from models.lang_map import (
+    classify,
+    compile_globs,
+    file_to_lang_map,
+    get_language,
+    glob_index,
+)
+
+
+def test_get_language():
+    assert get_language("src/main.py") == "python"
+    assert get_language("a.C") == "cpp"
+    assert get_language("a.S") == "asm"
+    assert get_language("CMakeLists.txt") == "cmake"
+    assert get_language("x/Makefile") == "make"
+    assert get_language("noext") is None
+    assert get_language("a.") is None
+
+
+def test_globs():
+    assert "Dockerfile.dev" in file_to_lang_map
+    assert file_to_lang_map["Dockerfile.dev"] == "dockerfile"
+    assert file_to_lang_map.get("app.dockerfile") == "dockerfile"
+    assert get_language("requirements-dev.txt") == "requirements"
+    assert "notes.txt" not in file_to_lang_map
+    assert file_to_lang_map.get("notes.txt") is None
+
+
+def test_compile_globs():
+    # Patterns with several stars, which fnmatch translates with groups of
+    # its own on older Pythons
+    regex = compile_globs(["*.min.*.js", "a*b*c", "*.txt"])
+    assert glob_index(regex.match("app.min.v2.js")) == 0
+    assert glob_index(regex.match("axbyc")) == 1
+    assert glob_index(regex.match("notes.txt")) == 2
+    assert regex.match("app.js") is None
+
+
+def test_classify():
+    paths = ["a.py", "b/Makefile", "c.unknown", "d/e.py", "Dockerfile"]
+    assert classify(paths) == {
+        "python": ["a.py", "d/e.py"],
+        "make": ["b/Makefile"],
+        "dockerfile": ["Dockerfile"],
+    }
+    for path in paths:
+        assert get_language(path) == next(
+            (lang for lang, group in classify(paths).items() if path in group),
+            None,
+        )
+
+
+def test_get_language_is_quiet(capsys):
+    get_language("quiet.py")
+    assert capsys.readouterr().err == ""
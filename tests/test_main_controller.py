@@ -1,9 +1,22 @@
+import os
+import subprocess
+import sys
+import time
+
 import pytest
-from PySide6.QtCore import Qt
-from PySide6.QtGui import QColor, QPalette
+from PySide6.QtCore import QCoreApplication, Qt
+from PySide6.QtGui import QColor, QPalette, QTextCursor
 from PySide6.QtWidgets import QApplication
 
+from controllers import main_controller as main_controller_module
 from controllers.main_controller import MainController
+from controllers.parse_worker import ParseJob, ParseSignals
+from models import ast as ast_module
+from models.ast import AST
+from models.ast_render import render_html
+from models.dump_cache import DumpCache
+from models.perf import monitor
+from views.ast_view import AstView
 from views.main_window import MainWindow
 
 
@@ -34,6 +47,8 @@ def controller(main_window):
         controller._blink_timer.stop()
     if controller._timer.isActive():
         controller._timer.stop()
+    controller._cursor_sync_timer.stop()
+    controller._pool.waitForDone()
 
 
 def test_initialization(controller):
@@ -63,6 +78,40 @@ def test_blink_animation(controller):
     assert controller._blinking_editor is None
 
 
+def test_blink_restores_selection(controller):
+    doc_edit = controller.window.doc_edit
+    doc_edit.setPlainText("hello world")
+    cursor = doc_edit.textCursor()
+    cursor.setPosition(6)
+    cursor.setPosition(11, QTextCursor.KeepAnchor)
+    doc_edit.setTextCursor(cursor)
+
+    # The range blinks as an extra selection, over no real selection
+    controller._start_blink_animation(doc_edit)
+    assert not doc_edit.textCursor().hasSelection()
+    controller._blink_selection()
+    (selection,) = doc_edit.extraSelections()
+    assert selection.cursor.selectedText() == "world"
+    assert selection.format.background().color() == QColor(Qt.yellow)
+
+    controller._blink_count = 4
+    controller._blink_selection()
+    assert doc_edit.extraSelections() == []
+    assert doc_edit.textCursor().selectedText() == "world"
+
+
+def test_cursor_sync_coalesced(controller):
+    calls = []
+    controller._schedule_cursor_sync(lambda: calls.append("doc"))
+    controller._schedule_cursor_sync(lambda: calls.append("ast"))
+    assert calls == []
+    assert controller._cursor_sync_timer.isActive()
+
+    controller._cursor_sync_timer.stop()
+    controller._sync_cursor()
+    assert calls == ["ast"]
+
+
 def test_theme_handling(controller):
     # Test light mode
     controller.handle_theme_changed(False)
@@ -75,3 +124,456 @@ def test_theme_handling(controller):
     palette = controller.window.doc_edit.palette()
     assert palette.color(QPalette.ColorRole.Base) == QColor(Qt.black)
     assert palette.color(QPalette.ColorRole.Text) == QColor(Qt.white)
+
+
+def test_virtual_ast(python_grammar, controller):
+    controller.set_virtual_ast(True)
+    assert controller.window.ast_stack.currentWidget() is controller.window.ast_list
+
+    controller.ast_edit_load("python", "x = 1\n")
+    model = controller.window.ast_list.model()
+    assert model.rowCount() == len(controller.ast.nodes)
+    assert model.data(model.index(0)) == "module [1, 0] - [2, 0]"
+
+    # Cursor on "x" selects the identifier row
+    controller.window.doc_edit.setPlainText("x = 1\n")
+    controller.highlight_ast_region()
+    assert controller.window.ast_list.current_row() == 3
+
+    controller.set_virtual_ast(False)
+    assert controller.window.ast_stack.currentWidget() is controller.window.ast_edit
+
+
+def wait_for_refresh(controller):
+    while controller._running_generation is not None:
+        controller._pool.waitForDone()
+        QCoreApplication.processEvents()
+
+
+def test_refresh_async(python_grammar, controller):
+    controller.document.language = "python"
+    controller.on_text_changed("x = 1\n")
+    wait_for_refresh(controller)
+    assert controller.ast.content == b"x = 1\n"
+    assert controller.window.ast_edit.toPlainText().startswith("module [1, 0] - [2, 0]")
+
+    # An edit made while the job runs drops its result and parses again
+    controller.on_text_changed("y = 2\n")
+    controller.handle_text_changed()
+    controller.on_text_changed("z = 3\n")
+    wait_for_refresh(controller)
+    assert controller.ast.content == b"z = 3\n"
+    assert controller._refresh_pending is False
+
+
+def test_ast_patched(python_grammar, controller):
+    source = "".join(f"def f{n}(x):\n    return x + {n}\n" for n in range(200))
+    controller.document.language = "python"
+    controller.ast_edit_load("python", source)
+    # Laid out as shown
+    controller.window.show()
+    QCoreApplication.processEvents()
+    ast_edit = controller.window.ast_edit
+    scroll_bar = ast_edit.verticalScrollBar()
+    scroll_bar.setValue(scroll_bar.maximum() // 4)
+    position = scroll_bar.value()
+    # Marks the lines which are not rendered again
+    ast_edit.document().lastBlock().setUserState(1)
+
+    def check_patched(content):
+        assert ast_edit.document().lastBlock().userState() == 1
+        assert scroll_bar.value() == position
+        fresh = AST()
+        fresh.load("python", content)
+        view = AstView()
+        view.document().setDefaultFont(ast_edit.document().defaultFont())
+        view.setHtml(render_html(fresh.build_nodes().records()))
+        view.document().lastBlock().setUserState(1)
+        assert ast_edit.toHtml() == view.toHtml()
+
+    source = source.replace("x + 100", "x * 2 + 100")
+    controller.ast_edit_load("python", source)
+    check_patched(source)
+
+    # Refreshes in the worker patch the lines as well
+    source = source.replace("def f50(x):", "def f50(x, y):")
+    controller.on_text_changed(source)
+    wait_for_refresh(controller)
+    check_patched(source)
+
+    controller.set_virtual_ast(True)
+    model = controller.window.ast_list.model()
+    source = source.replace("    return x + 150", "    y = 1\n    return x + 150")
+    controller.ast_edit_load("python", source)
+    nodes = controller.ast.nodes
+    assert model.rowCount() == len(nodes)
+    assert [model.data(model.index(row)) for row in range(len(nodes))] == [
+        nodes.format_line(row) for row in range(len(nodes))
+    ]
+
+
+def test_adaptive_debounce(python_grammar, controller):
+    controller.document.language = "python"
+    controller.ast_edit_load("python", "x = 1\n")
+    controller.handle_text_changed()
+    # Small files are refreshed soon after an edit
+    assert controller._timer.interval() < 500
+    for _ in range(8):
+        controller._refresh_costs.add(2.0)
+    controller.handle_text_changed()
+    assert controller._timer.interval() == 1000
+    controller._timer.stop()
+
+
+def test_parse_job_cancelled(python_grammar, controller, monkeypatch):
+    ast = AST()
+    ast.prepare("python", "def f(x):\n    return x\n" * 5000)
+    results = []
+    signals = ParseSignals()
+    signals.finished.connect(results.append)
+    checks = []
+
+    def is_current(generation):
+        # Outdated by an edit during the parse
+        checks.append(generation)
+        return len(checks) < 3
+
+    monkeypatch.setattr(ast_module, "PARSE_SLICE_MICROS", 100)
+    ParseJob(signals, 1, is_current, ast).run()
+    QCoreApplication.processEvents()
+    assert len(results) == 1
+    assert results[0].cancelled
+    assert results[0].ast_html is None
+    assert ast.tree is None
+
+
+def test_syntax_highlighter(python_grammar, controller):
+    doc_edit = controller.window.doc_edit
+    controller.document.language = "python"
+    doc_edit.setPlainText("def f():\n    return 1\n")
+    controller.on_text_changed(doc_edit.toPlainText())
+    wait_for_refresh(controller)
+
+    def colors(row):
+        formats = doc_edit.document().findBlockByNumber(row).layout().formats()
+        return {
+            (r.start, r.length): r.format.foreground().color().name() for r in formats
+        }
+
+    wait_for_highlight(doc_edit)
+    assert colors(0)[(0, 3)] == "#008000"
+    assert colors(1)[(4, 6)] == "#008000"
+    assert colors(1)[(11, 1)] == "#666666"
+
+    # Only the edited row is highlighted again
+    cursor = doc_edit.textCursor()
+    cursor.setPosition(len("def f():\n    return 1"))
+    cursor.insertText("  # done")
+    controller.on_text_changed(doc_edit.toPlainText())
+    wait_for_refresh(controller)
+    assert colors(1)[(14, 6)] == "#3d7b7b"
+    assert colors(0)[(0, 3)] == "#008000"
+
+
+def wait_for_highlight(doc_edit):
+    while doc_edit.highlighter.pending:
+        QCoreApplication.processEvents()
+
+
+def block_colors(doc_edit, row):
+    formats = doc_edit.document().findBlockByNumber(row).layout().formats()
+    return [(r.start, r.length, r.format.foreground().color().name()) for r in formats]
+
+
+def test_highlight_large_document(python_grammar, controller):
+    window = controller.window
+    window.show()
+    QCoreApplication.processEvents()
+    doc_edit = window.doc_edit
+    text = "def f(x):\n    return x + 1  # one\n" * 6000
+    doc_edit.blockSignals(True)
+    doc_edit.setPlainText(text)
+    doc_edit.blockSignals(False)
+    controller.document.content = text
+    controller.document.language = "python"
+    controller.ast_edit_load("python", text)
+
+    # Only the rows shown are highlighted at once
+    started = time.perf_counter()
+    controller.highlight_code()
+    assert time.perf_counter() - started < 0.5
+    first, last = doc_edit.visible_rows()
+    assert last > first
+    assert all(block_colors(doc_edit, row) for row in range(first, last + 1))
+    assert doc_edit.highlighter.pending
+    assert block_colors(doc_edit, 11999) == []
+
+    # The other rows in idle time, in time linear in the size of the document
+    wait_for_highlight(doc_edit)
+    assert time.perf_counter() - started < 10
+    assert block_colors(doc_edit, 11999) == [
+        (4, 6, "#008000"),
+        (15, 1, "#666666"),
+        (18, 5, "#3d7b7b"),
+    ]
+
+    # An edit highlights its rows again, and keeps the others
+    cursor = QTextCursor(doc_edit.document().findBlockByNumber(11998))
+    cursor.insertText("class ")
+    controller.on_text_changed(doc_edit.toPlainText())
+    wait_for_refresh(controller)
+    assert not doc_edit.highlighter.pending
+    assert block_colors(doc_edit, 11998)[0] == (0, 5, "#008000")
+    assert block_colors(doc_edit, 0)[0] == (0, 3, "#008000")
+
+
+def test_pygments_highlight_in_worker(controller, monkeypatch):
+    # Without a grammar, the document falls back to Pygments
+    monkeypatch.setattr(controller.ast, "get_language", lambda name: None)
+    doc_edit = controller.window.doc_edit
+    controller.document.language = "python"
+    doc_edit.setPlainText("def f():\n    return 1")
+    controller.highlight_code()
+    assert not controller._pygments_highlighted
+    controller._pool.waitForDone()
+    QCoreApplication.processEvents()
+    assert controller._pygments_highlighted
+    cursor = QTextCursor(doc_edit.document())
+    cursor.setPosition(1)
+    assert cursor.charFormat().foreground().color().name() == "#008000"
+
+    # The HTML of text edited since is dropped
+    controller._pygments_highlighted = False
+    doc_edit.setPlainText("def f():\n    return 1")
+    controller.highlight_code()
+    doc_edit.insertPlainText("x")
+    controller._pool.waitForDone()
+    QCoreApplication.processEvents()
+    assert not controller._pygments_highlighted
+    assert doc_edit.toPlainText() == "xdef f():\n    return 1"
+
+
+def test_open_large_file(python_grammar, controller, tmp_path, monkeypatch):
+    # Many thousands of formats, which PySide6 6.12.0 cannot set on Python
+    # before 3.12 without freeing None
+    script = tmp_path / "script.py"
+    script.write_text("x = 'a' + 1  # one\n" * 3000)
+    monkeypatch.setattr(
+        main_controller_module.QFileDialog,
+        "getOpenFileName",
+        lambda *args, **kwargs: (str(script), ""),
+    )
+    controller.open_file()
+    wait_for_highlight(controller.window.doc_edit)
+    for row in (0, 2999):
+        assert block_colors(controller.window.doc_edit, row) == [
+            (4, 3, "#ba2121"),
+            (10, 1, "#666666"),
+            (13, 5, "#3d7b7b"),
+        ]
+
+
+def test_load_from_dump_cache(python_grammar, controller, tmp_path):
+    controller.dump_cache = DumpCache(str(tmp_path))
+    controller.ast_edit_load("python", "x = 1\n", use_cache=True)
+    assert controller.ast.nodes.has_node_ids
+    text = controller.window.ast_edit.toPlainText()
+
+    controller.ast_edit_load("python", "x = 1\n", use_cache=True)
+    assert not controller.ast.nodes.has_node_ids
+    assert controller.window.ast_edit.toPlainText() == text
+
+    # Cached nodes have no node ids, native lookup falls back to the index
+    controller.set_native_lookup(True)
+    assert controller.ast.get_match_ast_line(0, 0) == 3
+
+
+def test_open_file_during_refresh(python_grammar, controller, tmp_path, monkeypatch):
+    script = tmp_path / "script"
+    script.write_bytes(b"#!/usr/bin/env python\nx = 1\n")
+    monkeypatch.setattr(
+        main_controller_module.QFileDialog,
+        "getOpenFileName",
+        lambda *args, **kwargs: (str(script), ""),
+    )
+    detect = controller.document.set_language_from_extension
+    running = []
+
+    def set_language_from_extension():
+        # The worker is not using the parsers while detection runs
+        running.append(controller._running_generation)
+        detect()
+
+    monkeypatch.setattr(
+        controller.document, "set_language_from_extension", set_language_from_extension
+    )
+    controller.document.language = "python"
+    controller.on_text_changed("def f(x):\n    return x\n" * 5000)
+    controller.open_file()
+    assert running == [None]
+    assert controller.document.language == "python"
+    assert controller.ast.content[:2] == b"#!"
+
+
+def test_cursor_sync_multibyte(python_grammar, controller):
+    text = "s = '😀ü'; t = 1\n"
+    doc_edit = controller.window.doc_edit
+    doc_edit.setPlainText(text)
+    controller.document.language = "python"
+    controller.ast_edit_load("python", text)
+
+    # Cursor on "t": the emoji is 2 UTF-16 units but 4 bytes, "ü" 1 unit
+    # but 2 bytes
+    cursor = doc_edit.textCursor()
+    cursor.setPosition(11)
+    doc_edit.setTextCursor(cursor)
+    controller.highlight_ast_region()
+    # The selection comes back once the blink animation is over
+    controller._stop_blink_animation()
+    ast_cursor = controller.window.ast_edit.textCursor()
+    row = ast_cursor.blockNumber()
+    assert controller.ast.nodes.record(row).type == "identifier"
+    assert ast_cursor.selectedText() == controller.ast.nodes.format_line(row)
+    assert controller.ast.get_code_range(row) == [0, 14, 0, 15]
+
+    # Selecting the string node selects its characters
+    string_row = next(
+        r.row for r in controller.ast.nodes.records() if r.type == "string"
+    )
+    cursor = controller.window.ast_edit.textCursor()
+    cursor.setPosition(
+        controller.window.ast_edit.document().findBlockByNumber(string_row).position()
+    )
+    controller.window.ast_edit.setTextCursor(cursor)
+    controller.on_ast_edit_cursor_changed()
+    controller._stop_blink_animation()
+    assert doc_edit.textCursor().selectedText() == "'😀ü'"
+
+
+def test_language_menu(controller):
+    window = controller.window
+    assert controller.document.language == "python"
+    assert window.language_menu_title.text() == "&Language: python"
+    # Actions are only created when the menu is first shown
+    assert not window.language_actions
+    window.language_menu.aboutToShow.emit()
+    assert len(window.language_menu.actions()) == len(window.supported_languages)
+    assert window.language_actions["python"].isChecked()
+
+    window.update_language_menu("javascript")
+    assert not window.language_actions["python"].isChecked()
+    assert window.language_actions["javascript"].isChecked()
+    window.language_menu.aboutToShow.emit()
+    assert len(window.language_menu.actions()) == len(window.supported_languages)
+
+
+def test_startup_is_lazy():
+    # Run in a fresh interpreter, as other tests load these modules
+    code = (
+        "import sys\n"
+        "from PySide6.QtWidgets import QApplication\n"
+        "from controllers.main_controller import MainController\n"
+        "from views.main_window import MainWindow\n"
+        "app = QApplication([])\n"
+        "controller = MainController(MainWindow())\n"
+        "for module in ['pygments', 'tree_sitter_language_pack']:\n"
+        "    assert module not in sys.modules, module\n"
+    )
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, env=env
+    )
+    assert result.returncode == 0, result.stderr
+
+
+def test_query_console(python_grammar, controller):
+    window = controller.window
+    doc_edit = window.doc_edit
+    window.resize(800, 600)
+    window.query_dock.show()
+    content = "".join(f"def f{i}():\n    return {i}\n" for i in range(200))
+    controller.document.language = "python"
+    doc_edit.setPlainText(content)
+    controller.on_text_changed(content)
+    wait_for_refresh(controller)
+    controller._stop_blink_animation()
+
+    window.query_view.query_edit.setPlainText(
+        "(function_definition name: (identifier) @name)"
+    )
+    assert controller._query_timer.isActive()
+    controller.run_query()
+    captures = controller._query_result.captures
+    first_row, last_row = doc_edit.visible_rows()
+    # Only the visible functions are matched
+    assert 0 < len(captures) < 200
+    assert all(first_row <= c.start_point[0] <= last_row for c in captures)
+    assert len(doc_edit.extraSelections()) == len(captures)
+    assert len(window.ast_edit.extraSelections()) == len(captures)
+    selections = doc_edit.extraSelections()
+    assert selections[0].cursor.selectedText() == "f0"
+    assert window.query_view.status_label.text().startswith(
+        f"{len(captures)} captures in lines 1-"
+    )
+
+    # After an edit, the captures of unchanged functions are kept
+    doc_edit.textCursor().insertText("x = 1\n")
+    controller.on_text_changed(doc_edit.toPlainText())
+    wait_for_refresh(controller)
+    assert controller._query_result.captures[0].start_point == (1, 4)
+    selections = doc_edit.extraSelections()
+    assert selections[0].cursor.selectedText() == "f0"
+
+    # Errors are shown in the console, without highlights
+    window.query_view.query_edit.setPlainText("(no_such_node) @x")
+    controller.run_query()
+    assert window.query_view.status_label.text().startswith("Error:")
+    assert doc_edit.extraSelections() == []
+
+    window.query_dock.hide()
+    controller.run_query()
+    assert controller._query_result is None
+
+
+def test_performance_panel(python_grammar, controller):
+    window = controller.window
+    assert not monitor.enabled
+    perf_action = window.perf_dock.toggleViewAction()
+    perf_action.trigger()
+    try:
+        assert monitor.enabled
+        assert not window.statusBar().isHidden()
+        controller.document.language = "python"
+        content = "def f():\n    return 1\n"
+        window.doc_edit.setPlainText(content)
+        controller.on_text_changed(content)
+        wait_for_refresh(controller)
+
+        stages = [summary.stage for summary in monitor.summaries()]
+        for stage in ["refresh", "prepare", "parse", "render_html", "set_html"]:
+            assert stage in stages
+        table = window.perf_view.table
+        assert table.rowCount() == len(stages)
+        assert table.item(0, 0).text() == "refresh"
+        assert "parse" in window.perf_label.text()
+
+        # Profile the next two refreshes, in both threads
+        window.perf_view.profile_button.click()
+        assert monitor.profile_left == 5
+        controller.profile_refreshes(2)
+        controller.ast_edit_load("python", content + "x = 1\n")
+        assert monitor.profile_left == 1
+        controller.on_text_changed(content)
+        wait_for_refresh(controller)
+        assert monitor.profile_left == 0
+        report = window.perf_view.profile_output.toPlainText()
+        assert "_load_ast" in report
+        assert "ParseJob" in report or "_run" in report
+
+        window.perf_view.reset_button.click()
+        assert monitor.summaries() == []
+        assert table.rowCount() == 0
+    finally:
+        perf_action.trigger()
+    assert not monitor.enabled
+    assert window.statusBar().isHidden()
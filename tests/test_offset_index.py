@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+from models.offset_index import OffsetIndex
+
+
+def utf16_length(text):
+    return len(text.encode("utf-16-le")) // 2
+
+
+def random_text(rng, length):
+    alphabet = ["a", "b", " ", "\n", "ü", "中", "😀"]
+    weights = [30, 30, 10, 5, 5, 5, 3]
+    return "".join(rng.choices(alphabet, weights, k=length))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 64, 4096])
+def test_offsets_match_brute_force(chunk_size):
+    rng = random.Random(chunk_size)
+    text = random_text(rng, 500) + "x" * 300 + random_text(rng, 200)
+    data = text.encode("utf-8")
+    index = OffsetIndex(data, chunk_size)
+
+    byte = 0
+    position = 0
+    lines = text.split("\n")
+    for row, line in enumerate(lines):
+        column = 0
+        for char in line + ("\n" if row < len(lines) - 1 else ""):
+            assert index.position_of_byte(byte) == position
+            assert index.byte_of_position(position) == byte
+            assert index.byte_of_point(row, column) == byte
+            assert index.point_of_byte(byte) == (row, column)
+            assert index.point_of_position(position) == (row, column)
+            size = len(char.encode("utf-8"))
+            byte += size
+            column += size
+            position += utf16_length(char)
+
+    # The end of the buffer and points beyond it
+    assert index.position_of_byte(len(data)) == utf16_length(text)
+    assert index.byte_of_position(utf16_length(text) + 10) == len(data)
+    assert index.byte_of_point(len(lines) + 5, 0) == len(data)
+
+
+def test_empty():
+    index = OffsetIndex(b"")
+    assert index.position_of_byte(0) == 0
+    assert index.byte_of_position(3) == 0
+    assert index.point_of_byte(0) == (0, 0)
+    assert index.position_of_point(1, 0) == 0
@@ -0,0 +1,120 @@
+import threading
+
+import pytest
+
+from models.perf import (
+    DEFAULT_DEBOUNCE,
+    MAX_DEBOUNCE,
+    MIN_DEBOUNCE,
+    PerfMonitor,
+    RefreshCosts,
+    StageStats,
+    format_status,
+    percentile,
+)
+
+
+def test_percentile():
+    ordered = [float(n) for n in range(1, 101)]
+    assert percentile(ordered, 50) == 50
+    assert percentile(ordered, 90) == 90
+    assert percentile(ordered, 99) == 99
+    assert percentile(ordered, 100) == 100
+    assert percentile([3.0], 50) == 3
+
+
+def test_stage_stats_window():
+    stats = StageStats(window=3)
+    for seconds in [5.0, 1.0, 2.0, 3.0]:
+        stats.add(seconds)
+    summary = stats.summary("parse")
+    # The oldest timing left the window, but is still counted
+    assert summary.count == 4
+    assert summary.last == 3.0
+    assert summary.p50 == 2.0
+    assert summary.max == 3.0
+
+
+def test_disabled_monitor():
+    monitor = PerfMonitor()
+    first = monitor.timed("parse")
+    # The same context manager is used every time, and records nothing
+    assert monitor.timed("render_html") is first
+    with first:
+        pass
+    assert monitor.summaries() == []
+
+
+def test_timed_stages():
+    monitor = PerfMonitor()
+    monitor.enabled = True
+    with monitor.timed("set_html"):
+        pass
+    for _ in range(3):
+        with monitor.timed("parse"):
+            pass
+    # Stages may be timed in the worker thread
+    worker = threading.Thread(target=lambda: monitor.record("build_nodes", 0.5))
+    worker.start()
+    worker.join()
+
+    summaries = monitor.summaries()
+    # Listed in the order of a refresh
+    assert [s.stage for s in summaries] == ["parse", "build_nodes", "set_html"]
+    assert summaries[0].count == 3
+    assert summaries[1].last == 0.5
+    assert "build_nodes 500.0 ms" in format_status(summaries)
+
+    monitor.reset()
+    assert monitor.summaries() == []
+
+
+def parse_stage():
+    return sum(range(1000))
+
+
+def render_stage():
+    return sum(range(1000))
+
+
+def test_profile_refreshes():
+    monitor = PerfMonitor()
+    # Nothing is profiled until asked
+    assert monitor.profiled() is monitor.timed("parse")
+    assert monitor.end_refresh() is None
+
+    monitor.profile_next(2)
+
+    def profile_worker():
+        with monitor.profiled():
+            parse_stage()
+
+    worker = threading.Thread(target=profile_worker)
+    worker.start()
+    worker.join()
+    assert monitor.end_refresh() is None
+    with monitor.profiled():  # noqa: SIM117
+        # Nested blocks are profiled once
+        with monitor.profiled():
+            render_stage()
+    report = monitor.end_refresh()
+    # The profiles of both threads are in the report
+    assert "parse_stage" in report
+    assert "render_stage" in report
+    assert monitor.profile_left == 0
+    assert monitor.end_refresh() is None
+
+
+def test_refresh_costs():
+    costs = RefreshCosts(window=3)
+    assert costs.debounce() == DEFAULT_DEBOUNCE
+    costs.add(0.001)
+    assert costs.debounce() == MIN_DEBOUNCE
+    costs.add(0.2)
+    costs.add(0.2)
+    assert costs.debounce() == pytest.approx(0.3)
+    # A single slow refresh does not change it
+    costs.add(5.0)
+    assert costs.debounce() == pytest.approx(0.3)
+    costs.add(5.0)
+    assert costs.debounce() == MAX_DEBOUNCE
@@ -0,0 +1,51 @@
+from models.query import (
+    QueryCapture,
+    edited_ranges,
+    intersects,
+    merge_ranges,
+    shift_byte,
+    shift_captures,
+    subtract_range,
+)
+
+# "ab\ncd" -> "ab\nXY\ncd": two bytes and a line inserted at byte 3
+EDIT = {
+    "start_byte": 3,
+    "old_end_byte": 3,
+    "new_end_byte": 6,
+    "start_point": (1, 0),
+    "old_end_point": (1, 0),
+    "new_end_point": (2, 0),
+}
+
+
+def capture(start, end, start_point, end_point):
+    return QueryCapture("x", "identifier", start, end, start_point, end_point)
+
+
+def test_shift_captures():
+    before = capture(0, 2, (0, 0), (0, 2))
+    after = capture(3, 5, (1, 0), (1, 2))
+    assert shift_captures([before, after], EDIT) == [
+        before,
+        capture(6, 8, (2, 0), (2, 2)),
+    ]
+    # Captures across an edit are dropped
+    replace = dict(EDIT, old_end_byte=4, old_end_point=(1, 1))
+    assert shift_captures([after], replace) == []
+    assert shift_byte(1, replace) == 1
+    assert shift_byte(4, replace) == 6
+    assert shift_byte(3, replace) == 3
+
+
+def test_ranges():
+    assert merge_ranges([(5, 7), (0, 2), (2, 3), (6, 9)]) == [(0, 3), (5, 9)]
+    assert subtract_range((0, 10), (2, 5)) == [(0, 2), (5, 10)]
+    assert subtract_range((3, 4), (2, 5)) == []
+    insert = dict(EDIT, start_byte=0, old_end_byte=0, new_end_byte=1)
+    assert edited_ranges([EDIT, insert]) == [(4, 7), (0, 1)]
+
+    # Half-open, as for queries
+    assert intersects(capture(0, 2, (0, 0), (0, 2)), [(1, 5)])
+    assert not intersects(capture(0, 2, (0, 0), (0, 2)), [(2, 5)])
+    assert intersects(capture(2, 2, (0, 2), (0, 2)), [(2, 5)])
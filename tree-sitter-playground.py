@@ -2,14 +2,20 @@
 
 import sys
 
-from PySide6.QtCore import Qt
-from PySide6.QtWidgets import QApplication
 
-from controllers.main_controller import MainController
-from views.main_window import MainWindow
+def main():
+    if len(sys.argv) > 1:
+        # Headless commands: keep Qt out of the way
+        from controllers.cli import main as cli_main
 
+        return cli_main(sys.argv[1:])
+
+    from PySide6.QtCore import Qt
+    from PySide6.QtWidgets import QApplication
+
+    from controllers.main_controller import MainController
+    from views.main_window import MainWindow
 
-def main():
     app = QApplication(sys.argv)
 
     # macOS specific settings
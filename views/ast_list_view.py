@@ -0,0 +1,126 @@
+from typing import Dict, List
+
+from PySide6.QtCore import QAbstractListModel, QModelIndex, Qt, Signal
+from PySide6.QtGui import QColor, QFont
+from PySide6.QtWidgets import QAbstractItemView, QListView
+
+from models.node_table import NodeTable, RowDiff
+
+
+class AstListModel(QAbstractListModel):
+    """List model over a NodeTable, formatting rows only when Qt asks."""
+
+    def __init__(self):
+        super().__init__()
+        self._nodes = NodeTable()
+        # Background colors of the rows of query captures
+        self._row_colors: Dict[int, QColor] = {}
+
+    def set_nodes(self, nodes: NodeTable):
+        self.beginResetModel()
+        self._nodes = nodes
+        self._row_colors = {}
+        self.endResetModel()
+
+    def patch_nodes(self, nodes: NodeTable, spans: List[RowDiff]):
+        """Replace the table by a newer one, of which only spans changed.
+
+        Unlike set_nodes(), the view keeps its scroll position and selection.
+        """
+        self._row_colors = {}
+        if not spans:
+            self._nodes = nodes
+            return
+        # Only the last span may change the count of rows
+        last = spans[-1]
+        old_count = last.old_stop - last.first
+        new_count = last.new_stop - last.first
+        if new_count > old_count:
+            self.beginInsertRows(
+                QModelIndex(), last.first + old_count, last.first + new_count - 1
+            )
+            self._nodes = nodes
+            self.endInsertRows()
+        elif new_count < old_count:
+            self.beginRemoveRows(
+                QModelIndex(), last.first + new_count, last.first + old_count - 1
+            )
+            self._nodes = nodes
+            self.endRemoveRows()
+        else:
+            self._nodes = nodes
+        for span in spans:
+            stop = min(span.old_stop, span.new_stop)
+            self.dataChanged.emit(self.index(span.first), self.index(stop - 1))
+
+    def set_row_colors(self, row_colors: Dict[int, QColor]):
+        if not row_colors and not self._row_colors:
+            return
+        self._row_colors = row_colors
+        # Only the visible rows are asked for their data again
+        self.dataChanged.emit(
+            self.index(0), self.index(len(self._nodes) - 1), [Qt.BackgroundRole]
+        )
+
+    def rowCount(self, parent=None):
+        if parent is not None and parent.isValid():
+            return 0
+        return len(self._nodes)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        if role == Qt.DisplayRole:
+            return self._nodes.format_line(row)
+        if role == Qt.ForegroundRole:
+            _, is_named = self._nodes.types[self._nodes.type_id[row]]
+            # Anonymous nodes are greyed out, as in AstView
+            if not is_named:
+                return QColor("#808080")
+            if row in self._row_colors:
+                # Readable on the light capture colors in dark mode too
+                return QColor(Qt.black)
+        if role == Qt.BackgroundRole:
+            return self._row_colors.get(row)
+        return None
+
+
+class AstListView(QListView):
+    """Virtualized AST pane: only the visible rows are created and laid out."""
+
+    current_row_event: Signal = Signal(int)
+
+    def __init__(self):
+        super().__init__()
+        self.ast_model = AstListModel()
+        self.setModel(self.ast_model)
+        # All rows have the same height, so Qt never measures hidden rows
+        self.setUniformItemSizes(True)
+        self.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.setFont(QFont("Courier New"))
+        self.setAutoFillBackground(True)
+
+    def set_nodes(self, nodes: NodeTable):
+        self.ast_model.set_nodes(nodes)
+
+    def patch_nodes(self, nodes: NodeTable, spans: List[RowDiff]):
+        self.ast_model.patch_nodes(nodes, spans)
+
+    def set_row_colors(self, row_colors: Dict[int, QColor]):
+        self.ast_model.set_row_colors(row_colors)
+
+    def select_row(self, row: int):
+        index = self.ast_model.index(row)
+        if not index.isValid():
+            return
+        self.setCurrentIndex(index)
+        self.scrollTo(index)
+
+    def current_row(self) -> int:
+        return self.currentIndex().row()
+
+    def currentChanged(self, current, previous):
+        super().currentChanged(current, previous)
+        if current.isValid() and not self.signalsBlocked():
+            self.current_row_event.emit(current.row())
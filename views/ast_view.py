@@ -1,5 +1,11 @@
+from typing import List
+
+from PySide6.QtGui import QTextCursor
 from PySide6.QtWidgets import QTextEdit
 
+from models.ast_render import HTML_HEAD, HTML_TAIL
+from models.node_table import RowDiff
+
 
 class AstView(QTextEdit):
     def __init__(self):
@@ -9,3 +15,44 @@ class AstView(QTextEdit):
         self.setLineWrapMode(QTextEdit.NoWrap)
         # Enable auto background fill
         self.setAutoFillBackground(True)
+
+    def select_line(self, line: int) -> bool:
+        """Select a line of the dump, found directly by block number."""
+        block = self.document().findBlockByNumber(line)
+        if not block.isValid():
+            return False
+        cursor = QTextCursor(block)
+        cursor.movePosition(QTextCursor.EndOfBlock, QTextCursor.KeepAnchor)
+        self.setTextCursor(cursor)
+        self.ensureCursorVisible()
+        return True
+
+    def patch_lines(self, spans: List[RowDiff], lines_html: List[str]) -> bool:
+        """Replace spans of lines of the dump by the HTML of their new lines.
+
+        The other lines keep their blocks and formatting, and the view keeps
+        its scroll position. Return False, changing nothing, if the spans do
+        not fit in the dump shown.
+        """
+        document = self.document()
+        if spans and spans[-1].old_stop > document.blockCount():
+            return False
+        scroll_bars = [self.horizontalScrollBar(), self.verticalScrollBar()]
+        positions = [scroll_bar.value() for scroll_bar in scroll_bars]
+        cursor = QTextCursor(document)
+        cursor.beginEditBlock()
+        # From the last span, so that the lines of the others stay in place
+        for span, html in reversed(list(zip(spans, lines_html))):
+            last = document.findBlockByNumber(span.old_stop - 1)
+            cursor.setPosition(document.findBlockByNumber(span.first).position())
+            cursor.setPosition(
+                last.position() + last.length() - 1, QTextCursor.KeepAnchor
+            )
+            # As setHtml() does, the end of the dump gets the whitespace of
+            # HTML_TAIL
+            tail = HTML_TAIL if last == document.lastBlock() else "</body></html>"
+            cursor.insertHtml(HTML_HEAD + html + tail)
+        cursor.endEditBlock()
+        for scroll_bar, position in zip(scroll_bars, positions):
+            scroll_bar.setValue(position)
+        return True
@@ -1,5 +1,40 @@
+from typing import Tuple
+
+from PySide6.QtCore import QPoint
 from PySide6.QtWidgets import QTextEdit
 
+from .syntax_highlighter import TreeSitterHighlighter
+
+
+def highlight_html(language, content, bg_color, text_color):
+    """Highlight content with Pygments into a full HTML document.
+
+    Only used for languages without a tree-sitter grammar, so Pygments is
+    imported on the first call rather than at startup.
+    """
+    from pygments import highlight
+    from pygments.formatters import HtmlFormatter
+    from pygments.lexers import get_lexer_by_name
+
+    if language == "c_sharp":
+        language = "csharp"
+    lexer = get_lexer_by_name(language, stripall=True)
+
+    # 创建自定义样式
+    style = {
+        "bgcolor": bg_color,
+        "color": text_color,
+    }
+    formatter = HtmlFormatter(
+        style="default",
+        full=True,
+        noclasses=True,
+        linenos=False,
+        nobackground=True,
+        style_defs=style,
+    )
+    return highlight(content, lexer, formatter)
+
 
 class DocView(QTextEdit):
     def __init__(self):
@@ -8,6 +43,7 @@ class DocView(QTextEdit):
         self.setLineWrapMode(QTextEdit.NoWrap)
         # 启用自动填充背景
         self.setAutoFillBackground(True)
+        self.highlighter = TreeSitterHighlighter(self.document())
 
     def setHtml(self, html):
         # Save current cursor position
@@ -22,3 +58,17 @@ class DocView(QTextEdit):
         position = min(self._cursor_position, len(self.toPlainText()))
         cursor.setPosition(position)
         self.setTextCursor(cursor)
+
+    def visible_rows(self) -> Tuple[int, int]:
+        """Return the first and last rows shown, lines not being wrapped."""
+        viewport = self.viewport()
+        # Skip the margin above the text, where the hit falls on the end of
+        # the text laid out so far
+        top = max(
+            0, int(self.document().documentMargin()) - self.verticalScrollBar().value()
+        )
+        first = self.cursorForPosition(QPoint(0, top)).blockNumber()
+        last = self.cursorForPosition(
+            QPoint(viewport.width() - 1, viewport.height() - 1)
+        ).blockNumber()
+        return first, last
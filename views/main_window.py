@@ -1,11 +1,22 @@
-from PySide6.QtCore import QEvent, Signal
+from PySide6.QtCore import QEvent, Qt, Signal
 from PySide6.QtGui import QAction, QActionGroup, QFont, QPalette
-from PySide6.QtWidgets import QHBoxLayout, QMainWindow, QSplitter, QWidget
+from PySide6.QtWidgets import (
+    QDockWidget,
+    QHBoxLayout,
+    QLabel,
+    QMainWindow,
+    QSplitter,
+    QStackedWidget,
+    QWidget,
+)
 
 from models.lang_map import supported_languages
 
+from .ast_list_view import AstListView
 from .ast_view import AstView
 from .doc_view import DocView
+from .perf_view import PerfView
+from .query_view import QueryView
 
 
 class MainWindow(QMainWindow):
@@ -17,12 +28,21 @@ class MainWindow(QMainWindow):
     ast_edit_cursor_event: Signal = Signal()
     font_size_changed_event: Signal = Signal(int)
     theme_changed_event: Signal = Signal(bool)
+    native_lookup_event: Signal = Signal(bool)
+    virtual_ast_event: Signal = Signal(bool)
+    query_changed_event: Signal = Signal(str)
+    performance_event: Signal = Signal(bool)
 
     def __init__(self):
         super().__init__()
         self.supported_languages = supported_languages
         self.selected_language_action = None
+        self.language_menu = None
         self.language_menu_title = None
+        self.view_menu = None
+        # Actions of the language menu, created when it is first shown
+        self.language_actions = {}
+        self.selected_language = None
         self.font_size = 18
 
         self.setup_ui()
@@ -33,6 +53,8 @@ class MainWindow(QMainWindow):
 
         self.create_menus()
         self.create_editors()
+        self.create_query_console()
+        self.create_performance_panel()
         self.set_font_size(self.font_size)
 
     def create_menus(self):
@@ -46,17 +68,9 @@ class MainWindow(QMainWindow):
         file_menu.addAction(open_action)
 
         # Language menu
-        language_menu = menubar.addMenu("&Language")
-        self.language_menu_title = language_menu.menuAction()
-        for language in self.supported_languages:
-            action = QAction(language, self)
-            action.setCheckable(True)
-            action.triggered.connect(
-                (lambda lang: lambda checked: self.language_changed_event.emit(lang))(
-                    language
-                )
-            )
-            language_menu.addAction(action)
+        self.language_menu = menubar.addMenu("&Language")
+        self.language_menu_title = self.language_menu.menuAction()
+        self.language_menu.aboutToShow.connect(self.create_language_actions)
 
         # Size menu
         size_menu = menubar.addMenu("&Size")
@@ -73,17 +87,45 @@ class MainWindow(QMainWindow):
                 action.setChecked(True)
         # size_group.triggered.connect(lambda action: self.font_size_changed_event.emit(int(action.text())))
 
-        # View and Help menus
-        menubar.addMenu("&View")
+        # View menu
+        view_menu = self.view_menu = menubar.addMenu("&View")
+        native_lookup_action = QAction("&Native Node Lookup", self)
+        native_lookup_action.setCheckable(True)
+        native_lookup_action.toggled.connect(self.native_lookup_event.emit)
+        view_menu.addAction(native_lookup_action)
+        virtual_ast_action = QAction("&Virtualized AST", self)
+        virtual_ast_action.setCheckable(True)
+        virtual_ast_action.toggled.connect(self.virtual_ast_event.emit)
+        view_menu.addAction(virtual_ast_action)
+
+        # Help menu
         help_menu = menubar.addMenu("&Help")
         help_menu.addAction(QAction("&About", self))
 
+    def create_language_actions(self):
+        if self.language_actions:
+            return
+        for language in self.supported_languages:
+            action = QAction(language, self)
+            action.setCheckable(True)
+            action.triggered.connect(
+                (lambda lang: lambda checked: self.language_changed_event.emit(lang))(
+                    language
+                )
+            )
+            self.language_menu.addAction(action)
+            self.language_actions[language] = action
+        self.update_language_menu(self.selected_language)
+
     def set_font_size(self, size):
         self.font_size = size
         font = QFont()
         font.setPointSize(size)
         self.doc_edit.setFont(font)
         self.ast_edit.setFont(font)
+        list_font = self.ast_list.font()
+        list_font.setPointSize(size)
+        self.ast_list.setFont(list_font)
 
     def create_editors(self):
         central_widget = QWidget()
@@ -96,9 +138,15 @@ class MainWindow(QMainWindow):
 
         self.doc_edit = DocView()
         self.ast_edit = AstView()
+        self.ast_list = AstListView()
+
+        # Only one of the AST panes is shown, see set_virtual_ast()
+        self.ast_stack = QStackedWidget()
+        self.ast_stack.addWidget(self.ast_edit)
+        self.ast_stack.addWidget(self.ast_list)
 
         splitter.addWidget(self.doc_edit)
-        splitter.addWidget(self.ast_edit)
+        splitter.addWidget(self.ast_stack)
 
         splitter.setSizes([self.width() // 2, self.width() // 2])
 
@@ -116,17 +164,52 @@ class MainWindow(QMainWindow):
 
         layout.addWidget(splitter)
 
+    def create_query_console(self):
+        self.query_view = QueryView()
+        self.query_view.query_changed.connect(self.query_changed_event.emit)
+
+        self.query_dock = QDockWidget("Query", self)
+        self.query_dock.setObjectName("query_dock")
+        self.query_dock.setWidget(self.query_view)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.query_dock)
+        self.query_dock.hide()
+
+        query_action = self.query_dock.toggleViewAction()
+        query_action.setText("&Query Console")
+        self.view_menu.addAction(query_action)
+
+    def create_performance_panel(self):
+        self.perf_view = PerfView()
+        self.perf_dock = QDockWidget("Performance", self)
+        self.perf_dock.setObjectName("perf_dock")
+        self.perf_dock.setWidget(self.perf_view)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.perf_dock)
+        self.perf_dock.hide()
+
+        # Timings of the last refresh, shown while the stages are timed
+        self.perf_label = QLabel()
+        self.statusBar().addPermanentWidget(self.perf_label, 1)
+        self.statusBar().hide()
+
+        perf_action = self.perf_dock.toggleViewAction()
+        perf_action.setText("&Performance")
+        perf_action.toggled.connect(self.performance_event.emit)
+        self.view_menu.addAction(perf_action)
+
+    def set_virtual_ast(self, enabled):
+        self.ast_stack.setCurrentWidget(self.ast_list if enabled else self.ast_edit)
+
     def update_language_menu(self, language):
+        self.selected_language = language
         if self.selected_language_action:
             self.selected_language_action.setChecked(False)
-        for action in self.menuBar().actions():
-            if action.text().startswith("&Language"):
-                for sub_action in action.menu().actions():
-                    if sub_action.text() == language:
-                        sub_action.setChecked(True)
-                        self.selected_language_action = sub_action
-                        break
-        self.language_menu_title.setText(f"&Language: {language}")
+            self.selected_language_action = None
+        action = self.language_actions.get(language)
+        if action:
+            action.setChecked(True)
+            self.selected_language_action = action
+        if language:
+            self.language_menu_title.setText(f"&Language: {language}")
 
     def changeEvent(self, event):
         if event.type() == QEvent.PaletteChange:
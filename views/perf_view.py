@@ -0,0 +1,81 @@
+from typing import List
+
+from PySide6.QtCore import Qt, Signal
+from PySide6.QtGui import QFont
+from PySide6.QtWidgets import (
+    QAbstractItemView,
+    QHBoxLayout,
+    QLabel,
+    QPlainTextEdit,
+    QPushButton,
+    QSpinBox,
+    QTableWidget,
+    QTableWidgetItem,
+    QVBoxLayout,
+    QWidget,
+)
+
+from models.perf import StageSummary
+
+COLUMNS = ["Stage", "Count", "Last", "p50", "p90", "p99", "Max"]
+
+
+class PerfView(QWidget):
+    """Performance panel: timings of the stages, and profiles of refreshes."""
+
+    reset_requested: Signal = Signal()
+    profile_requested: Signal = Signal(int)
+
+    def __init__(self):
+        super().__init__()
+        self.reset_button = QPushButton("&Reset")
+        self.profile_count = QSpinBox()
+        self.profile_count.setRange(1, 100)
+        self.profile_count.setValue(5)
+        self.profile_button = QPushButton("&Profile")
+
+        self.table = QTableWidget(0, len(COLUMNS))
+        self.table.setHorizontalHeaderLabels(COLUMNS)
+        self.table.verticalHeader().hide()
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+
+        self.profile_output = QPlainTextEdit()
+        self.profile_output.setReadOnly(True)
+        self.profile_output.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.profile_output.setFont(QFont("Courier New"))
+        self.profile_output.setPlaceholderText("cProfile report of the refreshes")
+
+        buttons = QHBoxLayout()
+        buttons.addWidget(self.reset_button)
+        buttons.addStretch()
+        buttons.addWidget(QLabel("Profile the next"))
+        buttons.addWidget(self.profile_count)
+        buttons.addWidget(QLabel("refreshes"))
+        buttons.addWidget(self.profile_button)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(buttons)
+        layout.addWidget(self.table)
+        layout.addWidget(self.profile_output)
+
+        self.reset_button.clicked.connect(self.reset_requested.emit)
+        self.profile_button.clicked.connect(
+            lambda: self.profile_requested.emit(self.profile_count.value())
+        )
+
+    def set_summaries(self, summaries: List[StageSummary]):
+        """Show the timings of the stages, in milliseconds."""
+        self.table.setRowCount(len(summaries))
+        for row, summary in enumerate(summaries):
+            values = [summary.stage, str(summary.count)] + [
+                f"{seconds * 1000:.1f}" for seconds in summary[2:]
+            ]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if column:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(row, column, item)
+
+    def set_profile_report(self, text: str):
+        self.profile_output.setPlainText(text)
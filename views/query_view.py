@@ -0,0 +1,51 @@
+import re
+from typing import Dict, List
+
+from PySide6.QtCore import Signal
+from PySide6.QtGui import QColor, QFont
+from PySide6.QtWidgets import QLabel, QPlainTextEdit, QVBoxLayout, QWidget
+
+# Background colors of the captures, by order of their names in the query
+CAPTURE_COLORS = ["#ffe08a", "#b8e0ff", "#c8f0b0", "#ffc6d9", "#e0ccff", "#ffd2a6"]
+
+_CAPTURE_NAME = re.compile(r"@([\w.-]+)")
+
+
+def capture_colors(query_text: str) -> Dict[str, QColor]:
+    """Map the capture names of a query to their colors."""
+    names: List[str] = list(dict.fromkeys(_CAPTURE_NAME.findall(query_text)))
+    return {
+        name: QColor(CAPTURE_COLORS[index % len(CAPTURE_COLORS)])
+        for index, name in enumerate(names)
+    }
+
+
+class QueryView(QWidget):
+    """Query console: a tree-sitter query and a summary of its captures."""
+
+    query_changed: Signal = Signal(str)
+
+    def __init__(self):
+        super().__init__()
+        self.query_edit = QPlainTextEdit()
+        self.query_edit.setPlaceholderText(
+            "Tree-sitter query, such as: (identifier) @name"
+        )
+        self.query_edit.setFont(QFont("Courier New"))
+        self.status_label = QLabel()
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.query_edit)
+        layout.addWidget(self.status_label)
+
+        self.query_edit.textChanged.connect(
+            lambda: self.query_changed.emit(self.query_text())
+        )
+
+    def query_text(self) -> str:
+        return self.query_edit.toPlainText()
+
+    def set_status(self, text: str, error: bool = False):
+        self.status_label.setStyleSheet("color: #c00000;" if error else "")
+        self.status_label.setText(text)
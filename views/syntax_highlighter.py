@@ -0,0 +1,285 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from PySide6.QtCore import QObject, QTimer
+from PySide6.QtGui import (
+    QColor,
+    QFont,
+    QTextBlock,
+    QTextCharFormat,
+    QTextCursor,
+    QTextDocument,
+    QTextLayout,
+)
+from tree_sitter import Node, Tree
+
+# Colours of the Pygments "default" style, which highlighted the document
+# before the tree-sitter highlighter
+TOKEN_STYLES = {
+    "comment": ("#3d7b7b", False, True),
+    "keyword": ("#008000", True, False),
+    "string": ("#ba2121", False, False),
+    "number": ("#666666", False, False),
+    "type": ("#b00040", False, False),
+}
+
+# Rows highlighted per idle time slice, past the changed and visible ones
+SWEEP_ROWS = 500
+# Most slices a document is highlighted in, when it has many rows
+SWEEP_SLICES = 16
+
+# (start, end, kind) of a token on a row, in byte columns. An end of None is
+# the end of the line
+Span = Tuple[int, Optional[int], str]
+
+
+def _make_format(color: str, bold: bool, italic: bool) -> QTextCharFormat:
+    text_format = QTextCharFormat()
+    text_format.setForeground(QColor(color))
+    if bold:
+        text_format.setFontWeight(QFont.Bold)
+    text_format.setFontItalic(italic)
+    return text_format
+
+
+def token_kind(node_type: str, is_named: bool, is_leaf: bool) -> Optional[str]:
+    """Guess the token kind of a node from its type, across grammars.
+
+    Comments and strings are coloured as a whole, other kinds only on leaves.
+    None means the node is not coloured itself.
+    """
+    if "comment" in node_type:
+        return "comment"
+    if is_named and ("string" in node_type or node_type.startswith("char")):
+        return "string"
+    if not is_leaf:
+        return None
+    if not is_named:
+        # Anonymous words are keywords, other anonymous nodes are punctuation
+        return "keyword" if node_type.isidentifier() else None
+    if node_type in ("true", "false", "none", "null", "nil"):
+        return "keyword"
+    if "number" in node_type or "integer" in node_type or "float" in node_type:
+        return "number"
+    if node_type.endswith("type_identifier") or node_type == "primitive_type":
+        return "type"
+    return None
+
+
+def utf16_columns(text: str) -> List[int]:
+    """Map each byte column of a UTF-8 encoded line to its UTF-16 column."""
+    columns = []
+    position = 0
+    for char in text:
+        columns.extend([position] * len(char.encode("utf8")))
+        position += 2 if ord(char) > 0xFFFF else 1
+    columns.append(position)
+    return columns
+
+
+class TreeSitterHighlighter(QObject):
+    """Colour the document block by block from a tree-sitter tree.
+
+    The tree is set from outside after each parse, together with the rows
+    whose syntax changed. Only the blocks on those rows, the blocks edited
+    since the previous tree and the blocks shown are highlighted at once.
+    After a whole new tree, the other blocks are highlighted in slices of
+    rows whenever the event loop is idle. Until then, edited blocks keep the
+    colours they had, since the old tree does not describe them.
+
+    Formats are set on the layouts of whole blocks, one call a block, rather
+    than token by token through QSyntaxHighlighter.setFormat().
+    """
+
+    def __init__(self, document: QTextDocument):
+        super().__init__(document)
+        self._document = document
+        self._tree: Optional[Tree] = None
+        # Document revision the tree was parsed from
+        self._revision = 0
+        # Positions [start, end) of the text edited since the tree was set
+        self._edited: Optional[List[int]] = None
+        document.contentsChange.connect(self._on_contents_change)
+        self._formats = {
+            kind: _make_format(*style) for kind, style in TOKEN_STYLES.items()
+        }
+        # Token kind by (type, is named, is leaf)
+        self._kinds: Dict[Tuple[str, bool, bool], Optional[str]] = {}
+        # Start of the next block to highlight in idle time, moved along
+        # with the edits before it
+        self._sweep: Optional[QTextCursor] = None
+        self._sweep_timer = QTimer(self)
+        self._sweep_timer.setSingleShot(True)
+        self._sweep_timer.setInterval(0)
+        self._sweep_timer.timeout.connect(self._continue_sweep)
+
+    def document(self) -> QTextDocument:
+        return self._document
+
+    @property
+    def pending(self) -> bool:
+        """Whether blocks are left to highlight in idle time."""
+        return self._sweep is not None
+
+    def set_tree(
+        self,
+        tree: Optional[Tree],
+        changed_rows: Optional[Iterable[Tuple[int, int]]] = None,
+        visible_rows: Optional[Tuple[int, int]] = None,
+    ):
+        """Highlight from a tree of the current text of the document.
+
+        changed_rows lists the (first, last) rows to highlight again, or None
+        for the whole document. visible_rows are the (first, last) rows
+        shown, highlighted first when the whole document is.
+        """
+        document = self.document()
+        self._tree = tree
+        self._revision = document.revision()
+        edited, self._edited = self._edited, None
+        rows = [] if changed_rows is None else list(changed_rows)
+        if edited is not None and changed_rows is not None:
+            rows.append(
+                (
+                    document.findBlock(edited[0]).blockNumber(),
+                    document.findBlock(
+                        min(edited[1], document.characterCount() - 1)
+                    ).blockNumber(),
+                )
+            )
+        if visible_rows is not None:
+            rows.append(visible_rows)
+        self._highlight(rows)
+        if changed_rows is None:
+            self._sweep = QTextCursor(document)
+            self._sweep_timer.start()
+
+    def _on_contents_change(self, position: int, removed: int, added: int):
+        if self._edited is None:
+            self._edited = [position, position + added]
+            return
+        start, end = self._edited
+        # Move the end of the edited range along with the text after it
+        if end >= position + removed:
+            end += added - removed
+        else:
+            end = min(end, position)
+        self._edited = [min(start, position), max(end, position + added)]
+
+    def _continue_sweep(self):
+        if self._sweep is None:
+            return
+        document = self.document()
+        first = document.findBlock(self._sweep.position()).blockNumber()
+        # Each slice lays the whole document out again, so bound their number
+        last = first + max(SWEEP_ROWS, document.blockCount() // SWEEP_SLICES) - 1
+        self._highlight([(first, last)])
+        block = document.findBlockByNumber(last + 1)
+        if not block.isValid():
+            self._sweep = None
+            return
+        self._sweep.setPosition(block.position())
+        self._sweep_timer.start()
+
+    def _highlight(self, rows: Iterable[Tuple[int, int]]):
+        """Set the formats of the blocks on (first, last) rows."""
+        merged: List[List[int]] = []
+        for first, last in sorted(rows):
+            if merged and first <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], last)
+            else:
+                merged.append([first, last])
+        changed = [self._highlight_rows(first, last) for first, last in merged]
+        changed = [positions for positions in changed if positions is not None]
+        if changed:
+            # Lay the blocks out again, as QSyntaxHighlighter does after it
+            # sets the formats of a block. Qt lays out the whole document on
+            # each call, so make a single one.
+            start = min(start for start, _ in changed)
+            end = max(end for _, end in changed)
+            self.document().markContentsDirty(start, end - start)
+
+    def _highlight_rows(self, first: int, last: int) -> Optional[Tuple[int, int]]:
+        """Set the formats of the blocks on rows first to last.
+
+        Return the positions [start, end) of the blocks whose formats
+        changed, or None if none did.
+        """
+        document = self.document()
+        block = document.findBlockByNumber(max(first, 0))
+        if not block.isValid():
+            return None
+        first = block.blockNumber()
+        last = min(last, document.blockCount() - 1)
+        spans = {} if self._tree is None else self._spans(first, last)
+        changed = None
+        for row in range(first, last + 1):
+            if block.revision() <= self._revision and self._set_formats(
+                block, spans.get(row, ())
+            ):
+                end = block.position() + block.length()
+                changed = (block.position() if changed is None else changed[0], end)
+            block = block.next()
+        return changed
+
+    def _set_formats(self, block: QTextBlock, spans: Iterable[Span]) -> bool:
+        """Set the formats of a block from its spans, return if they changed."""
+        text = block.text()
+        columns = None if text.isascii() else utf16_columns(text)
+        line_end = len(text) if columns is None else len(columns) - 1
+        ranges = []
+        for start, end, kind in spans:
+            start = min(start, line_end)
+            end = line_end if end is None else min(end, line_end)
+            if columns is not None:
+                start, end = columns[start], columns[end]
+            if end > start:
+                format_range = QTextLayout.FormatRange()
+                format_range.start = start
+                format_range.length = end - start
+                format_range.format = self._formats[kind]
+                ranges.append(format_range)
+        layout = block.layout()
+        if ranges == layout.formats():
+            return False
+        layout.setFormats(ranges)
+        return True
+
+    def _kind(self, node: Node) -> Optional[str]:
+        key = (node.type, node.is_named, node.child_count == 0)
+        if key not in self._kinds:
+            self._kinds[key] = token_kind(*key)
+        return self._kinds[key]
+
+    def _spans(self, first: int, last: int) -> Dict[int, List[Span]]:
+        """Return the spans of the coloured nodes on rows first to last.
+
+        The tree is walked once for all the rows, so that the cost is in
+        the number of rows rather than in the size of the document.
+        """
+        spans: Dict[int, List[Span]] = {}
+        cursor = self._tree.walk()
+        point = (first, 0)
+        while True:
+            node = cursor.node
+            start, end = node.start_point, node.end_point
+            if start[0] > last:
+                # The next siblings start even later
+                if not cursor.goto_parent():
+                    return spans
+            elif end[0] >= first:
+                kind = self._kind(node)
+                if kind is not None:
+                    for row in range(max(start[0], first), min(end[0], last) + 1):
+                        spans.setdefault(row, []).append(
+                            (
+                                start[1] if row == start[0] else 0,
+                                end[1] if row == end[0] else None,
+                                kind,
+                            )
+                        )
+                elif cursor.goto_first_child_for_point(point) is not None:
+                    # Skipped the children ending before the first row
+                    continue
+            while not cursor.goto_next_sibling():
+                if not cursor.goto_parent():
+                    return spans